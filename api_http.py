@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import math
+import os
+from datetime import datetime
+
+from aiohttp import web
+
+from etat_partage import ConflitVersion, MagasinEtat, TransitionRefusee
+from historique import DB_FILE, HistoriqueSessions
+from horloge import maintenant
+from instrumentation import INSTRUMENTS
+from moteur_timer import INTERVALLE_DEFAUT, LIBELLES_STATUT, depuis_epoch, vers_epoch
+from tarifs import TARIFS_FILE, GrilleTarifaire
+
+# --- API HTTP Asynchrone ---
+# Pilote les timers sans passer par la page Streamlit (monnayeurs, terminaux d'accueil...).
+# Elle travaille sur les mêmes fichiers que l'interface (console_data.json + journal) via le
+# magasin d'état partagé : les deux processus voient les actions de l'autre.
+# Les écritures reçues en même temps sont regroupées en une seule transaction journalisée.
+
+DATA_FILE = "console_data.bin" if os.environ.get("SUIVTEMP_SNAPSHOT") == "binaire" else "console_data.json"
+
+ACTIONS = ["demarrer", "pause", "reprendre", "arreter"]
+# Opérations acceptées par /lots (une transaction pour toutes les consoles visées)
+ACTIONS_LOT = ACTIONS + ["intervalle", "groupe", "remettre_a_zero"]
+
+
+class LotEcritures:
+    # File d'attente des actions : une tâche unique les vide par lots et les applique
+    # dans un thread (verrou fichier + fsync), un seul fsync par lot quel que soit le trafic.
+    def __init__(self, magasin):
+        self.magasin = magasin
+        self.file = asyncio.Queue()
+        self.tache = None
+
+    def demarrer(self):
+        self.tache = asyncio.create_task(self._boucle())
+
+    async def arreter(self):
+        if self.tache:
+            self.tache.cancel()
+
+    async def soumettre(self, evt, versions_attendues=None):
+        futur = asyncio.get_running_loop().create_future()
+        await self.file.put((evt, versions_attendues, futur))
+        return await futur
+
+    async def _boucle(self):
+        while True:
+            lot = [await self.file.get()]
+            # Tout ce qui est arrivé pendant l'écriture précédente part dans la même transaction
+            while not self.file.empty():
+                lot.append(self.file.get_nowait())
+            demandes = [(evt, versions) for evt, versions, _ in lot]
+            try:
+                resultats = await asyncio.to_thread(self.magasin.appliquer_groupe, demandes)
+            except Exception as e:
+                resultats = [e] * len(lot)
+            for (_, _, futur), resultat in zip(lot, resultats):
+                if futur.done():
+                    continue
+                if isinstance(resultat, Exception):
+                    futur.set_exception(resultat)
+                else:
+                    futur.set_result(resultat)
+
+
+# --- Sérialisation ---
+def _epoch_ou_none(t):
+    return None if math.isnan(t) else depuis_epoch(t).isoformat()
+
+
+def etat_json(versions, grille, moteur, calcul, i):
+    nom = moteur.noms[i]
+    resume = moteur.resumes[i]
+    return {
+        "nom": nom,
+        "statut": LIBELLES_STATUT[int(moteur.statut[i])],
+        "debut_session": _epoch_ou_none(moteur.debut_initial[i]),
+        "session_min": round(float(calcul.session[i]), 3),
+        "cumul_min": round(float(calcul.total[i]), 3),
+        "intervalles": int(calcul.intervalles[i]),
+        "intervalle_min": int(moteur.intervalle[i]),
+        "groupe": moteur.groupes[i],
+        "montant": float(grille.montants_live(moteur, calcul)[i]),
+        "dernier_resume": None if resume is None else {
+            "debut": depuis_epoch(resume["start"]).isoformat(),
+            "fin": depuis_epoch(resume["end"]).isoformat(),
+            "duree_min": resume["duration"],
+            "montant": grille.montant_resume(moteur, nom),
+        },
+        "version": versions.get(nom, 0),
+    }
+
+
+def _lire_instant(valeur):
+    # Accepte un epoch (nombre) ou une date ISO (heure locale si sans fuseau)
+    if isinstance(valeur, (int, float)):
+        return float(valeur)
+    return vers_epoch(datetime.fromisoformat(valeur))
+
+
+def _entier(corps, champ, defaut):
+    # Champ numérique du corps JSON : une valeur non entière est une erreur du client, pas du serveur
+    try:
+        return int(corps.get(champ, defaut))
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(text=f"Le champ '{champ}' doit être un entier.")
+
+
+# --- Gestionnaires ---
+async def _corps(requete):
+    if not requete.can_read_body:
+        return {}
+    try:
+        return await requete.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Corps JSON invalide.")
+
+
+async def _executer(requete, evt, corps):
+    magasin = requete.app["magasin"]
+    versions = None
+    if "version" in corps and evt.get("console") is not None:
+        versions = {evt["console"]: _entier(corps, "version", 0)}
+    try:
+        resultat = await requete.app["lot"].soumettre(evt, versions)
+    except (ConflitVersion, TransitionRefusee) as e:
+        raise web.HTTPConflict(text=str(e))
+    except KeyError:
+        if evt["op"] == "ajouter":
+            raise web.HTTPConflict(text=f"La console '{evt['console']}' existe déjà.")
+        raise web.HTTPNotFound(text=f"Console inconnue : {evt.get('console')}")
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    reponse = {"ok": True}
+    if isinstance(resultat, dict) and "duration" in resultat:
+        reponse["resume"] = {
+            "debut": depuis_epoch(resultat["start"]).isoformat(),
+            "fin": depuis_epoch(resultat["end"]).isoformat(),
+            "duree_min": resultat["duration"],
+            "intervalles": resultat["intervalles"],
+        }
+    moteur, versions, calcul = magasin.calculer(maintenant())
+    if evt.get("console") in moteur.index:
+        reponse["console"] = etat_json(versions, requete.app["grille"], moteur, calcul, moteur.index[evt["console"]])
+        if "resume" in reponse:
+            reponse["resume"]["montant"] = reponse["console"]["dernier_resume"]["montant"]
+    return web.json_response(reponse)
+
+
+async def lister(requete):
+    magasin = requete.app["magasin"]
+    moteur, versions, calcul = magasin.calculer(maintenant())
+    return web.json_response({
+        "version": magasin.version,
+        "consoles": [etat_json(versions, requete.app["grille"], moteur, calcul, i) for i in range(len(moteur))],
+    })
+
+
+async def lire(requete):
+    magasin = requete.app["magasin"]
+    moteur, versions, calcul = magasin.calculer(maintenant())
+    nom = requete.match_info["nom"]
+    if nom not in moteur.index:
+        raise web.HTTPNotFound(text=f"Console inconnue : {nom}")
+    return web.json_response(etat_json(versions, requete.app["grille"], moteur, calcul, moteur.index[nom]))
+
+
+async def ajouter(requete):
+    corps = await _corps(requete)
+    nom = str(corps.get("nom", "")).strip()
+    if not nom:
+        raise web.HTTPBadRequest(text="Le champ 'nom' est obligatoire.")
+    evt = {
+        "op": "ajouter", "console": nom, "t": maintenant(),
+        "intervalle": _entier(corps, "intervalle", INTERVALLE_DEFAUT), "groupe": corps.get("groupe") or None,
+    }
+    return await _executer(requete, evt, {})
+
+
+async def supprimer(requete):
+    evt = {"op": "supprimer", "console": requete.match_info["nom"], "t": maintenant()}
+    return await _executer(requete, evt, await _corps(requete))
+
+
+async def action(requete):
+    op = requete.match_info["action"]
+    if op not in ACTIONS:
+        raise web.HTTPNotFound(text=f"Action inconnue : {op}")
+    evt = {"op": op, "console": requete.match_info["nom"], "t": maintenant()}
+    return await _executer(requete, evt, await _corps(requete))
+
+
+async def ajuster(requete):
+    corps = await _corps(requete)
+    instant = maintenant()
+    try:
+        debut_reel = _lire_instant(corps["debut"])
+    except (KeyError, TypeError, ValueError):
+        raise web.HTTPBadRequest(text="Le champ 'debut' (ISO ou epoch) est obligatoire.")
+    if debut_reel >= instant:
+        raise web.HTTPBadRequest(text="L'heure de début manuelle doit être dans le passé.")
+    evt = {
+        "op": "ajuster", "console": requete.match_info["nom"], "t": instant,
+        "debut_reel": debut_reel, "intervalles": _entier(corps, "intervalles", 0),
+    }
+    return await _executer(requete, evt, corps)
+
+
+async def definir_intervalle(requete):
+    corps = await _corps(requete)
+    intervalle = _entier(corps, "intervalle", 0)
+    if intervalle < 1:
+        raise web.HTTPBadRequest(text="L'intervalle doit être d'au moins 1 minute.")
+    evt = {"op": "intervalle", "console": requete.match_info["nom"], "t": maintenant(), "intervalle": intervalle}
+    return await _executer(requete, evt, corps)
+
+
+async def metriques(requete):
+    # Compteurs au format texte Prometheus (vides si SUIVTEMP_INSTRUMENTATION n'est pas activé)
+    return web.Response(text=INSTRUMENTS.exporter_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+@web.middleware
+async def chronometrer_requetes(requete, handler):
+    # Une phase par route ("api GET /consoles/{nom}"), pas par URL : cardinalité bornée
+    ressource = requete.match_info.route.resource
+    nom = f"api {requete.method} {ressource.canonical if ressource else 'inconnue'}"
+    with INSTRUMENTS.phase(nom):
+        return await handler(requete)
+
+
+async def definir_groupe(requete):
+    corps = await _corps(requete)
+    evt = {"op": "groupe", "console": requete.match_info["nom"], "t": maintenant(), "groupe": corps.get("groupe") or None}
+    return await _executer(requete, evt, corps)
+
+
+async def lot(requete):
+    # {"action": "arreter", "consoles": [...]} ou {"groupe": "Salle A"} ou {"toutes": true},
+    # plus "intervalle" / "nouveau_groupe" selon l'action : une seule transaction journalisée
+    corps = await _corps(requete)
+    op = corps.get("action")
+    if op not in ACTIONS_LOT:
+        raise web.HTTPBadRequest(text=f"Action inconnue : {op} (attendu : {', '.join(ACTIONS_LOT)})")
+    magasin = requete.app["magasin"]
+    vue, _ = magasin.vue()
+    if corps.get("toutes"):
+        consoles = list(vue.noms)
+    elif "groupe" in corps:
+        consoles = vue.consoles_du_groupe(corps["groupe"])
+    elif isinstance(corps.get("consoles"), list):
+        consoles = [str(c) for c in corps["consoles"]]
+    else:
+        raise web.HTTPBadRequest(text="Préciser 'consoles' (liste), 'groupe' ou 'toutes'.")
+    params = {}
+    if op == "intervalle":
+        params["intervalle"] = _entier(corps, "intervalle", 0)
+        if params["intervalle"] < 1:
+            raise web.HTTPBadRequest(text="L'intervalle doit être d'au moins 1 minute.")
+    elif op == "groupe":
+        params["groupe"] = corps.get("nouveau_groupe") or None
+    modifiees = await asyncio.to_thread(magasin.appliquer_lot, op, consoles, maintenant(), **params)
+    return web.json_response({"ok": True, "modifiees": sorted(modifiees), "ignorees": sorted(set(consoles) - set(modifiees))})
+
+
+# --- Application ---
+def creer_application(chemin_donnees=DATA_FILE, chemin_historique=DB_FILE, chemin_tarifs=TARIFS_FILE):
+    app = web.Application(middlewares=[chronometrer_requetes] if INSTRUMENTS.actif else [])
+    magasin = MagasinEtat(chemin_donnees)
+    historique = HistoriqueSessions(chemin_historique, segments=os.environ.get("SUIVTEMP_SEGMENTS") == "1")
+    magasin.abonner(historique.ecouter)
+    app["magasin"] = magasin
+    app["historique"] = historique
+    app["grille"] = GrilleTarifaire.charger(chemin_tarifs)
+
+    async def au_demarrage(app):
+        app["lot"] = LotEcritures(magasin)
+        app["lot"].demarrer()
+
+    async def a_l_arret(app):
+        await app["lot"].arreter()
+        historique.fermer()
+
+    app.on_startup.append(au_demarrage)
+    app.on_cleanup.append(a_l_arret)
+    app.router.add_get("/metrics", metriques)
+    app.router.add_get("/consoles", lister)
+    app.router.add_post("/consoles", ajouter)
+    app.router.add_get("/consoles/{nom}", lire)
+    app.router.add_delete("/consoles/{nom}", supprimer)
+    app.router.add_post("/consoles/{nom}/ajuster", ajuster)
+    app.router.add_put("/consoles/{nom}/intervalle", definir_intervalle)
+    app.router.add_put("/consoles/{nom}/groupe", definir_groupe)
+    app.router.add_post("/lots", lot)
+    app.router.add_post("/consoles/{nom}/{action}", action)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API HTTP de pilotage des timers de consoles")
+    parser.add_argument("--hote", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--donnees", default=DATA_FILE, help="Snapshot partagé avec l'interface Streamlit (.json ou .bin)")
+    parser.add_argument("--historique", default=DB_FILE)
+    parser.add_argument("--tarifs", default=TARIFS_FILE, help="Grille tarifaire (JSON) ; sans fichier, tout est gratuit")
+    args = parser.parse_args()
+    web.run_app(creer_application(args.donnees, args.historique, args.tarifs), host=args.hote, port=args.port)
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from etat_partage import MagasinEtat  # noqa: E402
+from moteur_timer import EN_COURS, EN_PAUSE, MoteurConsoles  # noqa: E402
+
+# --- Banc de Mesure de suivtemp1.py ---
+# Génère des états de N consoles (1/3 en cours, 1/6 en pause), puis mesure pour chaque taille :
+# rerun complet de la page (AppTest, sans navigateur), sauvegarde/chargement et taille des
+# fichiers, latence des actions Start/Pause/Stop et pic mémoire. Les résultats sont écrits en
+# JSON pour comparer deux versions : python benchmarks/bench_suivtemp.py --sortie avant.json
+
+SCRIPT = os.path.join(RACINE, "suivtemp1.py")
+TAILLES = [10, 100, 1000, 5000]
+
+
+def generer_etat(n, maintenant):
+    # Construit directement les colonnes du moteur (rapide même pour des milliers de consoles)
+    moteur = MoteurConsoles()
+    moteur.noms = [f"poste-{k:05d}" for k in range(n)]
+    moteur.index = {nom: k for k, nom in enumerate(moteur.noms)}
+    rang = np.arange(n)
+    en_cours = rang % 3 == 0
+    en_pause = (rang % 6 == 1)
+    moteur.cumul = np.zeros(n)
+    moteur.intervalle = np.full(n, 30, dtype=np.int64)
+    moteur.nb_intervalles = np.zeros(n, dtype=np.int64)
+    moteur.statut = np.where(en_cours, EN_COURS, np.where(en_pause, EN_PAUSE, 0)).astype(np.int8)
+    moteur.debut_initial = np.where(en_cours | en_pause, maintenant - (rang % 240) * 60.0, np.nan)
+    # Segment actif repris 30 s après le début, jamais dans le futur (l'horloge du serveur
+    # ne repart pas avant le dernier instant de l'état chargé)
+    moteur.debut = np.where(en_cours, np.minimum(moteur.debut_initial + 30.0, maintenant), np.nan)
+    moteur.pause_cumulee = np.where(en_pause, (rang % 50) * 1.0, 0.0)
+    moteur.resumes = [None] * n
+    moteur.groupes = [f"salle-{k % 8}" for k in range(n)]
+    return moteur
+
+
+def chronometrer(fonction, repetitions=1):
+    durees = []
+    resultat = None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append(time.perf_counter() - debut)
+    return statistics.median(durees), resultat
+
+
+def mesurer_persistance(dossier, n, maintenant, fichier="console_data.json"):
+    # Sauvegarde complète (compaction), chargement (snapshot + journal) et coût d'une action
+    # (fichier en .bin : snapshot binaire, la 2e sauvegarde et les suivantes sont faites sur place)
+    # Un dossier par format : les deux snapshots partageraient sinon le même journal
+    dossier_format = os.path.join(dossier, f"persistance_{os.path.splitext(fichier)[1][1:]}")
+    os.makedirs(dossier_format, exist_ok=True)
+    chemin = os.path.join(dossier_format, fichier)
+    magasin = MagasinEtat(chemin)
+    magasin.moteur = generer_etat(n, maintenant)
+    duree_sauvegarde, _ = chronometrer(magasin.compacter, repetitions=3)
+    taille_snapshot = os.path.getsize(chemin)
+
+    # Quelques actions journalisées puis rechargement complet
+    inactives = np.flatnonzero(magasin.moteur.statut == 0)[:50]
+    consoles = [magasin.moteur.noms[k] for k in inactives]
+    latences = {}
+    for op in ["demarrer", "pause", "arreter"]:
+        durees = []
+        for nom in consoles:
+            debut = time.perf_counter()
+            magasin.appliquer([{"op": op, "console": nom, "t": time.time()}])
+            durees.append(time.perf_counter() - debut)
+        latences[op] = statistics.median(durees)
+    taille_journal = os.path.getsize(magasin.journal.chemin_journal)
+
+    duree_chargement, _ = chronometrer(lambda: MagasinEtat(chemin), repetitions=3)
+    resultat = {
+        "save_state_s": duree_sauvegarde,
+        "snapshot_octets": taille_snapshot,
+        "load_state_s": duree_chargement,
+        "journal_octets_apres_actions": taille_journal,
+        "action_s": latences,
+    }
+    if chemin.endswith(".json"):
+        with open(chemin) as f:
+            data = json.load(f)
+        resultat["conversion_json_s"], _ = chronometrer(lambda: MoteurConsoles.depuis_etat(data), repetitions=3)
+    return resultat
+
+
+def mesurer_rerun(dossier, n, maintenant, mode, repetitions):
+    # Rerun complet de la page via AppTest dans un dossier contenant l'état généré
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    dossier_mode = os.path.join(dossier, mode.replace(" ", "_"))
+    os.makedirs(dossier_mode, exist_ok=True)
+    chemin = os.path.join(dossier_mode, "console_data.json")
+    with open(chemin, "w") as f:
+        json.dump(generer_etat(n, maintenant).vers_etat(), f)
+
+    precedent = os.getcwd()
+    os.chdir(dossier_mode)
+    st.cache_resource.clear()  # Le magasin partagé pointe sur le dossier de la taille précédente
+    try:
+        app = AppTest.from_file(SCRIPT, default_timeout=600)
+        app.session_state["mode_affichage"] = mode
+        debut = time.perf_counter()
+        app.run()
+        premier = time.perf_counter() - debut
+        if app.exception:
+            raise RuntimeError(f"Exception dans la page : {app.exception[0].message}")
+        duree, _ = chronometrer(app.run, repetitions=repetitions)
+
+        # Pic mémoire mesuré sur un rerun séparé (tracemalloc ralentit l'exécution)
+        tracemalloc.start()
+        app.run()
+        _, pic = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Un clic (Start puis Stop sur la même console) : action + rerun complet
+        clic = {}
+        for prefixe in ["start", "stop"]:
+            bouton = next((b for b in app.button if (b.key or "").startswith(f"{prefixe}_")), None)
+            if bouton is None:
+                continue
+            debut = time.perf_counter()
+            bouton.click()
+            app.run()
+            clic[prefixe] = time.perf_counter() - debut
+    finally:
+        os.chdir(precedent)
+    return {"premier_rerun_s": premier, "rerun_s": duree, "clic_s": clic, "pic_memoire_octets": pic}
+
+
+def version_git():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=RACINE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de mesure de suivtemp1.py")
+    parser.add_argument("--tailles", type=int, nargs="+", default=TAILLES)
+    parser.add_argument("--modes", nargs="+", default=["Tableau compact", "Panneaux détaillés"])
+    parser.add_argument("--max-panneaux", type=int, default=200,
+                        help="Au-delà, le mode panneaux (un panneau complet par console) n'est pas mesuré")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--sortie", default="bench_resultats.json")
+    args = parser.parse_args()
+
+    import streamlit
+    resultats = []
+    maintenant = time.time()
+    for n in args.tailles:
+        with tempfile.TemporaryDirectory() as dossier:
+            ligne = {
+                "consoles": n,
+                "persistance": mesurer_persistance(dossier, n, maintenant),
+                "persistance_binaire": mesurer_persistance(dossier, n, maintenant, "console_data.bin"),
+                "rerun": {},
+            }
+            for mode in args.modes:
+                if mode == "Panneaux détaillés" and n > args.max_panneaux:
+                    continue
+                ligne["rerun"][mode] = mesurer_rerun(dossier, n, maintenant, mode, args.repetitions)
+            resultats.append(ligne)
+        p, b = ligne["persistance"], ligne["persistance_binaire"]
+        reruns = ", ".join(f"{mode}: {r['rerun_s'] * 1000:.0f} ms" for mode, r in ligne["rerun"].items())
+        print(f"{n:>6} consoles | save {p['save_state_s'] * 1000:8.1f} ms ({p['snapshot_octets'] / 1024:.0f} Kio)"
+              f" | load {p['load_state_s'] * 1000:8.1f} ms (bin {b['load_state_s'] * 1000:.1f} ms) | start {p['action_s']['demarrer'] * 1000:.2f} ms"
+              f" | rerun {reruns}", flush=True)
+
+    sortie = {
+        "meta": {
+            "date": datetime.now().isoformat(),
+            "commit": version_git(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "streamlit": streamlit.__version__,
+            "machine": platform.machine(),
+        },
+        "resultats": resultats,
+    }
+    with open(args.sortie, "w") as f:
+        json.dump(sortie, f, indent=2)
+    print(f"Résultats écrits dans {args.sortie}")
+
+
+if __name__ == "__main__":
+    main()
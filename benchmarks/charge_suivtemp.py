@@ -0,0 +1,551 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+import psutil
+from aiohttp import ClientError, ClientSession, WSMsgType
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from bench_suivtemp import SCRIPT, generer_etat, version_git  # noqa: E402
+from horloge import identifiant_demarrage  # noqa: E402
+from journal_etat import JournalEtat  # noqa: E402
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from streamlit.proto.WidgetStates_pb2 import WidgetState  # noqa: E402
+
+# --- Test de Charge de suivtemp1.py ---
+# Lance `streamlit run suivtemp1.py` sur un état généré, puis N sessions simulées qui parlent
+# directement le protocole websocket de Streamlit (comme les tablettes et l'accueil) :
+#   - chargement de la page, puis rafraîchissement comme le navigateur (fragments aux intervalles
+#     annoncés par le serveur ; page entière toutes les 15 s en mode "autorefresh") ;
+#   - clics aléatoires Démarrer / Pause / Reprendre / Stop sur les boutons affichés.
+# Pour chaque palier de sessions : CPU et mémoire du serveur (psutil, mémoire par session),
+# latence des reruns (p50/p90/p99) et cohérence des écritures : chaque clic accepté doit ajouter
+# exactement une transaction au journal, les conflits (compare-and-swap) sont comptés à part.
+#   python benchmarks/charge_suivtemp.py --sessions 1 5 10 20 --consoles 50 --duree 120
+
+ACTIONS = {"start": "demarrer", "pause": "pause", "resume": "reprendre", "stop": "arreter"}
+# Bouton affiché pour la console une fois l'action appliquée (l'opérateur voit l'action réussie)
+BOUTON_APRES = {"demarrer": "pause", "pause": "resume", "reprendre": "pause", "arreter": "start"}
+MESSAGE_CONFLIT = "modifiée entre-temps"
+DELAI_RERUN = 120  # s : au-delà, le rerun est compté comme perdu (serveur saturé)
+
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def centiles(durees):
+    if not durees:
+        return None
+    p50, p90, p99 = np.percentile(durees, [50, 90, 99])
+    return {"n": len(durees), "p50_s": float(p50), "p90_s": float(p90), "p99_s": float(p99), "max_s": max(durees)}
+
+
+# --- Serveur Streamlit ---
+def demarrer_serveur(dossier, port, live):
+    env = {**os.environ, "SUIVTEMP_LIVE": live}
+    journal = open(os.path.join(dossier, "streamlit.log"), "w")
+    processus = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", SCRIPT, "--server.headless=true", f"--server.port={port}",
+         "--server.address=127.0.0.1", "--server.fileWatcherType=none", "--browser.gatherUsageStats=false"],
+        cwd=dossier, env=env, stdout=journal, stderr=subprocess.STDOUT,
+    )
+    limite = time.time() + 60
+    while time.time() < limite:
+        if processus.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté au démarrage (voir {journal.name})")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return processus
+        except OSError:
+            time.sleep(0.2)
+    processus.terminate()
+    raise RuntimeError("Le serveur Streamlit n'a pas répondu en 60 s")
+
+
+def arreter_serveur(processus):
+    # SIGTERM : Streamlit s'arrête proprement et le magasin vide ses écritures en attente (atexit)
+    processus.terminate()
+    try:
+        processus.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        processus.kill()
+        processus.wait()
+
+
+class Sonde:
+    # Échantillonne CPU (% d'un cœur) et mémoire résidente du serveur et de ses sous-processus
+    def __init__(self, pid, pas=0.5):
+        self.processus = psutil.Process(pid)
+        self.pas = pas
+        self.mesures = []  # (instant, cpu %, rss octets)
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, daemon=True)
+
+    def _tous(self):
+        try:
+            return [self.processus, *self.processus.children(recursive=True)]
+        except psutil.NoSuchProcess:
+            return []
+
+    def _boucle(self):
+        for p in self._tous():
+            p.cpu_percent(None)
+        while not self._arret.wait(self.pas):
+            cpu = rss = 0.0
+            for p in self._tous():
+                try:
+                    cpu += p.cpu_percent(None)
+                    rss += p.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            self.mesures.append((time.time(), cpu, rss))
+
+    def demarrer(self):
+        self._thread.start()
+
+    def arreter(self):
+        self._arret.set()
+        self._thread.join()
+
+    def resume(self, depuis, jusqu_a):
+        mesures = [m for m in self.mesures if depuis <= m[0] <= jusqu_a]
+        if not mesures:
+            return None
+        cpu = [m[1] for m in mesures]
+        rss = [m[2] for m in mesures]
+        return {"cpu_moyen_pct": statistics.mean(cpu), "cpu_max_pct": max(cpu),
+                "rss_moyen_octets": statistics.mean(rss), "rss_max_octets": max(rss)}
+
+
+# --- Journal des Transactions ---
+class CollecteurJournal:
+    # Garde un lien physique vers chaque fichier journal successif : la compaction remplace le
+    # journal (os.replace) mais l'ancien fichier, et toutes ses lignes, restent lisibles par ce lien
+    def __init__(self, chemin_journal, pas=0.1):
+        self.chemin = chemin_journal
+        self.pas = pas
+        self.liens = []
+        self._identite = None
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, daemon=True)
+
+    def _suivre(self):
+        lien = f"{self.chemin}.charge-{len(self.liens)}"
+        try:
+            os.link(self.chemin, lien)
+        except FileNotFoundError:
+            return  # Pas encore de journal (aucune transaction)
+        etat = os.stat(lien)
+        if (etat.st_dev, etat.st_ino) == self._identite:
+            os.remove(lien)
+            return
+        self._identite = (etat.st_dev, etat.st_ino)
+        self.liens.append(lien)
+
+    def _boucle(self):
+        while not self._arret.wait(self.pas):
+            self._suivre()
+
+    def demarrer(self):
+        self._thread.start()
+
+    def arreter(self):
+        self._arret.set()
+        self._thread.join()
+        self._suivre()
+
+    def transactions(self):
+        # Seq -> événements, toutes compactions confondues
+        par_seq = {}
+        for lien in self.liens:
+            with open(lien) as f:
+                for ligne in f:
+                    if ligne.strip():
+                        transaction = json.loads(ligne)
+                        par_seq[transaction["seq"]] = transaction["evts"]
+        return par_seq
+
+
+def decalage_serveur(chemin_ancre):
+    # Avance (s) de la ligne de temps du serveur sur l'heure murale du test, d'après son ancre
+    # (voir horloge.py) : les instants journalisés en sont décalés. 0 si l'ancre est illisible.
+    try:
+        with open(chemin_ancre) as f:
+            ancre = json.load(f)
+    except (OSError, ValueError):
+        return 0.0
+    if ancre.get("demarrage") != identifiant_demarrage():
+        return 0.0
+    return ancre["murale"] + (time.monotonic() - ancre["monotone"]) - time.time()
+
+
+def classer_clics(clics, transactions, marge=0.5, decalage=0.0):
+    # Rattache chaque événement journalisé au clic (même console, même action) dont la fenêtre
+    # d'envoi l'encadre, puis classe les clics restants : conflit signalé, bouton déjà périmé au
+    # rerun (clic sans effet : la console a changé depuis la vue), ou succès affiché sans aucune
+    # trace dans le journal (mise à jour perdue).
+    # `decalage` : avance de l'horloge du serveur, retirée des instants journalisés.
+    en_attente = sorted(clics, key=lambda c: c["envoi"])
+    inexpliquees = 0
+    instants = {}  # Console -> instants des événements journalisés (heure du test)
+    for seq in sorted(transactions):
+        for evt in transactions[seq]:
+            t = evt["t"] - decalage
+            instants.setdefault(evt.get("console"), []).append(t)
+            clic = next((c for c in en_attente if c["console"] == evt.get("console") and c["op"] == evt["op"]
+                         and c["envoi"] - marge <= t <= c["fin"] + marge), None)
+            if clic is None:
+                inexpliquees += 1
+            else:
+                clic["journalise"] = True
+                en_attente.remove(clic)
+    bilan = {"journalises": 0, "conflits": 0, "perdus": 0, "sans_effet": 0}
+    for clic in clics:
+        if clic.get("journalise"):
+            bilan["journalises"] += 1
+        elif clic["conflit"]:
+            bilan["conflits"] += 1
+        elif clic["affiche"] and not any(clic["vue"] - marge <= t <= clic["fin"] + marge
+                                         for t in instants.get(clic["console"], [])):
+            bilan["perdus"] += 1
+        else:
+            bilan["sans_effet"] += 1
+    return bilan, inexpliquees
+
+
+# --- Session Simulée ---
+class SessionSimulee:
+    def __init__(self, numero, url, live, rafraichissement, clics_par_minute, mode, pilotees, graine):
+        self.numero = numero
+        self.url = url
+        self.live = live
+        self.rafraichissement = rafraichissement
+        self.clics_par_minute = clics_par_minute
+        self.mode = mode
+        self.pilotees = pilotees
+        self.hasard = random.Random(graine)
+        self.latences = {"chargement": [], "page": [], "fragment": [], "clic": []}
+        self.clics = []  # Un dict par clic : console, op, fenêtre d'envoi, conflit signalé, succès affiché
+        self.conflits = 0
+        self.erreurs = []
+        self.boutons = {}  # Clé du bouton (start_console...) -> id du widget, d'après le dernier rendu complet
+        # Envoi du rerun qui a produit le dernier rendu complet : l'état affiché est au moins aussi
+        # récent (l'arrivée des messages, elle, peut être retardée quand le serveur est saturé)
+        self.instant_rendu = 0.0
+        self.widgets_tenus = {}  # Id -> WidgetState renvoyé à chaque rerun (mode d'affichage, consoles pilotées)
+        self.fragments = {}  # Id de fragment -> intervalle de rafraîchissement annoncé (s)
+        self._cache = {}  # Hash -> ForwardMsg, pour les références envoyées par le serveur
+        self._rendu = {}
+        self._envoi = 0.0
+        self._widgets = {}
+        self._fin_rerun = None
+
+    # --- Réception ---
+    def _traiter(self, msg):
+        if msg.WhichOneof("type") == "ref_hash":
+            reference = msg.ref_hash
+            msg = self._cache.get(reference)
+            if msg is None:
+                self.erreurs.append(f"référence inconnue {reference}")
+                return
+        elif msg.metadata.cacheable:
+            self._cache[msg.hash] = msg
+        genre = msg.WhichOneof("type")
+        if genre == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            self._element(msg.delta.new_element)
+        elif genre == "new_session" and not msg.new_session.fragment_ids_this_run:
+            # Début d'un rerun complet : comme le navigateur, on oublie les fragments et les boutons
+            # du rendu précédent, ceux encore affichés sont renvoyés pendant ce rerun
+            self.fragments = {}
+            self._rendu = {}
+        elif genre == "auto_rerun":
+            self.fragments[msg.auto_rerun.fragment_id] = msg.auto_rerun.interval
+        elif genre == "script_finished" and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+            # FINISHED_EARLY_FOR_RERUN : st.rerun() après un clic, le rerun continue
+            if msg.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                self.boutons = self._rendu
+                self.instant_rendu = self._envoi
+            if self._fin_rerun is not None and not self._fin_rerun.done():
+                self._fin_rerun.set_result(msg.script_finished)
+
+    def _element(self, element):
+        genre = element.WhichOneof("type")
+        if genre == "alert" and MESSAGE_CONFLIT in element.alert.body:
+            self.conflits += 1
+        elif genre == "button" and not element.button.disabled:
+            cle = element.button.id.split("-", 2)[-1]  # Id : $$ID-<hash>-<clé>
+            if cle.split("_", 1)[0] in ACTIONS:
+                self._rendu[cle] = element.button.id
+        elif genre in ("radio", "multiselect"):
+            widget = getattr(element, genre)
+            self._widgets[widget.id.split("-", 2)[-1]] = (widget.id, list(widget.options))
+
+    async def _lire(self, ws):
+        async for message in ws:
+            if message.type != WSMsgType.BINARY:
+                break
+            msg = ForwardMsg()
+            msg.ParseFromString(message.data)
+            self._traiter(msg)
+        if self._fin_rerun is not None and not self._fin_rerun.done():
+            self._fin_rerun.set_exception(ConnectionError("websocket fermé par le serveur"))
+
+    # --- Envoi ---
+    async def _rerun(self, ws, genre, fragment_id="", declencheur=None):
+        # Un rerun à la fois par session, comme un onglet : envoi puis attente de script_finished
+        back = BackMsg()
+        etat = back.rerun_script
+        etat.query_string = ""
+        etat.page_script_hash = ""
+        etat.fragment_id = fragment_id
+        etat.is_auto_rerun = bool(fragment_id)
+        etat.cached_message_hashes.extend(self._cache)
+        etat.widget_states.widgets.extend(self.widgets_tenus.values())
+        if declencheur is not None:
+            etat.widget_states.widgets.append(WidgetState(id=declencheur, trigger_value=True))
+        self._fin_rerun = asyncio.get_running_loop().create_future()
+        self._envoi = time.time()
+        debut = time.perf_counter()
+        await ws.send_bytes(back.SerializeToString())
+        try:
+            await asyncio.wait_for(self._fin_rerun, DELAI_RERUN)
+        except asyncio.TimeoutError:
+            self.erreurs.append(f"{genre} : pas de fin de rerun en {DELAI_RERUN} s")
+            return False
+        self.latences[genre].append(time.perf_counter() - debut)
+        return True
+
+    def _tenir_widgets(self):
+        # Fixe le mode d'affichage et, en tableau compact, quelques consoles pilotées (avec boutons)
+        modifie = False
+        if "mode_affichage" in self._widgets:
+            id_widget, options = self._widgets["mode_affichage"]
+            valeur = options[0] if self.mode == "panneaux" else options[1]
+            self.widgets_tenus[id_widget] = WidgetState(id=id_widget, string_value=valeur)
+            modifie = True
+        if self.mode == "compact" and "consoles_pilotees" in self._widgets:
+            id_widget, options = self._widgets["consoles_pilotees"]
+            choix = self.hasard.sample(options, min(self.pilotees, len(options)))
+            etat = WidgetState(id=id_widget)
+            etat.string_array_value.data.extend(choix)
+            self.widgets_tenus[id_widget] = etat
+            modifie = True
+        return modifie
+
+    async def executer(self, session_http, fin):
+        try:
+            async with session_http.ws_connect(self.url, protocols=("streamlit",), max_msg_size=0) as ws:
+                lecteur = asyncio.create_task(self._lire(ws))
+                try:
+                    await self._rerun(ws, "chargement")
+                    if self._tenir_widgets():
+                        await self._rerun(ws, "page")
+                        if self.mode == "compact" and self._tenir_widgets():  # Le multiselect n'apparaît qu'en mode compact
+                            await self._rerun(ws, "page")
+                    await self._boucle(ws, fin)
+                finally:
+                    lecteur.cancel()
+        except (ClientError, ConnectionError, OSError) as e:
+            self.erreurs.append(f"connexion : {e}")
+
+    async def _boucle(self, ws, fin):
+        maintenant = time.time()
+        prochain_clic = maintenant + self.hasard.expovariate(self.clics_par_minute / 60) if self.clics_par_minute else None
+        prochaine_page = maintenant + self.rafraichissement if self.live == "autorefresh" else None
+        prochains_fragments = {}
+        while True:
+            maintenant = time.time()
+            prochains_fragments = {f: t for f, t in prochains_fragments.items() if f in self.fragments}
+            for fragment_id, intervalle in self.fragments.items():
+                prochains_fragments.setdefault(fragment_id, maintenant + intervalle)
+            echeances = [(t, "fragment", f) for f, t in prochains_fragments.items()]
+            if prochain_clic is not None:
+                echeances.append((prochain_clic, "clic", None))
+            if prochaine_page is not None:
+                echeances.append((prochaine_page, "page", None))
+            if not echeances:
+                echeances.append((fin, "fin", None))
+            instant, genre, fragment_id = min(echeances, key=lambda e: e[0])
+            if instant >= fin:
+                return
+            await asyncio.sleep(max(0.0, instant - time.time()))
+            if genre == "fragment":
+                prochains_fragments[fragment_id] = time.time() + self.fragments[fragment_id]
+                await self._rerun(ws, "fragment", fragment_id=fragment_id)
+            elif genre == "page":
+                prochaine_page = time.time() + self.rafraichissement
+                await self._rerun(ws, "page")
+            else:
+                prochain_clic = time.time() + self.hasard.expovariate(self.clics_par_minute / 60)
+                if self.boutons:
+                    await self._cliquer(ws, self.hasard.choice(sorted(self.boutons)))
+
+    async def _cliquer(self, ws, cle):
+        prefixe, console = cle.split("_", 1)
+        clic = {"console": console, "op": ACTIONS[prefixe], "vue": self.instant_rendu, "envoi": time.time()}
+        conflits = self.conflits
+        termine = await self._rerun(ws, "clic", declencheur=self.boutons[cle])
+        clic["fin"] = time.time()
+        clic["conflit"] = self.conflits > conflits
+        clic["affiche"] = termine and f"{BOUTON_APRES[clic['op']]}_{console}" in self.boutons
+        self.clics.append(clic)
+
+
+async def lancer_sessions(port, args, live, nb_sessions, fin):
+    url = f"http://127.0.0.1:{port}/_stcore/stream"
+    sessions = [
+        SessionSimulee(k, url, live, args.rafraichissement, args.clics_par_minute, args.mode, args.pilotees, args.graine + k)
+        for k in range(nb_sessions)
+    ]
+    async with ClientSession() as session_http:
+        # Arrivées étalées sur une seconde, comme des écrans allumés à la suite
+        async def demarrer(session):
+            await asyncio.sleep(session.numero / max(1, nb_sessions))
+            await session.executer(session_http, fin)
+        await asyncio.gather(*(demarrer(s) for s in sessions))
+    return sessions
+
+
+# --- Palier de Charge ---
+def mesurer_palier(args, live, nb_sessions):
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin = os.path.join(dossier, "console_data.json")
+        with open(chemin, "w") as f:
+            json.dump(generer_etat(args.consoles, time.time()).vers_etat(), f)
+        port = port_libre()
+        serveur = demarrer_serveur(dossier, port, live)
+        sonde = Sonde(serveur.pid)
+        sonde.demarrer()
+        collecteur = CollecteurJournal(os.path.join(dossier, "console_data.journal"))
+        collecteur.demarrer()
+        try:
+            # Une première session charge le script (imports, magasin, planificateur) : la mémoire
+            # mesurée ensuite au repos ne compte plus que le coût fixe, hors sessions
+            asyncio.run(lancer_sessions(port, args, live, 1, time.time()))
+            time.sleep(3)
+            repos_depuis = time.time() - 2
+            debut = time.time()
+            sessions = asyncio.run(lancer_sessions(port, args, live, nb_sessions, debut + args.duree))
+            fin = time.time()
+            time.sleep(2)  # Écritures différées vidées par le thread d'écriture
+            decalage = decalage_serveur(f"{chemin}.horloge")
+        finally:
+            sonde.arreter()
+            arreter_serveur(serveur)
+            collecteur.arreter()
+
+        repos = sonde.resume(repos_depuis, debut)
+        charge = sonde.resume(debut + min(10.0, args.duree / 4), fin)  # Sans la montée en charge
+        journal = JournalEtat(chemin)
+        journal.charger()  # État initial généré sans journal : seq final = nombre de transactions
+        transactions = collecteur.transactions()
+
+    clics = [c for s in sessions for c in s.clics]
+    bilan, inexpliquees = classer_clics(clics, transactions, decalage=decalage)
+    latences = {genre: centiles([d for s in sessions for d in s.latences[genre]])
+                for genre in ["chargement", "page", "fragment", "clic"]}
+    memoire_par_session = None
+    if repos and charge and nb_sessions:
+        memoire_par_session = (charge["rss_moyen_octets"] - repos["rss_moyen_octets"]) / nb_sessions
+    return {
+        "live": live,
+        "sessions": nb_sessions,
+        "consoles": args.consoles,
+        "duree_s": fin - debut,
+        "serveur_repos": repos,
+        "serveur_charge": charge,
+        "memoire_par_session_octets": memoire_par_session,
+        "latences": latences,
+        "clics": {op: sum(1 for c in clics if c["op"] == op) for op in ACTIONS.values()},
+        "bilan_clics": bilan,
+        "transactions_journal": journal.seq,
+        # Transactions comptées par le seq mais absentes des fichiers journal relus
+        "transactions_manquantes": journal.seq - len(transactions),
+        "transactions_inexpliquees": inexpliquees,
+        "decalage_horloge_s": round(decalage, 3),
+        "erreurs": [e for s in sessions for e in s.erreurs][:50],
+    }
+
+
+def afficher(ligne):
+    charge = ligne["serveur_charge"] or {}
+    clic = ligne["latences"]["clic"] or {}
+    fragment = ligne["latences"]["fragment"] or ligne["latences"]["page"] or {}
+    memoire = ligne["memoire_par_session_octets"]
+    bilan = ligne["bilan_clics"]
+    print(
+        f"{ligne['live']:>12} | {ligne['sessions']:>4} sessions | {ligne['consoles']:>5} consoles"
+        f" | CPU {charge.get('cpu_moyen_pct', 0):5.0f} % (max {charge.get('cpu_max_pct', 0):.0f} %)"
+        f" | RSS {charge.get('rss_moyen_octets', 0) / 2**20:6.0f} Mio"
+        f" ({(memoire or 0) / 2**20:+.1f} Mio/session)"
+        f" | rafraîchissement p50 {fragment.get('p50_s', 0) * 1000:.0f} ms p99 {fragment.get('p99_s', 0) * 1000:.0f} ms"
+        f" | clic p50 {clic.get('p50_s', 0) * 1000:.0f} ms p99 {clic.get('p99_s', 0) * 1000:.0f} ms"
+        f" | {sum(ligne['clics'].values())} clics : {bilan['journalises']} journalisés, {bilan['conflits']} conflits,"
+        f" {bilan['sans_effet']} sans effet, {bilan['perdus']} perdus | {ligne['transactions_journal']} transactions"
+        f" ({ligne['transactions_inexpliquees']} inexpliquées) | {len(ligne['erreurs'])} erreurs",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de suivtemp1.py (sessions Streamlit simulées)")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20], help="Paliers de sessions simultanées")
+    parser.add_argument("--consoles", type=int, default=50)
+    parser.add_argument("--duree", type=float, default=60, help="Durée de chaque palier (s)")
+    parser.add_argument("--live", nargs="+", choices=["fragment", "autorefresh"], default=["fragment"],
+                        help="Mode de rafraîchissement de la page (SUIVTEMP_LIVE) ; plusieurs = une série par mode")
+    parser.add_argument("--rafraichissement", type=float, default=15, help="Période de l'autorefresh de la page (s)")
+    parser.add_argument("--clics-par-minute", type=float, default=4, help="Clics par session et par minute (0 = aucun)")
+    parser.add_argument("--mode", choices=["panneaux", "compact"], default="compact", help="Mode d'affichage tenu par chaque session")
+    parser.add_argument("--pilotees", type=int, default=5, help="Consoles pilotées par session en mode compact")
+    parser.add_argument("--graine", type=int, default=1)
+    parser.add_argument("--sortie", default="charge_resultats.json")
+    args = parser.parse_args()
+
+    import streamlit
+    resultats = []
+    for live in args.live:
+        for nb_sessions in args.sessions:
+            ligne = mesurer_palier(args, live, nb_sessions)
+            afficher(ligne)
+            resultats.append(ligne)
+
+    sortie = {
+        "meta": {
+            "date": datetime.now().isoformat(),
+            "commit": version_git(),
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "machine": platform.machine(),
+            "coeurs": psutil.cpu_count(),
+            "memoire_octets": psutil.virtual_memory().total,
+            "parametres": vars(args),
+        },
+        "resultats": resultats,
+    }
+    with open(args.sortie, "w") as f:
+        json.dump(sortie, f, indent=2)
+    print(f"Résultats écrits dans {args.sortie}")
+
+
+if __name__ == "__main__":
+    main()
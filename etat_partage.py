@@ -0,0 +1,318 @@
+import atexit
+import contextlib
+import threading
+import time
+from collections import deque
+
+from filelock import FileLock
+
+from horloge import HORLOGE, SEUIL_RECALAGE
+from journal_etat import SEUIL_COMPACTION, JournalEtat
+
+# --- Magasin d'État Partagé ---
+# Une seule instance par processus, commune à toutes les sessions (onglets) Streamlit.
+# Toutes les écritures passent par le journal sous un verrou fichier, ce qui permet aussi de
+# lancer plusieurs processus sur les mêmes fichiers : chacun rattrape les transactions des
+# autres en lisant seulement la fin du journal. Les sessions lisent une vue en mémoire
+# recopiée une fois par version, jamais le JSON.
+#
+# Écriture différée (fenetre_ecriture > 0) : une action est appliquée en mémoire et mise en
+# attente, puis un thread d'écriture l'écrit avec toutes celles arrivées pendant la fenêtre
+# (une écriture, un fsync). L'interface n'attend plus le disque (carte SD du kiosque).
+# Le verrou fichier n'est pris que pour l'écriture : un autre processus (API) n'attend jamais la
+# fin d'une fenêtre. S'il a écrit entre-temps, ses transactions sont rejouées sur l'état d'avant
+# nos transactions en attente, puis les nôtres sont réappliquées et renumérotées à leur suite
+# (voir _rebaser). Une coupure de courant peut perdre au plus la dernière fenêtre d'actions.
+# Les abonnés (historique, planificateur) ne reçoivent une transaction qu'une fois écrite : une
+# action abandonnée au rejeu n'est jamais archivée, elle est signalée dans `abandons`.
+
+TAILLE_ABANDONS = 50
+
+
+class ConflitVersion(Exception):
+    def __init__(self, console, attendue, actuelle):
+        super().__init__(f"La console '{console}' a été modifiée entre-temps (version {attendue} -> {actuelle}).")
+        self.console = console
+        self.attendue = attendue
+        self.actuelle = actuelle
+
+
+class TransitionRefusee(Exception):
+    def __init__(self, console, op):
+        super().__init__(f"Action '{op}' impossible : la console '{console}' n'est pas dans le bon état.")
+        self.console = console
+        self.op = op
+
+
+class MagasinEtat:
+    def __init__(self, chemin_snapshot, seuil_compaction=SEUIL_COMPACTION, fenetre_ecriture=0.0):
+        self.journal = JournalEtat(chemin_snapshot, seuil_compaction=seuil_compaction)
+        self.verrou = threading.RLock()  # Sessions du même processus
+        self.verrou_fichier = FileLock(f"{chemin_snapshot}.lock")  # Autres processus
+        self.fenetre_ecriture = fenetre_ecriture  # En secondes, 0 = écriture immédiate
+        with self.verrou, self.verrou_fichier:
+            self.moteur = self.journal.charger()
+            # Ligne de temps commune aux processus qui partagent ces fichiers (voir horloge.py)
+            HORLOGE.ancrer(f"{chemin_snapshot}.horloge", self.moteur.dernier_instant())
+        self._vue = None  # (copie du moteur, versions par console) d'une même version
+        self._version_vue = None
+        self._cle_calcul = None
+        self._calcul = None
+        self.abonnes = []  # Fonctions appelées avec (evts, resultats) après chaque transaction écrite
+        self._signal_ecriture = threading.Event()
+        self._ecrivain = None
+        self._base = None  # (moteur, seq, versions) d'avant les transactions en attente
+        self._attente = []  # (evts, resultats) des transactions en attente, alignés sur journal.en_attente
+        self._ecrites = []  # (evts, resultats) écrites, pas encore transmises aux abonnés
+        self.abandons = deque(maxlen=TAILLE_ABANDONS)  # Événements différés abandonnés au rejeu
+        self.numero_abandon = 0
+        if fenetre_ecriture > 0:
+            self._ecrivain = threading.Thread(target=self._boucle_ecriture, name="ecriture-etat", daemon=True)
+            self._ecrivain.start()
+            atexit.register(self.fermer)  # Dernières transactions écrites à l'arrêt du serveur
+
+    def abonner(self, fonction):
+        # Ex: l'historique des sessions enregistre chaque arrêt appliqué par ce processus
+        self.abonnes.append(fonction)
+
+    def _notifier(self):
+        # Hors verrou : les abonnés (historique, notifications...) ne bloquent pas les autres sessions
+        with self.verrou:
+            ecrites, self._ecrites = self._ecrites, []
+        for evts, resultats in ecrites:
+            for abonne in self.abonnes:
+                abonne(evts, resultats)
+
+    def abandons_depuis(self, numero):
+        # Actions différées de ce processus abandonnées depuis `numero` (pour les avertissements des sessions)
+        if numero >= self.numero_abandon:
+            return []
+        return [a for a in list(self.abandons) if a["numero"] > numero]
+
+    @property
+    def version(self):
+        return self.journal.seq
+
+    def version_console(self, nom):
+        return self.journal.versions.get(nom, 0)
+
+    def _verrou_ecriture(self):
+        # En écriture différée, les transactions sont mises en attente sans le verrou fichier
+        return self.verrou_fichier if self._ecrivain is None else contextlib.nullcontext()
+
+    def _synchroniser(self):
+        # Appelé sous self.verrou : rattrape les écritures des autres processus
+        if self.journal.a_jour():
+            return
+        if self.journal.en_attente:
+            self._rebaser()
+            return
+        if self.journal.suivre(self.moteur) is None:
+            # Journal compacté ailleurs : rechargement complet, sous verrou pour ne pas
+            # lire un snapshot et un journal de générations différentes
+            with self.verrou_fichier:
+                self.moteur = self.journal.charger()
+
+    def vue(self):
+        # Vue en lecture seule partagée : une seule copie par version, commune à toutes les sessions.
+        # Retourne (vue, versions par console) pris ensemble : les versions restent celles de la vue
+        # rendue même si une autre session publie une vue plus récente entre-temps.
+        with self.verrou:
+            self._synchroniser()
+            if self._vue is None or self._version_vue != self.version:
+                self._vue = (self.moteur.copie(), dict(self.journal.versions))
+                self._version_vue = self.version
+            return self._vue
+
+    def calculer(self, maintenant, pas=1.0):
+        # Calcul groupé sur la vue partagée, refait au plus une fois par `pas` secondes et par version :
+        # tous les fragments live d'un même tick (toutes consoles, toutes sessions) le réutilisent
+        with self.verrou:
+            vue, versions = self.vue()
+            cle = (self._version_vue, int(maintenant // pas))
+            if cle != self._cle_calcul:
+                self._calcul = vue.calculer(maintenant)
+                self._cle_calcul = cle
+            return vue, versions, self._calcul
+
+    def appliquer(self, evts, versions_attendues=None):
+        # Applique une transaction (liste d'événements) de façon atomique.
+        # `versions_attendues` ({console: version}) active le compare-and-swap : la transaction
+        # est refusée si une de ces consoles a changé depuis que l'opérateur l'a affichée.
+        with self.verrou, self._verrou_ecriture():
+            self._synchroniser()
+            for nom, attendue in (versions_attendues or {}).items():
+                actuelle = self.version_console(nom)
+                if actuelle != attendue:
+                    raise ConflitVersion(nom, attendue, actuelle)
+            resultats = self._transaction(evts)
+        self._notifier()
+        return resultats
+
+    def _transaction(self, evts):
+        # Appelé sous les verrous d'écriture : applique et journalise les événements en une seule ligne
+        self._preparer_attente()
+        try:
+            resultats = [self.moteur.appliquer(evt) for evt in evts]
+        except Exception:
+            # Annule les événements déjà appliqués en repartant de l'état persisté
+            # (les transactions différées précédentes, valides, sont d'abord écrites)
+            self.vider()
+            with self.verrou_fichier:
+                self.moteur = self.journal.charger()
+            raise
+        self._journaliser(evts, resultats)
+        return resultats
+
+    def _preparer_attente(self):
+        # Avant la première transaction différée d'une fenêtre : copie de l'état, base d'un
+        # éventuel rejeu si un autre processus écrit avant la fin de la fenêtre
+        if self._ecrivain is not None and not self.journal.en_attente:
+            self._base = (self.moteur.copie(), self.journal.seq, dict(self.journal.versions))
+
+    def _journaliser(self, evts, resultats):
+        # Appelé sous les verrous d'écriture, après application des événements au moteur
+        if self._ecrivain is None:
+            self.journal.enregistrer(evts, self.moteur)
+            self._ecrites.append((evts, resultats))
+            return
+        self.journal.enregistrer(evts, self.moteur, differe=True)
+        self._attente.append((evts, resultats))
+        self._signal_ecriture.set()
+
+    def _attente_ecrite(self):
+        # Appelé sous self.verrou, une fois les transactions en attente écrites (journal ou snapshot)
+        self._ecrites.extend(self._attente)
+        self._attente = []
+
+    def _rebaser(self):
+        # Appelé sous self.verrou quand un autre processus a écrit pendant que des transactions
+        # attendaient (leurs numéros provisoires sont alors déjà pris) : ses transactions sont
+        # rejouées sur la copie d'avant la fenêtre, puis les nôtres réappliquées à leur suite.
+        # Un événement devenu sans objet (console déjà démarrée, supprimée...) est abandonné.
+        attente = self._attente
+        self._attente = []
+        self.moteur, self.journal.seq, self.journal.versions = self._base
+        self.journal.en_attente = []
+        if self.journal.suivre(self.moteur) is None:
+            with self.verrou_fichier:
+                self.moteur = self.journal.charger()
+        for evts, _ in attente:
+            self._preparer_attente()
+            gardes, resultats = [], []
+            for evt in evts:
+                console = evt.get("console")
+                try:
+                    if console is not None and evt["op"] != "ajouter" and not self.moteur.eligibles(evt["op"], [console]):
+                        raise TransitionRefusee(console, evt["op"])
+                    resultats.append(self.moteur.appliquer(evt))
+                except (TransitionRefusee, KeyError, ValueError):
+                    self.numero_abandon += 1
+                    self.abandons.append({"numero": self.numero_abandon, "op": evt["op"], "console": console})
+                    continue
+                gardes.append(evt)
+            if gardes:
+                self._journaliser(gardes, resultats)
+
+    # --- Écriture différée ---
+    def vider(self):
+        # Écrit tout de suite les transactions en attente (bouton "Forcer Sauvegarde", arrêt...).
+        # Le verrou fichier n'est pris que le temps de rattraper les autres processus et d'écrire.
+        with self.verrou:
+            if self.journal.en_attente:
+                with self.verrou_fichier:
+                    self._synchroniser()
+                    self.journal.vider(self.moteur)
+                self._attente_ecrite()
+        self._notifier()
+
+    def _boucle_ecriture(self):
+        while True:
+            self._signal_ecriture.wait()
+            # Les actions arrivées pendant la fenêtre partiront dans la même écriture
+            time.sleep(self.fenetre_ecriture)
+            self._signal_ecriture.clear()
+            try:
+                self.vider()
+            except OSError:
+                # Disque indisponible : les transactions restent en attente, nouvel essai à la fenêtre suivante
+                self._signal_ecriture.set()
+
+    def fermer(self):
+        self.vider()
+
+    def appliquer_lot(self, op, consoles, maintenant, **params):
+        # Même opération sur plusieurs consoles (sélection, groupe, toutes) en une transaction :
+        # une seule écriture quel que soit le nombre de consoles. Les consoles pour lesquelles
+        # l'opération n'a pas de sens (démarrer une session en cours...) sont écartées au moment
+        # d'appliquer, sur l'état à jour. Retourne {console: résultat} des consoles modifiées.
+        with self.verrou, self._verrou_ecriture():
+            self._synchroniser()
+            cibles = self.moteur.eligibles(op, consoles)
+            evts = [{"op": op, "console": nom, "t": maintenant, **params} for nom in cibles]
+            if not evts:
+                return {}
+            resultats = self._transaction(evts)
+        self._notifier()
+        return dict(zip(cibles, resultats))
+
+    def appliquer_groupe(self, demandes):
+        # Regroupe des demandes indépendantes (evt, versions_attendues) en une seule transaction
+        # journalisée. Chaque demande est validée seule : une console inconnue, un conflit de
+        # version ou une transition sans effet sur l'état à jour (démarrer une session en cours,
+        # double déclenchement d'un monnayeur...) n'écarte que sa demande, dont l'exception est
+        # retournée à sa place.
+        resultats, acceptes, resultats_acceptes = [], [], []
+        with self.verrou, self._verrou_ecriture():
+            self._synchroniser()
+            self._preparer_attente()
+            modifiees = set()
+            for evt, attendues in demandes:
+                try:
+                    for nom, attendue in (attendues or {}).items():
+                        actuelle = self.version_console(nom)
+                        if actuelle != attendue or nom in modifiees:
+                            raise ConflitVersion(nom, attendue, actuelle)
+                    console = evt.get("console")
+                    if console in self.moteur.index and not self.moteur.eligibles(evt["op"], [console]):
+                        raise TransitionRefusee(console, evt["op"])
+                    resultat = self.moteur.appliquer(evt)
+                except (ConflitVersion, TransitionRefusee, KeyError, ValueError) as e:
+                    resultats.append(e)
+                    continue
+                modifiees.add(evt.get("console"))
+                resultats.append(resultat)
+                acceptes.append(evt)
+                resultats_acceptes.append(resultat)
+            if acceptes:
+                self._journaliser(acceptes, resultats_acceptes)
+        self._notifier()
+        return resultats
+
+    def compacter(self):
+        with self.verrou, self.verrou_fichier:
+            self._synchroniser()
+            # Les transactions en attente sont incluses dans le snapshot
+            self.journal.compacter(self.moteur)
+            self._attente_ecrite()
+        self._notifier()
+
+    def recaler_horloge(self):
+        # Heure du système corrigée (NTP, réglage manuel) : la ligne de temps adopte l'heure murale
+        # et les sessions en cours sont décalées d'autant, pour tous les processus. Retourne le décalage.
+        if abs(HORLOGE.ecart()) < SEUIL_RECALAGE:
+            return 0.0  # Cas courant : ni verrou ni lecture du journal
+        with self.verrou, self.verrou_fichier:
+            self._synchroniser()
+            decalage = HORLOGE.recaler()
+            if not decalage:
+                return 0.0
+            evts = [{"op": "recaler", "console": None, "t": HORLOGE.maintenant(), "decalage": decalage}]
+            self._transaction(evts)
+        self._notifier()
+        return decalage
+
+    def reinitialiser(self, maintenant):
+        # Vide toutes les consoles pour tous les processus, puis repart d'un snapshot vide
+        self.appliquer([{"op": "reinitialiser", "console": None, "t": maintenant}])
+        self.compacter()
@@ -0,0 +1,179 @@
+import sqlite3
+import threading
+
+from horloge import format_jour
+
+# --- Historique des Sessions (SQLite) ---
+# Chaque arrêt de console ajoute une ligne "session" ; en option, chaque segment actif
+# (du Start/Reprendre jusqu'à la Pause/Stop) ajoute une ligne "segment".
+# La table cumul_jour est tenue à jour par un trigger à chaque session insérée :
+# les panneaux de synthèse lisent ces cumuls pré-calculés au lieu de parcourir les lignes brutes.
+
+DB_FILE = "historique.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    console TEXT NOT NULL,
+    type TEXT NOT NULL,            -- 'session' ou 'segment'
+    debut REAL NOT NULL,           -- epoch (s)
+    fin REAL NOT NULL,             -- epoch (s)
+    duree REAL NOT NULL,           -- minutes
+    intervalles INTEGER NOT NULL DEFAULT 0,
+    jour TEXT NOT NULL,            -- AAAA-MM-JJ (heure locale du début)
+    duree_intervalle INTEGER,      -- minutes, intervalle en vigueur à l'arrêt (NULL : lignes anciennes)
+    groupe TEXT                    -- groupe de la console à l'arrêt (type tarifaire)
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_console ON sessions (console, debut);
+CREATE INDEX IF NOT EXISTS idx_sessions_debut ON sessions (debut);
+CREATE INDEX IF NOT EXISTS idx_sessions_jour ON sessions (jour, console);
+
+CREATE TABLE IF NOT EXISTS cumul_jour (
+    console TEXT NOT NULL,
+    jour TEXT NOT NULL,
+    nb_sessions INTEGER NOT NULL,
+    minutes REAL NOT NULL,
+    intervalles INTEGER NOT NULL,
+    PRIMARY KEY (console, jour)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cumul_jour ON cumul_jour (jour);
+
+CREATE TRIGGER IF NOT EXISTS maj_cumul_jour AFTER INSERT ON sessions WHEN NEW.type = 'session'
+BEGIN
+    INSERT INTO cumul_jour (console, jour, nb_sessions, minutes, intervalles)
+    VALUES (NEW.console, NEW.jour, 1, NEW.duree, NEW.intervalles)
+    ON CONFLICT (console, jour) DO UPDATE SET
+        nb_sessions = nb_sessions + 1,
+        minutes = minutes + excluded.minutes,
+        intervalles = intervalles + excluded.intervalles;
+END;
+"""
+
+# Colonnes ajoutées depuis la première version du schéma, créées à l'ouverture des bases existantes
+COLONNES_AJOUTEES = {"duree_intervalle": "INTEGER", "groupe": "TEXT"}
+
+
+def jour_local(t):
+    return format_jour(t)
+
+
+class HistoriqueSessions:
+    def __init__(self, chemin=DB_FILE, segments=False):
+        self.chemin = chemin
+        self.segments = segments  # Enregistre aussi chaque segment Start/Reprendre -> Pause/Stop
+        self.verrou = threading.Lock()
+        # Une connexion partagée par toutes les sessions Streamlit, protégée par le verrou
+        self.connexion = sqlite3.connect(chemin, check_same_thread=False)
+        self.connexion.row_factory = sqlite3.Row
+        with self.verrou:
+            self.connexion.execute("PRAGMA journal_mode=WAL")
+            self.connexion.execute("PRAGMA synchronous=NORMAL")
+            self.connexion.executescript(SCHEMA)
+            existantes = {r["name"] for r in self.connexion.execute("PRAGMA table_info(sessions)")}
+            for colonne, definition in COLONNES_AJOUTEES.items():
+                if colonne not in existantes:
+                    self.connexion.execute(f"ALTER TABLE sessions ADD COLUMN {colonne} {definition}")
+
+    def fermer(self):
+        with self.verrou:
+            self.connexion.close()
+
+    # --- Écriture ---
+    def enregistrer_lot(self, lignes):
+        # lignes : tuples (console, type, debut, fin, duree, intervalles, duree_intervalle, groupe),
+        # écrits en une transaction
+        if not lignes:
+            return
+        with self.verrou, self.connexion:
+            self.connexion.executemany(
+                "INSERT INTO sessions (console, type, debut, fin, duree, intervalles, duree_intervalle, groupe, jour) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [ligne + (jour_local(ligne[2]),) for ligne in lignes],
+            )
+
+    def enregistrer_session(self, console, debut, fin, duree, intervalles=0, duree_intervalle=None, groupe=None):
+        self.enregistrer_lot([(console, "session", debut, fin, duree, intervalles, duree_intervalle, groupe)])
+
+    def ecouter(self, evts, resultats):
+        # Abonné du magasin d'état : transforme les arrêts (et pauses) d'une transaction en lignes
+        lignes = []
+        for evt, resultat in zip(evts, resultats):
+            if resultat is None:
+                continue
+            if evt["op"] == "arreter":
+                lignes.append((evt["console"], "session", resultat["start"], resultat["end"],
+                               resultat["duration"], resultat["intervalles"], resultat["intervalle"], resultat["groupe"]))
+                segment = resultat["segment"]
+            elif evt["op"] == "pause":
+                segment = resultat
+            else:
+                continue
+            if self.segments and segment:
+                lignes.append((evt["console"], "segment", segment["start"], segment["end"],
+                               (segment["end"] - segment["start"]) / 60, 0, None, None))
+        self.enregistrer_lot(lignes)
+
+    def reconstruire_cumuls(self):
+        # Recalcule cumul_jour depuis les lignes brutes (après import ou correction manuelle)
+        with self.verrou, self.connexion:
+            self.connexion.execute("DELETE FROM cumul_jour")
+            self.connexion.execute("""
+                INSERT INTO cumul_jour (console, jour, nb_sessions, minutes, intervalles)
+                SELECT console, jour, COUNT(*), SUM(duree), SUM(intervalles)
+                FROM sessions WHERE type = 'session' GROUP BY console, jour
+            """)
+
+    # --- Requêtes ---
+    def _lire(self, requete, parametres=()):
+        with self.verrou:
+            return [dict(r) for r in self.connexion.execute(requete, parametres)]
+
+    def sessions(self, console=None, depuis=None, jusqu_a=None, type="session", limite=100):
+        # Lignes brutes les plus récentes (bornes en epoch), via les index console/debut
+        conditions, parametres = ["type = ?"], [type]
+        if console is not None:
+            conditions.append("console = ?")
+            parametres.append(console)
+        if depuis is not None:
+            conditions.append("debut >= ?")
+            parametres.append(depuis)
+        if jusqu_a is not None:
+            conditions.append("debut < ?")
+            parametres.append(jusqu_a)
+        parametres.append(limite)
+        return self._lire(
+            f"SELECT console, type, debut, fin, duree, intervalles, jour FROM sessions "
+            f"WHERE {' AND '.join(conditions)} ORDER BY debut DESC LIMIT ?",
+            parametres,
+        )
+
+    def _bornes_jours(self, depuis_jour, jusqu_au_jour, console=None):
+        conditions, parametres = [], []
+        if console is not None:
+            conditions.append("console = ?")
+            parametres.append(console)
+        if depuis_jour is not None:
+            conditions.append("jour >= ?")
+            parametres.append(depuis_jour)
+        if jusqu_au_jour is not None:
+            conditions.append("jour <= ?")
+            parametres.append(jusqu_au_jour)
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), parametres
+
+    def usage_par_console(self, depuis_jour=None, jusqu_au_jour=None):
+        # Agrégats par console sur une plage de jours (AAAA-MM-JJ inclus), lus dans cumul_jour
+        filtre, parametres = self._bornes_jours(depuis_jour, jusqu_au_jour)
+        return self._lire(
+            f"SELECT console, SUM(nb_sessions) AS nb_sessions, SUM(minutes) AS minutes, "
+            f"SUM(intervalles) AS intervalles FROM cumul_jour {filtre} GROUP BY console ORDER BY minutes DESC",
+            parametres,
+        )
+
+    def usage_par_jour(self, depuis_jour=None, jusqu_au_jour=None, console=None):
+        # Agrégats par jour (toutes consoles, ou une seule), lus dans cumul_jour
+        filtre, parametres = self._bornes_jours(depuis_jour, jusqu_au_jour, console)
+        return self._lire(
+            f"SELECT jour, SUM(nb_sessions) AS nb_sessions, SUM(minutes) AS minutes, "
+            f"SUM(intervalles) AS intervalles FROM cumul_jour {filtre} GROUP BY jour ORDER BY jour",
+            parametres,
+        )
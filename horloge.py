@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from moteur_timer import FUSEAU
+
+# --- Horloge Monotone Ancrée ---
+# Tous les instants de l'application (événements, compteurs, échéances) viennent de maintenant() :
+# une ancre murale (epoch) plus le temps monotone écoulé depuis la prise de l'ancre. Un pas NTP ou
+# un changement manuel de l'heure système ne fausse donc plus les sessions en cours.
+# L'ancre est enregistrée à côté du snapshot ({"demarrage", "murale", "monotone"}) : CLOCK_MONOTONIC
+# étant commune à tout le système, les processus (interface, API) et les redémarrages du serveur
+# pendant un même démarrage de la machine reprennent la même ligne de temps. Après un redémarrage
+# de la machine, l'ancre repart de l'heure murale, sans jamais revenir avant le dernier instant
+# persisté (kiosque sans horloge matérielle qui démarre à une heure ancienne).
+# Si l'heure murale s'écarte durablement de la ligne de temps (heure enfin synchronisée, réglage
+# manuel), recaler() adopte l'heure murale et retourne le décalage, que le magasin reporte sur les
+# sessions en cours : l'affichage suit l'heure du système, les durées mesurées restent exactes.
+
+SEUIL_RECALAGE = float(os.environ.get("SUIVTEMP_SEUIL_RECALAGE", "120"))  # En secondes
+FICHIER_DEMARRAGE = "/proc/sys/kernel/random/boot_id"
+VERIFICATION_ANCRE = 1.0  # L'ancre partagée est relue au plus une fois par seconde (un stat)
+
+
+def identifiant_demarrage():
+    # Change à chaque démarrage de la machine ; None hors Linux (l'ancre n'est alors jamais reprise)
+    try:
+        with open(FICHIER_DEMARRAGE) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class Horloge:
+    def __init__(self, murale=time.time, monotone=time.monotonic):
+        self._murale = murale
+        self._monotone = monotone
+        self.demarrage = identifiant_demarrage()
+        self.chemin = None  # Fichier d'ancre partagé, None tant que ancrer() n'a pas été appelé
+        self._signature = None
+        self._prochaine_verification = 0.0
+        self.verrou = threading.Lock()
+        # (epoch, monotone) remplacés d'un bloc : lus sans verrou par toutes les sessions
+        self._ancre = (murale(), monotone())
+
+    def maintenant(self):
+        mono = self._monotone()
+        if self.chemin is not None and mono >= self._prochaine_verification:
+            self._verifier(mono)
+        murale, ancre_mono = self._ancre
+        return murale + (mono - ancre_mono)
+
+    def ecart(self):
+        # Heure murale - ligne de temps (s) : > 0 si l'heure du système a avancé depuis l'ancre
+        return self._murale() - self.maintenant()
+
+    # --- Ancre partagée ---
+    def ancrer(self, chemin, plancher=None):
+        # Appelé au chargement de l'état, sous le verrou fichier du magasin.
+        # `plancher` : dernier instant persisté (epoch), la ligne de temps ne repart jamais avant.
+        with self.verrou:
+            self.chemin = chemin
+            ancre = self._lire()
+            if ancre is None:
+                murale, mono = self._murale(), self._monotone()
+                if plancher is not None and murale < plancher:
+                    murale = plancher
+                ancre = (murale, mono)
+                self._ecrire(ancre)
+            self._ancre = ancre
+
+    def recaler(self, seuil=SEUIL_RECALAGE):
+        # Adopte l'heure murale si elle s'écarte de plus de `seuil` secondes de la ligne de temps.
+        # Retourne le décalage appliqué (0 si aucun) ; à appeler sous le verrou fichier du magasin.
+        with self.verrou:
+            if self.chemin is not None:
+                self._recharger()
+            murale, mono = self._murale(), self._monotone()
+            ancre_murale, ancre_mono = self._ancre
+            decalage = murale - (ancre_murale + (mono - ancre_mono))
+            if abs(decalage) < seuil:
+                return 0.0
+            self._ancre = (murale, mono)
+            if self.chemin is not None:
+                self._ecrire(self._ancre)
+            return decalage
+
+    def _verifier(self, mono):
+        # Un autre processus a pu recaler l'ancre : relue seulement si le fichier a changé
+        self._prochaine_verification = mono + VERIFICATION_ANCRE
+        with self.verrou:
+            self._recharger()
+
+    def _recharger(self):
+        # Appelé sous self.verrou
+        ancre = self._lire()
+        if ancre is not None:
+            self._ancre = ancre
+
+    def _lire(self):
+        # Ancre du fichier si elle date de ce démarrage de la machine, None sinon
+        try:
+            stat = os.stat(self.chemin)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature:
+                return self._ancre
+            with open(self.chemin) as f:
+                donnees = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._signature = signature
+        if self.demarrage is None or donnees.get("demarrage") != self.demarrage:
+            return None
+        return (float(donnees["murale"]), float(donnees["monotone"]))
+
+    def _ecrire(self, ancre):
+        tmp = f"{self.chemin}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"demarrage": self.demarrage, "murale": ancre[0], "monotone": ancre[1]}, f)
+        os.replace(tmp, self.chemin)
+        stat = os.stat(self.chemin)
+        self._signature = (stat.st_mtime_ns, stat.st_size)
+
+
+# Instance unique du processus, partagée par toutes les sessions et par l'API
+HORLOGE = Horloge()
+
+
+def maintenant():
+    return HORLOGE.maintenant()
+
+
+def maintenant_local():
+    # Datetime du fuseau de Madagascar, pour les widgets date/heure
+    return datetime.fromtimestamp(HORLOGE.maintenant(), FUSEAU)
+
+
+# --- Formatage ---
+# Les compteurs et le tableau formatent des centaines d'instants par tick : le décalage du fuseau
+# est mis en cache par heure et le libellé du jour par jour, sans créer de datetime par console.
+@lru_cache(maxsize=64)
+def _decalage_heure(heure):
+    return datetime.fromtimestamp(heure * 3600, FUSEAU).utcoffset().total_seconds()
+
+
+@lru_cache(maxsize=64)
+def _libelle_jour(jour):
+    return (date(1970, 1, 1) + timedelta(days=jour)).isoformat()
+
+
+def secondes_locales(t):
+    return t + _decalage_heure(int(t // 3600))
+
+
+def format_heure(t):
+    s = int(secondes_locales(t) % 86400)
+    return f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}"
+
+
+def format_jour(t):
+    return _libelle_jour(int(secondes_locales(t) // 86400))
+
+
+def format_horodatage(t):
+    return f"{format_jour(t)} {format_heure(t)}"
@@ -0,0 +1,176 @@
+import contextlib
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+# --- Instrumentation des Exécutions ---
+# Mesure le temps de chaque phase d'une exécution du script (chargement, formulaire, consoles,
+# ajustement, historique, sidebar...), le rendu de chaque console, le temps et les octets des
+# écritures de la persistance (ecriture_journal, compaction).
+# Activée par SUIVTEMP_INSTRUMENTATION=1. Désactivée, chaque point de mesure se résume à un test
+# d'attribut : elle peut rester branchée en production.
+# Les compteurs sont exposés au format texte Prometheus (fichier et/ou endpoint /metrics).
+
+_NUL = contextlib.nullcontext()
+CONSOLES_EXPORTEES = 20  # Seules les consoles les plus lentes sont exportées (cardinalité bornée)
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Chrono:
+    __slots__ = ("instruments", "nom", "table", "debut")
+
+    def __init__(self, instruments, nom, table):
+        self.instruments = instruments
+        self.nom = nom
+        self.table = table
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instruments._ajouter(self.table, self.nom, time.perf_counter() - self.debut)
+        return False
+
+
+class Instruments:
+    def __init__(self, actif=False):
+        self.actif = actif
+        self.verrou = threading.Lock()
+        # nom -> [nombre, total (s), max (s), dernier (s)]
+        self.phases = {}
+        self.consoles = {}
+        self.octets = {}  # Type d'écriture (journal, snapshot...) -> octets écrits
+        self.ecritures = {}  # Type d'écriture -> nombre d'écritures
+        self.instants_ecriture = deque(maxlen=10000)
+        self._dernier_export = -float("inf")  # Horloge monotone : premier export immédiat
+
+    # --- Points de mesure ---
+    def phase(self, nom):
+        # with INSTRUMENTS.phase("chargement"): ...
+        if not self.actif:
+            return _NUL
+        return _Chrono(self, nom, self.phases)
+
+    def console(self, nom):
+        if not self.actif:
+            return _NUL
+        return _Chrono(self, nom, self.consoles)
+
+    def debut(self):
+        # Pour mesurer une portion de script sans la ré-indenter : t = debut() ... fin("phase", t)
+        return time.perf_counter() if self.actif else None
+
+    def fin(self, nom, debut):
+        if debut is not None:
+            self._ajouter(self.phases, nom, time.perf_counter() - debut)
+
+    def chronometrer(self, nom):
+        # Décorateur : la fonction est laissée telle quelle si l'instrumentation est désactivée
+        def decorer(fonction):
+            if not self.actif:
+                return fonction
+
+            @functools.wraps(fonction)
+            def mesuree(*args, **kwargs):
+                with _Chrono(self, nom, self.phases):
+                    return fonction(*args, **kwargs)
+            return mesuree
+        return decorer
+
+    def compter_ecriture(self, type_ecriture, octets):
+        if not self.actif:
+            return
+        with self.verrou:
+            self.octets[type_ecriture] = self.octets.get(type_ecriture, 0) + octets
+            self.ecritures[type_ecriture] = self.ecritures.get(type_ecriture, 0) + 1
+            self.instants_ecriture.append(time.monotonic())
+
+    def _ajouter(self, table, nom, duree):
+        with self.verrou:
+            stats = table.get(nom)
+            if stats is None:
+                table[nom] = [1, duree, duree, duree]
+            else:
+                stats[0] += 1
+                stats[1] += duree
+                stats[2] = max(stats[2], duree)
+                stats[3] = duree
+
+    # --- Lecture ---
+    def ecritures_par_minute(self):
+        limite = time.monotonic() - 60
+        with self.verrou:
+            return sum(1 for t in self.instants_ecriture if t >= limite)
+
+    def resume_phases(self):
+        with self.verrou:
+            return {nom: list(stats) for nom, stats in self.phases.items()}
+
+    def volumes(self):
+        # Type d'écriture -> (nombre d'écritures, octets écrits)
+        with self.verrou:
+            return {type_ecriture: (self.ecritures[type_ecriture], octets) for type_ecriture, octets in self.octets.items()}
+
+    def consoles_lentes(self, nombre=CONSOLES_EXPORTEES):
+        # Consoles dont le dernier rendu a été le plus long
+        with self.verrou:
+            lignes = sorted(self.consoles.items(), key=lambda item: item[1][3], reverse=True)
+            return [(nom, list(stats)) for nom, stats in lignes[:nombre]]
+
+    def exporter_prometheus(self):
+        lignes = [
+            "# HELP suivtemp_phase_secondes_total Temps cumulé passé dans chaque phase.",
+            "# TYPE suivtemp_phase_secondes_total counter",
+        ]
+        phases = self.resume_phases()
+        for nom, (nombre, total, maximum, dernier) in phases.items():
+            lignes.append(f'suivtemp_phase_secondes_total{{phase="{_echapper(nom)}"}} {total:.6f}')
+        lignes += ["# HELP suivtemp_phase_executions_total Nombre d'exécutions de chaque phase.",
+                   "# TYPE suivtemp_phase_executions_total counter"]
+        for nom, (nombre, total, maximum, dernier) in phases.items():
+            lignes.append(f'suivtemp_phase_executions_total{{phase="{_echapper(nom)}"}} {nombre}')
+        lignes += ["# HELP suivtemp_phase_secondes_max Durée maximale observée par phase.",
+                   "# TYPE suivtemp_phase_secondes_max gauge"]
+        for nom, (nombre, total, maximum, dernier) in phases.items():
+            lignes.append(f'suivtemp_phase_secondes_max{{phase="{_echapper(nom)}"}} {maximum:.6f}')
+        lignes += ["# HELP suivtemp_console_rendu_secondes Durée du dernier rendu des consoles les plus lentes.",
+                   "# TYPE suivtemp_console_rendu_secondes gauge"]
+        for nom, (nombre, total, maximum, dernier) in self.consoles_lentes():
+            lignes.append(f'suivtemp_console_rendu_secondes{{console="{_echapper(nom)}"}} {dernier:.6f}')
+        volumes = self.volumes()
+        lignes += ["# HELP suivtemp_ecritures_octets_total Octets écrits sur disque par type d'écriture.",
+                   "# TYPE suivtemp_ecritures_octets_total counter"]
+        for type_ecriture, (nombre, octets) in volumes.items():
+            lignes.append(f'suivtemp_ecritures_octets_total{{type="{_echapper(type_ecriture)}"}} {octets}')
+        lignes += ["# HELP suivtemp_ecritures_total Nombre d'écritures par type.",
+                   "# TYPE suivtemp_ecritures_total counter"]
+        for type_ecriture, (nombre, octets) in volumes.items():
+            lignes.append(f'suivtemp_ecritures_total{{type="{_echapper(type_ecriture)}"}} {nombre}')
+        lignes += ["# HELP suivtemp_ecritures_par_minute Écritures disque sur la dernière minute.",
+                   "# TYPE suivtemp_ecritures_par_minute gauge",
+                   f"suivtemp_ecritures_par_minute {self.ecritures_par_minute()}"]
+        return "\n".join(lignes) + "\n"
+
+    def ecrire_fichier(self, chemin, periode=10.0):
+        # Fichier texte pour le collecteur "textfile" de node_exporter, réécrit au plus toutes les `periode` s
+        if not self.actif or not chemin:
+            return
+        maintenant = time.monotonic()
+        if maintenant - self._dernier_export < periode:
+            return
+        self._dernier_export = maintenant
+        tmp = f"{chemin}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.exporter_prometheus())
+        os.replace(tmp, chemin)
+
+
+# Instance unique du processus, partagée par toutes les sessions et par l'API
+INSTRUMENTS = Instruments(actif=os.environ.get("SUIVTEMP_INSTRUMENTATION") == "1")
+FICHIER_METRIQUES = os.environ.get("SUIVTEMP_METRIQUES_FICHIER")
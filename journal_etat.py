@@ -0,0 +1,262 @@
+import json
+import os
+import time
+
+import snapshot_binaire
+from instrumentation import INSTRUMENTS
+from moteur_timer import MoteurConsoles
+
+# --- Journal d'Événements + Snapshot Compacté ---
+# Chaque transition (Start, Pause, Stop, intervalle, suppression...) est ajoutée en fin de
+# journal sous forme d'une ligne JSON {"seq": n, "evts": [...]}. Une ligne = une transaction :
+# si le courant coupe pendant l'écriture, seule la dernière ligne (incomplète) est perdue.
+# Régulièrement, l'état complet est compacté dans le snapshot (console_data.json, même format
+# qu'avant plus les clés "journal_seq" et "versions"), écrit via un fichier temporaire puis os.replace.
+# Un snapshot en ".bin" utilise le format binaire (snapshot_binaire.py) : si seules des consoles
+# existantes ont changé, la compaction réécrit leurs enregistrements sur place.
+
+SEUIL_COMPACTION = 500  # Nombre de transactions journalisées avant compaction
+
+
+class ErreurChargement(Exception):
+    pass
+
+
+def ecrire_atomique(chemin, contenu):
+    # Écrit dans un fichier temporaire du même dossier, force l'écriture disque puis renomme :
+    # le fichier visible est toujours soit l'ancienne version complète, soit la nouvelle.
+    mode = "wb" if isinstance(contenu, bytes) else "w"
+    tmp = f"{chemin}.tmp"
+    with open(tmp, mode) as f:
+        f.write(contenu)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, chemin)
+    _fsync_dossier(chemin)
+
+
+def _fsync_dossier(chemin):
+    # Rend le renommage durable (sans effet sur les systèmes qui ne le permettent pas)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(chemin)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _identite(chemin):
+    # (périphérique, inode) du fichier : change quand le journal est remplacé par une compaction
+    try:
+        st = os.stat(chemin)
+    except FileNotFoundError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+class JournalEtat:
+    def __init__(self, chemin_snapshot, chemin_journal=None, seuil_compaction=SEUIL_COMPACTION):
+        self.chemin_snapshot = chemin_snapshot
+        self.chemin_journal = chemin_journal or f"{os.path.splitext(chemin_snapshot)[0]}.journal"
+        self.seuil_compaction = seuil_compaction
+        self.seq = 0  # Numéro de la dernière transaction appliquée
+        self.seq_snapshot = 0  # Numéro de la dernière transaction incluse dans le snapshot
+        self.versions = {}  # Console -> seq de la dernière transaction qui l'a modifiée
+        self.offset = 0  # Position (octets) de la fin du journal déjà lue
+        self.identite = None  # Identité du fichier journal lu jusqu'à `offset`
+        self.binaire = os.path.splitext(chemin_snapshot)[1] == ".bin"
+        self.disposition_snapshot = None  # (noms dans l'ordre, groupes) du snapshot binaire sur disque
+        self.en_attente = []  # Événements des transactions différées (seq provisoires), pas encore écrits (voir vider())
+
+    def _source(self):
+        # Fichier à charger : au premier lancement en binaire, l'ancien console_data.json
+        # (même journal) est repris tel quel puis remplacé par le binaire à la compaction
+        if os.path.exists(self.chemin_snapshot):
+            return self.chemin_snapshot
+        if self.binaire:
+            ancien = f"{os.path.splitext(self.chemin_snapshot)[0]}.json"
+            if os.path.exists(ancien):
+                return ancien
+        return None
+
+    # --- Chargement : snapshot + rejeu de la fin du journal ---
+    def charger(self):
+        moteur = MoteurConsoles()
+        self.seq = self.seq_snapshot = 0
+        self.versions = {}
+        self.offset = 0
+        self.disposition_snapshot = None
+        self.en_attente = []
+        source = self._source()
+        if source is not None:
+            try:
+                if source.endswith(".bin"):
+                    moteur, seq, self.versions = snapshot_binaire.lire(source)
+                    self.disposition_snapshot = (list(moteur.noms), moteur.liste_groupes())
+                else:
+                    with open(source, "r") as f:
+                        data = json.load(f)
+                    moteur = MoteurConsoles.depuis_etat(data)
+                    seq = int(data.get("journal_seq", 0))
+                    self.versions = dict(data.get("versions", {}))
+            except (json.JSONDecodeError, TypeError, KeyError, ValueError) as e:
+                # Le snapshot illisible est mis de côté au lieu d'être écrasé par un état vide
+                copie = f"{source}.corrompu-{int(time.time())}"
+                os.replace(source, copie)
+                raise ErreurChargement(f"{source} illisible ({e}), copie conservée dans {copie}") from e
+            self.seq = self.seq_snapshot = seq
+        self.identite = _identite(self.chemin_journal)
+        self.rejouer(moteur)
+        return moteur
+
+    def rejouer(self, moteur, continu=False):
+        # Applique les transactions écrites après `offset` ; une ligne finale incomplète
+        # (coupure pendant l'écriture) est ignorée puis retirée du fichier.
+        # Avec `continu`, un trou dans la numérotation interrompt la lecture et retourne None.
+        if not os.path.exists(self.chemin_journal):
+            return 0
+        appliquees = 0
+        with open(self.chemin_journal, "rb") as f:
+            f.seek(self.offset)
+            for ligne in f:
+                if not ligne.endswith(b"\n"):
+                    break
+                try:
+                    transaction = json.loads(ligne)
+                except ValueError:
+                    break
+                if continu and transaction["seq"] > self.seq + 1:
+                    return None
+                self.offset += len(ligne)
+                if transaction["seq"] <= self.seq:
+                    continue
+                self._appliquer(moteur, transaction)
+                appliquees += 1
+        # Au suivi (continu), une ligne incomplète peut être en cours d'écriture par un autre processus
+        if not continu and self.offset < os.path.getsize(self.chemin_journal):
+            with open(self.chemin_journal, "r+b") as f:
+                f.truncate(self.offset)
+        return appliquees
+
+    def _appliquer(self, moteur, transaction):
+        for evt in transaction["evts"]:
+            if self.versions.get(evt.get("console"), 0) >= transaction["seq"]:
+                # Déjà inclus dans l'enregistrement binaire réécrit sur place
+                continue
+            try:
+                moteur.appliquer(evt)
+            except KeyError:
+                # Console supprimée ou déjà existante : l'événement n'a plus d'objet
+                continue
+            self._marquer(evt, transaction["seq"])
+        self.seq = transaction["seq"]
+
+    def _marquer(self, evt, seq):
+        if evt["op"] == "reinitialiser":
+            self.versions = {}
+        elif evt["op"] == "supprimer":
+            self.versions.pop(evt["console"], None)
+        elif evt.get("console") is not None:
+            self.versions[evt["console"]] = seq
+        else:
+            # Événement sur toutes les consoles sans numéro de version (recalage d'horloge) : le
+            # snapshot binaire ne peut plus être mis à jour sur place, il sera réécrit en entier
+            self.disposition_snapshot = None
+
+    def a_jour(self):
+        # Vrai si personne n'a écrit dans le journal (ni ne l'a compacté) depuis la dernière lecture
+        identite = _identite(self.chemin_journal)
+        if identite != self.identite:
+            return False
+        return identite is None or os.path.getsize(self.chemin_journal) == self.offset
+
+    def suivre(self, moteur):
+        # Lit uniquement les transactions ajoutées par d'autres processus depuis `offset`.
+        # Si le journal a été remplacé (compaction ailleurs), retourne None : il faut tout recharger.
+        if _identite(self.chemin_journal) != self.identite:
+            return None
+        if self.identite is not None and os.path.getsize(self.chemin_journal) < self.offset:
+            return None
+        return self.rejouer(moteur, continu=True)
+
+    # --- Écriture ---
+    def enregistrer(self, evts, moteur, differe=False):
+        # Ajoute une transaction en fin de journal : coût constant quel que soit le nombre de consoles.
+        # Avec `differe`, la transaction est seulement mise en attente : vider() écrira d'un coup
+        # toutes les transactions accumulées (une écriture, un fsync).
+        self.seq += 1
+        for evt in evts:
+            self._marquer(evt, self.seq)
+        self.en_attente.append(evts)
+        if not differe:
+            self.vider(moteur)
+
+    def vider(self, moteur):
+        # Écrit les transactions en attente en une seule fois, puis compacte si le seuil est atteint.
+        # Leurs numéros suivent le dernier seq lu : à appeler sous le verrou fichier, journal à jour.
+        if not self.en_attente:
+            return 0
+        premier = self.seq - len(self.en_attente) + 1
+        with INSTRUMENTS.phase("ecriture_journal"):
+            bloc = b"".join(
+                (json.dumps({"seq": premier + k, "evts": evts}, separators=(",", ":")) + "\n").encode()
+                for k, evts in enumerate(self.en_attente)
+            )
+            with open(self.chemin_journal, "ab") as f:
+                f.write(bloc)
+                f.flush()
+                os.fsync(f.fileno())
+        self.en_attente = []
+        self.offset += len(bloc)
+        self.identite = _identite(self.chemin_journal)
+        INSTRUMENTS.compter_ecriture("journal", len(bloc))
+        if self.seq - self.seq_snapshot >= self.seuil_compaction:
+            self.compacter(moteur)
+        return len(bloc)
+
+    @INSTRUMENTS.chronometrer("compaction")
+    def compacter(self, moteur):
+        # Écrit le snapshot complet de façon atomique puis remplace le journal par un fichier vide.
+        # Une coupure entre les deux étapes est sans danger : les transactions déjà
+        # incluses dans le snapshot (seq <= journal_seq) sont ignorées au rejeu.
+        if self.binaire:
+            taille = self._compacter_binaire(moteur)
+        else:
+            data = moteur.vers_etat()
+            data["journal_seq"] = self.seq
+            data["versions"] = self.versions
+            contenu = json.dumps(data, indent=4)
+            ecrire_atomique(self.chemin_snapshot, contenu)
+            INSTRUMENTS.compter_ecriture("snapshot", len(contenu))
+            taille = len(contenu)
+        # Les transactions en attente étaient déjà dans `moteur` : le snapshot les contient
+        self.en_attente = []
+        self.seq_snapshot = self.seq
+        ecrire_atomique(self.chemin_journal, b"")
+        self.offset = 0
+        self.identite = _identite(self.chemin_journal)
+        return taille
+
+    def _compacter_binaire(self, moteur):
+        # Mêmes consoles dans le même ordre (et mêmes groupes) : seuls les enregistrements modifiés
+        # depuis le dernier snapshot sont réécrits. Sinon (ajout, suppression...), fichier complet.
+        disposition = (list(moteur.noms), moteur.liste_groupes())
+        if self.disposition_snapshot == disposition and os.path.exists(self.chemin_snapshot):
+            modifiees = [moteur.index[nom] for nom, seq in self.versions.items()
+                         if seq > self.seq_snapshot and nom in moteur.index]
+            try:
+                taille = snapshot_binaire.mettre_a_jour(self.chemin_snapshot, moteur, modifiees, self.seq, self.versions)
+            except ValueError:
+                pass  # Fichier remplacé ou abîmé : réécriture complète
+            else:
+                INSTRUMENTS.compter_ecriture("snapshot_sur_place", taille)
+                return taille
+        contenu = snapshot_binaire.encoder(moteur, self.seq, self.versions)
+        ecrire_atomique(self.chemin_snapshot, contenu)
+        INSTRUMENTS.compter_ecriture("snapshot", len(contenu))
+        self.disposition_snapshot = disposition
+        return len(contenu)
@@ -0,0 +1,374 @@
+import math
+from collections import namedtuple
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# --- Moteur de Timers en Colonnes ---
+# Toutes les consoles sont stockées dans des tableaux NumPy alignés (une ligne par console).
+# Les instants sont des secondes epoch (NaN = absent), les durées cumulées restent en minutes
+# comme dans console_data.json. Aucun import Streamlit : le moteur est utilisable partout.
+
+FUSEAU = ZoneInfo("Indian/Antananarivo")
+INTERVALLE_DEFAUT = 30  # Intervalle par défaut (ex: 30 min)
+
+# Codes de la colonne `statut`
+IDLE = 0
+EN_COURS = 1
+EN_PAUSE = 2
+
+LIBELLES_STATUT = {IDLE: "Idle", EN_COURS: "En cours", EN_PAUSE: "En pause"}
+
+# Colonnes numériques : nom -> (dtype, valeur pour une nouvelle console)
+COLONNES = {
+    "cumul": (np.float64, 0.0),            # consoles : cumul historique (min)
+    "debut": (np.float64, math.nan),       # start_times : début du segment actif (epoch)
+    "pause_cumulee": (np.float64, 0.0),    # paused_elapsed : temps accumulé avant le segment actif (min)
+    "statut": (np.int8, IDLE),             # is_paused + start_times
+    "intervalle": (np.int64, INTERVALLE_DEFAUT),  # intervals (min)
+    "nb_intervalles": (np.int64, 0),       # interval_counts
+    "debut_initial": (np.float64, math.nan),  # session_initial_start (epoch)
+}
+
+# Résultat d'un calcul groupé : un tableau par grandeur, aligné sur `noms`
+Calcul = namedtuple("Calcul", ["en_cours", "session", "total", "intervalles"])
+
+
+def vers_epoch(dt):
+    # Les anciennes sauvegardes contiennent des datetimes naïfs : on les considère comme heure locale
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=FUSEAU)
+    return dt.timestamp()
+
+
+def depuis_epoch(t):
+    return datetime.fromtimestamp(t, FUSEAU)
+
+
+def _iso_vers_epoch(valeur):
+    return vers_epoch(datetime.fromisoformat(valeur)) if valeur else math.nan
+
+
+def _epoch_vers_iso(t):
+    return None if math.isnan(t) else depuis_epoch(t).isoformat()
+
+
+class MoteurConsoles:
+    def __init__(self):
+        self.noms = []
+        self.index = {}
+        for nom, (dtype, _) in COLONNES.items():
+            setattr(self, nom, np.zeros(0, dtype=dtype))
+        # Résumé de la dernière session arrêtée : {"start", "end" (epoch), "duration" (min)} ou None
+        self.resumes = []
+        self.groupes = []  # Groupe de chaque console (salle, type de console...) ou None
+
+    def __len__(self):
+        return len(self.noms)
+
+    def __contains__(self, nom):
+        return nom in self.index
+
+    # --- Gestion des lignes ---
+    def ajouter(self, nom, intervalle=INTERVALLE_DEFAUT, groupe=None):
+        if nom in self.index:
+            raise KeyError(f"La console '{nom}' existe déjà.")
+        self.index[nom] = len(self.noms)
+        self.noms.append(nom)
+        for colonne, (dtype, defaut) in COLONNES.items():
+            setattr(self, colonne, np.append(getattr(self, colonne), np.array([defaut], dtype=dtype)))
+        self.intervalle[-1] = intervalle
+        self.resumes.append(None)
+        self.groupes.append(groupe)
+        return self.index[nom]
+
+    def supprimer(self, nom):
+        i = self.index.pop(nom)
+        del self.noms[i]
+        del self.resumes[i]
+        del self.groupes[i]
+        for colonne in COLONNES:
+            setattr(self, colonne, np.delete(getattr(self, colonne), i))
+        # Les consoles suivantes remontent d'une ligne
+        for j in range(i, len(self.noms)):
+            self.index[self.noms[j]] = j
+
+    # --- Calcul groupé ---
+    def calculer(self, maintenant):
+        # Un seul passage vectorisé pour toutes les consoles (maintenant en secondes epoch)
+        actif = self.statut == EN_COURS
+        en_cours = np.where(actif, (maintenant - self.debut) / 60, 0.0)
+        session = self.pause_cumulee + en_cours
+        total = self.cumul + session
+        intervalles = np.zeros(len(self.noms), dtype=np.int64)
+        valide = self.intervalle > 0
+        intervalles[valide] = np.floor(session[valide] / self.intervalle[valide])
+        # Met à jour le compteur d'intervalles comme le faisait la boucle d'affichage
+        self.nb_intervalles[:] = intervalles
+        return Calcul(en_cours, session, total, intervalles)
+
+    # --- Transitions d'état (maintenant en secondes epoch) ---
+    def demarrer(self, nom, maintenant):
+        i = self.index[nom]
+        self.debut[i] = maintenant
+        self.debut_initial[i] = maintenant  # Heure de début de la session globale
+        self.pause_cumulee[i] = 0.0
+        self.statut[i] = EN_COURS
+        self.nb_intervalles[i] = 0
+        self.resumes[i] = None  # Efface le résumé de la session précédente
+
+    def pause(self, nom, maintenant):
+        # Retourne le segment actif qui vient de se terminer : {"start", "end"} (epoch)
+        i = self.index[nom]
+        if self.statut[i] != EN_COURS:
+            return None
+        segment = {"start": float(self.debut[i]), "end": maintenant}
+        self.pause_cumulee[i] += (maintenant - self.debut[i]) / 60
+        self.debut[i] = math.nan
+        self.statut[i] = EN_PAUSE
+        return segment
+
+    def reprendre(self, nom, maintenant):
+        i = self.index[nom]
+        if self.statut[i] != EN_PAUSE:
+            return
+        self.debut[i] = maintenant
+        self.statut[i] = EN_COURS
+
+    def arreter(self, nom, maintenant):
+        # Retourne le résumé de la session, complété du nombre d'intervalles facturables
+        # et du dernier segment actif (None si la console était en pause)
+        i = self.index[nom]
+        if self.statut[i] == IDLE:
+            return None
+        duree = self.pause_cumulee[i]
+        segment = None
+        if self.statut[i] == EN_COURS:
+            duree += (maintenant - self.debut[i]) / 60
+            segment = {"start": float(self.debut[i]), "end": maintenant}
+        initial = self.debut_initial[i]
+        intervalle = int(self.intervalle[i])
+        resume = {
+            "start": maintenant if math.isnan(initial) else float(initial),
+            "end": maintenant,
+            "duration": float(duree),
+            "intervalle": intervalle,  # Intervalle en vigueur à l'arrêt : sert à tarifer la session
+        }
+        self.resumes[i] = resume
+        # Le cumul est remis à zéro à chaque arrêt
+        self.cumul[i] = 0
+        self.debut[i] = math.nan
+        self.pause_cumulee[i] = 0.0
+        self.statut[i] = IDLE
+        self.debut_initial[i] = math.nan
+        self.nb_intervalles[i] = 0
+        intervalles = math.floor(duree / intervalle) if intervalle > 0 else 0
+        return dict(resume, intervalles=intervalles, segment=segment, groupe=self.groupes[i])
+
+    def ajuster(self, nom, debut_reel, maintenant, intervalles=0):
+        # Session démarrée avant l'app : le temps déjà écoulé est pré-chargé comme du temps pausé
+        i = self.index[nom]
+        self.debut_initial[i] = debut_reel
+        self.debut[i] = maintenant
+        self.pause_cumulee[i] = (maintenant - debut_reel) / 60
+        self.nb_intervalles[i] = intervalles
+        self.statut[i] = EN_COURS
+        self.resumes[i] = None
+
+    def definir_intervalle(self, nom, intervalle):
+        self.intervalle[self.index[nom]] = intervalle
+
+    def definir_groupe(self, nom, groupe):
+        self.groupes[self.index[nom]] = groupe or None
+
+    def remettre_a_zero(self, nom):
+        # Retour à l'état d'une console neuve (intervalle et groupe conservés), sans archiver de session
+        i = self.index[nom]
+        for colonne, (_, defaut) in COLONNES.items():
+            if colonne != "intervalle":
+                getattr(self, colonne)[i] = defaut
+        self.resumes[i] = None
+
+    def recaler(self, decalage):
+        # L'heure de référence a été recalée de `decalage` secondes (voir horloge.py) : les sessions
+        # en cours sont décalées d'autant, leur durée mesurée ne change pas (les résumés gardent leurs dates)
+        actives = self.statut != IDLE
+        self.debut[actives] += decalage
+        self.debut_initial[actives] += decalage
+
+    def dernier_instant(self):
+        # Instant (epoch) le plus récent de l'état, None si aucun : plancher de l'horloge au démarrage
+        instants = [t for t in (np.nanmax(self.debut, initial=-math.inf), np.nanmax(self.debut_initial, initial=-math.inf))
+                    if t > -math.inf]
+        instants += [r["end"] for r in self.resumes if r]
+        return max(instants, default=None)
+
+    # --- Sélections pour les actions groupées ---
+    def consoles_du_groupe(self, groupe):
+        return [nom for nom, g in zip(self.noms, self.groupes) if g == groupe]
+
+    def liste_groupes(self):
+        return sorted({g for g in self.groupes if g})
+
+    def eligibles(self, op, noms):
+        # Consoles de `noms` pour lesquelles l'opération a un effet (ex: seules les consoles
+        # inactives sont démarrées, une session en cours n'est jamais redémarrée par un lot)
+        noms = [nom for nom in noms if nom in self.index]
+        statuts = self.statut[[self.index[nom] for nom in noms]]
+        if op == "demarrer":
+            garder = statuts == IDLE
+        elif op == "pause":
+            garder = statuts == EN_COURS
+        elif op == "reprendre":
+            garder = statuts == EN_PAUSE
+        elif op == "arreter":
+            garder = statuts != IDLE
+        elif op == "ajuster":
+            garder = statuts == IDLE  # Une session en cours n'est jamais écrasée par un ajustement
+        else:
+            return noms
+        return [nom for nom, g in zip(noms, garder) if g]
+
+    def copie(self):
+        # Copie indépendante (colonnes et listes) : sert de vue en lecture partagée entre sessions
+        autre = MoteurConsoles.__new__(MoteurConsoles)
+        autre.noms = list(self.noms)
+        autre.index = dict(self.index)
+        for colonne in COLONNES:
+            setattr(autre, colonne, getattr(self, colonne).copy())
+        autre.resumes = list(self.resumes)
+        autre.groupes = list(self.groupes)
+        return autre
+
+    def reinitialiser(self):
+        # Efface toutes les consoles (bouton "Réinitialiser TOUTES les consoles")
+        self.__init__()
+
+    # --- Application d'un événement ---
+    # Un événement est un petit dictionnaire sérialisable : {"op", "console", "t", ...paramètres}.
+    # C'est l'unité enregistrée dans le journal et rejouée au démarrage.
+    def appliquer(self, evt):
+        op = evt["op"]
+        if op == "ajouter":
+            return self.ajouter(evt["console"], evt.get("intervalle", INTERVALLE_DEFAUT), evt.get("groupe"))
+        if op == "supprimer":
+            return self.supprimer(evt["console"])
+        if op == "demarrer":
+            return self.demarrer(evt["console"], evt["t"])
+        if op == "pause":
+            return self.pause(evt["console"], evt["t"])
+        if op == "reprendre":
+            return self.reprendre(evt["console"], evt["t"])
+        if op == "arreter":
+            return self.arreter(evt["console"], evt["t"])
+        if op == "ajuster":
+            return self.ajuster(evt["console"], evt["debut_reel"], evt["t"], evt.get("intervalles", 0))
+        if op == "intervalle":
+            return self.definir_intervalle(evt["console"], evt["intervalle"])
+        if op == "groupe":
+            return self.definir_groupe(evt["console"], evt.get("groupe"))
+        if op == "remettre_a_zero":
+            return self.remettre_a_zero(evt["console"])
+        if op == "reinitialiser":
+            return self.reinitialiser()
+        if op == "recaler":
+            return self.recaler(evt["decalage"])
+        raise ValueError(f"Opération inconnue : {op}")
+
+    # --- Vue d'une console ---
+    def etat_console(self, nom):
+        i = self.index[nom]
+        debut = self.debut[i]
+        initial = self.debut_initial[i]
+        resume = self.resumes[i]
+        return {
+            "nom": nom,
+            "statut": int(self.statut[i]),
+            "cumul": float(self.cumul[i]),
+            "start": None if math.isnan(debut) else depuis_epoch(debut),
+            "paused_elapsed": float(self.pause_cumulee[i]),
+            "is_paused": bool(self.statut[i] == EN_PAUSE),
+            "interval": int(self.intervalle[i]),
+            "interval_count": int(self.nb_intervalles[i]),
+            "initial": None if math.isnan(initial) else depuis_epoch(initial),
+            "group": self.groupes[i],
+            "summary": None if resume is None else {
+                "start": depuis_epoch(resume["start"]),
+                "end": depuis_epoch(resume["end"]),
+                "duration": resume["duration"],
+            },
+        }
+
+    # --- Conversion vers/depuis le format de console_data.json ---
+    def vers_etat(self):
+        return {
+            "consoles": {n: _nombre(self.cumul[i]) for i, n in enumerate(self.noms)},
+            "start_times": {n: _epoch_vers_iso(self.debut[i]) for i, n in enumerate(self.noms)},
+            "paused_elapsed": {n: float(self.pause_cumulee[i]) for i, n in enumerate(self.noms)},
+            "is_paused": {n: bool(self.statut[i] == EN_PAUSE) for i, n in enumerate(self.noms)},
+            "intervals": {n: int(self.intervalle[i]) for i, n in enumerate(self.noms)},
+            "interval_counts": {n: int(self.nb_intervalles[i]) for i, n in enumerate(self.noms)},
+            "session_initial_start": {n: _epoch_vers_iso(self.debut_initial[i]) for i, n in enumerate(self.noms)},
+            "last_stop_summary": {
+                n: {
+                    "start": depuis_epoch(r["start"]).isoformat(),
+                    "end": depuis_epoch(r["end"]).isoformat(),
+                    "duration": r["duration"],
+                    "interval": r.get("intervalle"),
+                } if r else None
+                for n, r in zip(self.noms, self.resumes)
+            },
+            "groups": dict(zip(self.noms, self.groupes)),
+        }
+
+    @classmethod
+    def depuis_etat(cls, data):
+        moteur = cls()
+        consoles = data.get("consoles", {})
+        n = len(consoles)
+        moteur.noms = list(consoles.keys())
+        moteur.index = {nom: i for i, nom in enumerate(moteur.noms)}
+
+        start_times = data.get("start_times", {})
+        paused = data.get("paused_elapsed", {})
+        is_paused = data.get("is_paused", {})
+        intervals = data.get("intervals", {})
+        counts = data.get("interval_counts", {})
+        initial = data.get("session_initial_start", {})
+        summaries = data.get("last_stop_summary", {})
+        groups = data.get("groups", {})
+
+        # Les valeurs manquantes prennent les mêmes défauts que l'ancien load_state()
+        moteur.cumul = np.fromiter((consoles[k] or 0 for k in moteur.noms), np.float64, n)
+        moteur.debut = np.fromiter((_iso_vers_epoch(start_times.get(k)) for k in moteur.noms), np.float64, n)
+        moteur.pause_cumulee = np.fromiter((paused.get(k) or 0.0 for k in moteur.noms), np.float64, n)
+        moteur.intervalle = np.fromiter((intervals.get(k, INTERVALLE_DEFAUT) for k in moteur.noms), np.int64, n)
+        moteur.nb_intervalles = np.fromiter((counts.get(k, 0) for k in moteur.noms), np.int64, n)
+        moteur.debut_initial = np.fromiter((_iso_vers_epoch(initial.get(k)) for k in moteur.noms), np.float64, n)
+        en_pause = np.fromiter((bool(is_paused.get(k, False)) for k in moteur.noms), bool, n)
+        moteur.statut = np.where(en_pause, EN_PAUSE, np.where(np.isnan(moteur.debut), IDLE, EN_COURS)).astype(np.int8)
+        moteur.debut[en_pause] = math.nan
+
+        moteur.resumes = []
+        for k in moteur.noms:
+            v = summaries.get(k)
+            if v and isinstance(v, dict) and "start" in v and "end" in v and "duration" in v:
+                resume = {
+                    "start": _iso_vers_epoch(v["start"]),
+                    "end": _iso_vers_epoch(v["end"]),
+                    "duration": v["duration"],
+                }
+                if v.get("interval"):  # Absent des sauvegardes antérieures
+                    resume["intervalle"] = int(v["interval"])
+                moteur.resumes.append(resume)
+            else:
+                moteur.resumes.append(None)
+        moteur.groupes = [groups.get(k) or None for k in moteur.noms]
+        return moteur
+
+
+def _nombre(valeur):
+    # Garde un entier dans le JSON quand le cumul n'a pas de partie décimale (ex: 0)
+    valeur = float(valeur)
+    return int(valeur) if valeur.is_integer() else valeur
@@ -0,0 +1,170 @@
+import heapq
+import json
+import math
+import threading
+import urllib.request
+from collections import deque
+
+from horloge import maintenant
+from moteur_timer import EN_COURS
+
+# --- Planificateur d'Intervalles ---
+# Un tas (file de priorité) contient, pour chaque console en cours, l'instant exact de sa
+# prochaine fin d'intervalle. Un thread dort jusqu'à la plus proche échéance, déclenche
+# l'événement (compteur d'intervalles, rappels, webhook) puis replanifie cette console seule.
+# Les transitions (Start, Pause, Stop, intervalle...) invalident l'entrée de la console via un
+# numéro de génération : le coût suit le nombre d'événements, pas consoles × rafraîchissements.
+
+RESYNCHRONISATION = 5.0  # Secondes entre deux vérifications des écritures d'autres processus
+
+
+class PlanificateurIntervalles:
+    def __init__(self, magasin, webhook=None, resynchronisation=RESYNCHRONISATION):
+        self.magasin = magasin
+        self.webhook = webhook  # URL locale recevant un POST JSON à chaque intervalle complété
+        self.resynchronisation = resynchronisation
+        self.tas = []  # (échéance epoch, génération, console, numéro d'intervalle)
+        self.generations = {}
+        self.condition = threading.Condition()
+        self.rappels = []  # Fonctions appelées avec chaque notification (son, affichage...)
+        self.notifications = deque(maxlen=200)  # Dernières notifications, lues par l'interface
+        self.numero = 0  # Numéro de la dernière notification émise
+        self.version_planifiee = None
+        self.actif = True
+        self.thread = threading.Thread(target=self._boucle, name="planificateur-intervalles", daemon=True)
+        self.tout_planifier()
+        self.thread.start()
+
+    def ajouter_rappel(self, fonction):
+        self.rappels.append(fonction)
+
+    def arreter(self):
+        with self.condition:
+            self.actif = False
+            self.condition.notify()
+
+    # --- Planification ---
+    def _prochaine_echeance(self, moteur, console, minimum=1):
+        # Instant (epoch) où la session atteindra le prochain multiple de son intervalle
+        # (`minimum` évite de redéclencher un intervalle déjà notifié à cause des arrondis)
+        i = moteur.index.get(console)
+        if i is None or moteur.statut[i] != EN_COURS or moteur.intervalle[i] <= 0:
+            return None
+        intervalle = int(moteur.intervalle[i])
+        session = moteur.pause_cumulee[i] + (maintenant() - moteur.debut[i]) / 60
+        numero = max(math.floor(session / intervalle) + 1, minimum)
+        echeance = moteur.debut[i] + (numero * intervalle - moteur.pause_cumulee[i]) * 60
+        return float(echeance), numero
+
+    def _planifier(self, moteur, console, minimum=1):
+        # Appelé sous self.condition : invalide l'échéance précédente de la console
+        generation = self.generations.get(console, 0) + 1
+        self.generations[console] = generation
+        prochaine = self._prochaine_echeance(moteur, console, minimum)
+        if prochaine is not None:
+            heapq.heappush(self.tas, (prochaine[0], generation, console, prochaine[1]))
+
+    def replanifier(self, consoles, minimums=None):
+        with self.magasin.verrou:
+            moteur = self.magasin.moteur
+            with self.condition:
+                for console in consoles:
+                    self._planifier(moteur, console, (minimums or {}).get(console, 1))
+                self.version_planifiee = self.magasin.version
+                self.condition.notify()
+
+    def tout_planifier(self):
+        with self.magasin.verrou:
+            moteur = self.magasin.moteur
+            with self.condition:
+                self.tas = []
+                self.generations = {}
+                for console in moteur.noms:
+                    self._planifier(moteur, console)
+                self.version_planifiee = self.magasin.version
+                self.condition.notify()
+
+    def ecouter(self, evts, resultats):
+        # Abonné du magasin d'état : seules les consoles touchées par la transaction sont replanifiées
+        if any(evt["op"] in ("reinitialiser", "recaler") for evt in evts):
+            self.tout_planifier()
+        else:
+            self.replanifier({evt["console"] for evt in evts if evt.get("console") is not None})
+
+    # --- Boucle de déclenchement ---
+    def _boucle(self):
+        prochaine_synchro = maintenant() + self.resynchronisation
+        while True:
+            with self.condition:
+                if not self.actif:
+                    return
+                instant = maintenant()
+                echeance = self.tas[0][0] if self.tas else math.inf
+                if echeance > instant:
+                    self.condition.wait(min(echeance, prochaine_synchro) - instant)
+                    dues = []
+                else:
+                    dues = []
+                    while self.tas and self.tas[0][0] <= instant:
+                        entree = heapq.heappop(self.tas)
+                        if self.generations.get(entree[2]) == entree[1]:
+                            dues.append(entree)
+            if dues:
+                self._declencher(dues)
+            if maintenant() >= prochaine_synchro:
+                prochaine_synchro = maintenant() + self.resynchronisation
+                self._resynchroniser()
+
+    def _resynchroniser(self):
+        # Les actions faites par un autre processus (API, autre serveur) n'appellent pas ecouter() :
+        # on vérifie simplement si la version a bougé, ce qui ne coûte qu'un stat du journal.
+        # C'est aussi le moment de suivre une correction de l'heure du système (voir horloge.py).
+        self.magasin.recaler_horloge()
+        self.magasin.vue()
+        if self.magasin.version != self.version_planifiee:
+            self.tout_planifier()
+
+    def _declencher(self, dues):
+        notifications = []
+        with self.magasin.verrou:
+            moteur = self.magasin.moteur
+            for echeance, _, console, numero in dues:
+                i = moteur.index.get(console)
+                if i is None:
+                    continue
+                moteur.nb_intervalles[i] = numero
+                notifications.append({
+                    "console": console,
+                    "intervalles": numero,
+                    "intervalle_min": int(moteur.intervalle[i]),
+                    "echeance": echeance,
+                })
+        self.replanifier(
+            [notification["console"] for notification in notifications],
+            {notification["console"]: notification["intervalles"] + 1 for notification in notifications},
+        )
+        for notification in notifications:
+            self.numero += 1
+            notification["numero"] = self.numero
+            self.notifications.append(notification)
+            for rappel in self.rappels:
+                rappel(notification)
+            if self.webhook:
+                threading.Thread(target=self._envoyer, args=(notification,), daemon=True).start()
+
+    def _envoyer(self, notification):
+        requete = urllib.request.Request(
+            self.webhook, data=json.dumps(notification).encode(),
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        try:
+            urllib.request.urlopen(requete, timeout=5).close()
+        except OSError:
+            pass  # Le webhook est un simple relais local : une panne ne doit pas bloquer les timers
+
+    def depuis(self, numero):
+        # Notifications émises après `numero` (pour les toasts de chaque session).
+        # Appelé à chaque tick live de chaque session : cas courant sans nouveauté traité sans copie.
+        if numero >= self.numero:
+            return []
+        return [n for n in list(self.notifications) if n["numero"] > numero]
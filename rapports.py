@@ -0,0 +1,313 @@
+import argparse
+import math
+import sqlite3
+from collections import namedtuple
+from datetime import date, datetime, time as heure_du_jour, timedelta
+
+import numpy as np
+import pandas as pd
+
+from historique import DB_FILE
+from moteur_timer import FUSEAU, depuis_epoch
+
+# --- Rapports d'Utilisation ---
+# Lit les sessions terminées de l'historique SQLite par blocs (jamais la table entière en mémoire)
+# et calcule, de façon vectorisée : par console, par jour et par heure, les minutes occupées, le
+# taux d'occupation, les sessions et intervalles facturables, et le pic de consoles simultanées.
+# Les exports Parquet (ParquetWriter, un groupe de lignes par bloc) et Excel (xlsxwriter en mode
+# constant_memory) sont écrits au fil de la lecture : la mémoire reste stable sur un gros historique.
+#   python rapports.py --depuis 2026-09-01 --jusqu-au 2026-09-30 --xlsx septembre.xlsx --parquet septembre.parquet
+
+TAILLE_BLOC = 50_000  # Sessions lues par bloc
+DUREE_MAX_SESSION = 86400  # Une session commencée plus d'un jour avant la période n'est pas cherchée
+LIGNES_MAX_EXCEL = 1_048_575  # Limite d'une feuille Excel (hors en-tête)
+ORIGINE_EXCEL = pd.Timestamp("1899-12-30")
+
+Rapport = namedtuple("Rapport", ["par_console", "par_jour", "par_heure", "profil_horaire", "pics", "resume"])
+
+
+def _bornes(depuis_jour=None, jusqu_au_jour=None):
+    # Jours "AAAA-MM-JJ" inclus (heure locale) -> [début, fin[ en secondes epoch
+    debut = -math.inf
+    fin = math.inf
+    if depuis_jour is not None:
+        debut = datetime.combine(date.fromisoformat(depuis_jour), heure_du_jour(), FUSEAU).timestamp()
+    if jusqu_au_jour is not None:
+        lendemain = date.fromisoformat(jusqu_au_jour) + timedelta(days=1)
+        fin = datetime.combine(lendemain, heure_du_jour(), FUSEAU).timestamp()
+    return debut, fin
+
+
+def _heure_locale(t):
+    # Secondes epoch -> dates et heures locales (sans fuseau) pour les regroupements
+    return pd.to_datetime(np.asarray(t), unit="s", utc=True).tz_convert(FUSEAU).tz_localize(None)
+
+
+def lire_sessions(chemin_db=DB_FILE, depuis_jour=None, jusqu_au_jour=None, taille_bloc=TAILLE_BLOC):
+    # Blocs (DataFrame console, debut, fin, duree, intervalles, duree_intervalle, groupe) des sessions
+    # qui chevauchent la période, triés par début. Connexion en lecture seule : l'interface continue
+    # d'écrire (WAL), et une base pas encore migrée donne NULL pour les colonnes récentes.
+    debut, fin = _bornes(depuis_jour, jusqu_au_jour)
+    connexion = sqlite3.connect(f"file:{chemin_db}?mode=ro", uri=True)
+    try:
+        existantes = {ligne[1] for ligne in connexion.execute("PRAGMA table_info(sessions)")}
+        recentes = ", ".join(c if c in existantes else f"NULL AS {c}" for c in ("duree_intervalle", "groupe"))
+        yield from pd.read_sql_query(
+            f"SELECT console, debut, fin, duree, intervalles, {recentes} FROM sessions "
+            "WHERE type = 'session' AND debut >= ? AND debut < ? AND fin > ? ORDER BY debut",
+            connexion, params=(debut - DUREE_MAX_SESSION, fin, debut), chunksize=taille_bloc,
+        )
+    finally:
+        connexion.close()
+
+
+def _decouper_par_heure(debut, fin):
+    # Découpe chaque session [debut, fin[ en morceaux d'une heure pleine :
+    # retourne (numéro de session, heure epoch // 3600, minutes occupées dans cette heure).
+    # Le fuseau de Madagascar étant décalé d'heures entières, les heures UTC sont aussi des heures locales.
+    h0 = np.floor(debut / 3600).astype(np.int64)
+    h1 = np.ceil(fin / 3600).astype(np.int64)
+    nombre = h1 - h0
+    session = np.repeat(np.arange(len(debut)), nombre)
+    rang = np.arange(nombre.sum()) - np.repeat(np.cumsum(nombre) - nombre, nombre)
+    heures = h0[session] + rang
+    minutes = (np.minimum(fin[session], (heures + 1) * 3600.0) - np.maximum(debut[session], heures * 3600.0)) / 60
+    return session, heures, minutes
+
+
+class _Concurrence:
+    # Balayage des débuts (+1) et fins (-1) de sessions, bloc par bloc. Les blocs arrivant triés
+    # par début, tout événement antérieur au dernier début du bloc est définitif ; les sessions
+    # encore ouvertes sont reportées au bloc suivant.
+    def __init__(self):
+        self.ouvertes = np.empty(0)  # Fins des sessions commencées et pas encore terminées
+        self.pics = []
+
+    def ajouter(self, debuts, fins):
+        if not len(debuts):
+            return
+        coupure = debuts[-1]
+        niveau = len(self.ouvertes)
+        toutes_fins = np.concatenate([self.ouvertes, fins])
+        finies = toutes_fins[toutes_fins <= coupure]
+        self.ouvertes = toutes_fins[toutes_fins > coupure]
+        instants = np.concatenate([finies, debuts])
+        deltas = np.concatenate([np.full(len(finies), -1), np.ones(len(debuts), dtype=np.int64)])
+        ordre = np.lexsort((deltas, instants))  # À instant égal, les fins passent avant les débuts
+        bloc = pd.DataFrame({"instant": instants[ordre], "niveau": niveau + np.cumsum(deltas[ordre])})
+        bloc["jour"] = _heure_locale(bloc["instant"]).normalize()
+        self.pics.append(bloc.loc[bloc.groupby("jour")["niveau"].idxmax()])
+
+    def resultat(self):
+        if not self.pics:
+            return pd.DataFrame({"jour": [], "pic_simultanees": [], "heure_pic": []})
+        pics = pd.concat(self.pics, ignore_index=True)
+        pics = pics.loc[pics.groupby("jour")["niveau"].idxmax()].sort_values("jour")
+        return pd.DataFrame({
+            "jour": pics["jour"].dt.strftime("%Y-%m-%d").to_numpy(),
+            "pic_simultanees": pics["niveau"].to_numpy(),
+            "heure_pic": _heure_locale(pics["instant"]).strftime("%H:%M:%S"),
+        })
+
+
+def calculer_rapport(chemin_db=DB_FILE, depuis_jour=None, jusqu_au_jour=None, nb_consoles=None, taille_bloc=TAILLE_BLOC):
+    # Les sessions à cheval sur la période sont coupées aux bornes. Le taux d'occupation est
+    # rapporté à `nb_consoles` (par défaut : nombre de consoles présentes dans la période).
+    debut_periode, fin_periode = _bornes(depuis_jour, jusqu_au_jour)
+    par_console, par_jour, par_heure = [], [], []
+    concurrence = _Concurrence()
+    consoles = set()
+    premier = dernier = None
+    for bloc in lire_sessions(chemin_db, depuis_jour, jusqu_au_jour, taille_bloc):
+        debut = np.maximum(bloc["debut"].to_numpy(), debut_periode)
+        fin = np.minimum(bloc["fin"].to_numpy(), fin_periode)
+        bloc = bloc[fin > debut]
+        debut, fin = debut[fin > debut], fin[fin > debut]
+        if not len(bloc):
+            continue
+        consoles.update(bloc["console"].unique())
+        premier = debut[0] if premier is None else premier
+        dernier = fin.max() if dernier is None else max(dernier, fin.max())
+
+        # Sessions et intervalles comptés sur le jour de début (comme cumul_jour)
+        commence = bloc["debut"].to_numpy() >= debut_periode
+        sessions = bloc[commence].assign(jour=_heure_locale(bloc.loc[commence, "debut"]).strftime("%Y-%m-%d"))
+        par_console.append(sessions.groupby("console").agg(nb_sessions=("duree", "size"), intervalles=("intervalles", "sum")))
+        par_jour.append(sessions.groupby("jour").agg(nb_sessions=("duree", "size"), intervalles=("intervalles", "sum")))
+
+        # Minutes occupées, réparties heure par heure (une session de 23h à 1h compte sur deux jours)
+        numero, heures, minutes = _decouper_par_heure(debut, fin)
+        locales = _heure_locale(heures * 3600)
+        morceaux = pd.DataFrame({
+            "console": bloc["console"].to_numpy()[numero],
+            "jour": locales.strftime("%Y-%m-%d"),
+            "heure": locales.hour,
+            "minutes": minutes,
+        })
+        par_heure.append(morceaux.groupby(["console", "jour", "heure"], as_index=False)["minutes"].sum())
+        concurrence.ajouter(debut, fin)
+
+    nb_consoles = nb_consoles or max(len(consoles), 1)
+    occupation = (pd.concat(par_heure).groupby(["console", "jour", "heure"], as_index=False)["minutes"].sum()
+                  if par_heure else pd.DataFrame(columns=["console", "jour", "heure", "minutes"]))
+    nb_jours = occupation["jour"].nunique() or 1
+    if math.isfinite(debut_periode) and math.isfinite(fin_periode):
+        nb_jours = round((fin_periode - debut_periode) / 86400)
+
+    def _cumul(parties):
+        if not parties:
+            return pd.DataFrame(columns=["nb_sessions", "intervalles"])
+        return pd.concat(parties).groupby(level=0).sum()
+
+    console = occupation.groupby("console")["minutes"].sum().to_frame().join(_cumul(par_console), how="outer").fillna(0)
+    console["taux_occupation"] = console["minutes"] / (nb_jours * 1440)
+    jour = occupation.groupby("jour")["minutes"].sum().to_frame().join(_cumul(par_jour), how="outer").fillna(0)
+    jour["taux_occupation"] = jour["minutes"] / (nb_consoles * 1440)
+    pics = concurrence.resultat()
+    jour = jour.join(pics.set_index("jour"), how="left")
+    heure = occupation.groupby(["jour", "heure"], as_index=False)["minutes"].sum()
+    heure["taux_occupation"] = heure["minutes"] / (nb_consoles * 60)
+    profil = heure.groupby("heure")["minutes"].sum().reindex(range(24), fill_value=0).to_frame()
+    profil["taux_occupation"] = profil["minutes"] / (nb_consoles * 60 * nb_jours)
+
+    pic_global = pics.loc[pics["pic_simultanees"].idxmax()] if len(pics) else None
+    resume = {
+        "depuis": depuis_jour or (None if premier is None else depuis_epoch(premier).strftime("%Y-%m-%d")),
+        "jusqu_au": jusqu_au_jour or (None if dernier is None else depuis_epoch(dernier).strftime("%Y-%m-%d")),
+        "nb_consoles": nb_consoles,
+        "nb_jours": nb_jours,
+        "nb_sessions": int(console["nb_sessions"].sum()),
+        "minutes": float(console["minutes"].sum()),
+        "intervalles": int(console["intervalles"].sum()),
+        "taux_occupation": float(console["minutes"].sum() / (nb_consoles * nb_jours * 1440)),
+        "pic_simultanees": None if pic_global is None else int(pic_global["pic_simultanees"]),
+        "pic_le": None if pic_global is None else f"{pic_global['jour']} {pic_global['heure_pic']}",
+    }
+    for table in (console, jour):
+        table[["nb_sessions", "intervalles"]] = table[["nb_sessions", "intervalles"]].astype(np.int64)
+    return Rapport(
+        par_console=console.sort_values("minutes", ascending=False).rename_axis("console").reset_index(),
+        par_jour=jour.rename_axis("jour").reset_index(),
+        par_heure=heure,
+        profil_horaire=profil.rename_axis("heure").reset_index(),
+        pics=pics,
+        resume=resume,
+    )
+
+
+# --- Exports ---
+def _sessions_locales(bloc):
+    # Colonnes exportées : instants en heure locale, jour de début
+    # (à la microseconde près : précision de Parquet "us" et des dates Python pour Excel)
+    debut = _heure_locale(bloc["debut"]).floor("us")
+    return pd.DataFrame({
+        "console": bloc["console"].to_numpy(),
+        "debut": debut,
+        "fin": _heure_locale(bloc["fin"]).floor("us"),
+        "jour": debut.strftime("%Y-%m-%d"),
+        "duree_min": bloc["duree"].to_numpy(),
+        "intervalles": bloc["intervalles"].to_numpy(),
+    })
+
+
+def exporter_parquet(sortie, chemin_db=DB_FILE, depuis_jour=None, jusqu_au_jour=None, taille_bloc=TAILLE_BLOC):
+    # Sessions brutes de la période, un groupe de lignes Parquet par bloc lu. Retourne le nombre de lignes.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("console", pa.string()),
+        ("debut", pa.timestamp("us")),
+        ("fin", pa.timestamp("us")),
+        ("jour", pa.string()),
+        ("duree_min", pa.float64()),
+        ("intervalles", pa.int64()),
+    ])
+    lignes = 0
+    with pq.ParquetWriter(sortie, schema, compression="zstd") as ecrivain:
+        for bloc in lire_sessions(chemin_db, depuis_jour, jusqu_au_jour, taille_bloc):
+            ecrivain.write_table(pa.Table.from_pandas(_sessions_locales(bloc), schema=schema, preserve_index=False))
+            lignes += len(bloc)
+    return lignes
+
+
+def _feuille(classeur, nom, table, formats):
+    feuille = classeur.add_worksheet(nom)
+    feuille.write_row(0, 0, list(table.columns), formats["entete"])
+    for ligne, valeurs in enumerate(table.itertuples(index=False), start=1):
+        feuille.write_row(ligne, 0, [None if isinstance(v, float) and math.isnan(v) else v for v in valeurs])
+    feuille.set_column(0, len(table.columns) - 1, 16)
+    return feuille
+
+
+def exporter_excel(sortie, rapport, chemin_db=DB_FILE, sessions=True, taille_bloc=TAILLE_BLOC):
+    # Classeur de synthèse (et, en option, la liste des sessions lue par blocs). En mode
+    # constant_memory, chaque ligne est écrite sur disque dès que la suivante commence.
+    # `sortie` : chemin ou fichier binaire (io.BytesIO pour un téléchargement).
+    import xlsxwriter
+
+    classeur = xlsxwriter.Workbook(sortie, {"constant_memory": True})
+    formats = {"entete": classeur.add_format({"bold": True, "bg_color": "#DDEBF7"})}
+    synthese = classeur.add_worksheet("Synthèse")
+    for ligne, (cle, valeur) in enumerate(rapport.resume.items()):
+        synthese.write(ligne, 0, cle, formats["entete"])
+        synthese.write(ligne, 1, valeur)
+    synthese.set_column(0, 1, 22)
+    _feuille(classeur, "Par console", rapport.par_console, formats)
+    _feuille(classeur, "Par jour", rapport.par_jour, formats)
+    _feuille(classeur, "Par heure", rapport.par_heure, formats)
+    _feuille(classeur, "Profil horaire", rapport.profil_horaire, formats)
+
+    if sessions:
+        feuille = classeur.add_worksheet("Sessions")
+        colonnes = ["console", "debut", "fin", "jour", "duree_min", "intervalles"]
+        feuille.write_row(0, 0, colonnes, formats["entete"])
+        format_date = classeur.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+        feuille.set_column(0, len(colonnes) - 1, 20)
+        ligne = 0
+        for bloc in lire_sessions(chemin_db, rapport.resume["depuis"], rapport.resume["jusqu_au"], taille_bloc):
+            locales = _sessions_locales(bloc)
+            # Dates converties d'un coup en numéros de série Excel (jours depuis le 30/12/1899)
+            series_debut = ((locales["debut"] - ORIGINE_EXCEL) / pd.Timedelta(days=1)).tolist()
+            series_fin = ((locales["fin"] - ORIGINE_EXCEL) / pd.Timedelta(days=1)).tolist()
+            for console, debut, fin, jour, duree, intervalles in zip(
+                locales["console"].tolist(), series_debut, series_fin, locales["jour"].tolist(),
+                locales["duree_min"].tolist(), locales["intervalles"].tolist(),
+            ):
+                ligne += 1
+                if ligne > LIGNES_MAX_EXCEL:
+                    break
+                feuille.write_string(ligne, 0, console)
+                feuille.write_number(ligne, 1, debut, format_date)
+                feuille.write_number(ligne, 2, fin, format_date)
+                feuille.write_string(ligne, 3, jour)
+                feuille.write_number(ligne, 4, duree)
+                feuille.write_number(ligne, 5, intervalles)
+            if ligne > LIGNES_MAX_EXCEL:
+                # Au-delà de la limite d'Excel, l'export Parquet contient toutes les lignes
+                feuille.write_string(LIGNES_MAX_EXCEL, 0, "… tronqué, voir l'export Parquet")
+                break
+    classeur.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rapport d'utilisation des consoles (historique SQLite)")
+    parser.add_argument("--historique", default=DB_FILE)
+    parser.add_argument("--depuis", help="Premier jour inclus (AAAA-MM-JJ)")
+    parser.add_argument("--jusqu-au", dest="jusqu_au", help="Dernier jour inclus (AAAA-MM-JJ)")
+    parser.add_argument("--consoles", type=int, help="Nombre de consoles du parc (base du taux d'occupation)")
+    parser.add_argument("--xlsx", help="Classeur Excel à écrire")
+    parser.add_argument("--sans-sessions", action="store_true", help="Excel : synthèses seulement")
+    parser.add_argument("--parquet", help="Sessions brutes au format Parquet")
+    parser.add_argument("--taille-bloc", type=int, default=TAILLE_BLOC)
+    args = parser.parse_args()
+
+    rapport = calculer_rapport(args.historique, args.depuis, args.jusqu_au, args.consoles, args.taille_bloc)
+    for cle, valeur in rapport.resume.items():
+        print(f"{cle:>16} : {valeur}")
+    if args.xlsx:
+        exporter_excel(args.xlsx, rapport, args.historique, not args.sans_sessions, args.taille_bloc)
+        print(f"Classeur écrit dans {args.xlsx}")
+    if args.parquet:
+        lignes = exporter_parquet(args.parquet, args.historique, args.depuis, args.jusqu_au, args.taille_bloc)
+        print(f"{lignes} session(s) écrites dans {args.parquet}")
@@ -0,0 +1,206 @@
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+
+from moteur_timer import COLONNES, MoteurConsoles
+
+# --- Snapshot Binaire ---
+# Alternative à console_data.json pour les parcs de milliers de consoles :
+#   en-tête | un enregistrement de taille fixe par console | table des noms | table des groupes
+# Les instants sont des secondes epoch (float64, NaN = absent), le statut un octet, et chaque
+# enregistrement référence son nom par un numéro dans la table des noms (décodée une seule fois).
+# Le chargement passe par np.memmap : aucune analyse JSON ni conversion de date, les colonnes
+# du moteur sont recopiées telles quelles. Un enregistrement peut être réécrit sur place.
+# Chaque enregistrement porte la version (seq) de sa console : au rejeu, le journal ignore les
+# transactions déjà présentes dans l'enregistrement, ce qui rend la mise à jour sur place sûre
+# même si une coupure survient avant la mise à jour de l'en-tête.
+
+MAGIQUE = b"SUIVTMP1"
+VERSION_FORMAT = 2  # 2 : intervalle du résumé de la dernière session
+
+ENTETE = np.dtype([
+    ("magique", "S8"),
+    ("version_format", "<u4"),
+    ("nb", "<u4"),             # Nombre de consoles
+    ("journal_seq", "<u8"),    # Dernière transaction incluse dans le snapshot
+])
+
+ENREGISTREMENT = np.dtype([
+    ("nom", "<u4"),            # Numéro du nom dans la table des noms
+    ("statut", "i1"),
+    ("reserve", "V1"),
+    ("groupe", "<u2"),         # 0 = aucun groupe, sinon numéro (à partir de 1) dans la table des groupes
+    ("cumul", "<f8"),
+    ("debut", "<f8"),
+    ("pause_cumulee", "<f8"),
+    ("intervalle", "<i8"),
+    ("nb_intervalles", "<i8"),
+    ("debut_initial", "<f8"),
+    ("resume_debut", "<f8"),   # Résumé de la dernière session (NaN si aucun)
+    ("resume_fin", "<f8"),
+    ("resume_duree", "<f8"),
+    ("version", "<i8"),        # Seq de la dernière transaction ayant modifié la console
+    ("resume_intervalle", "<i8"),  # Intervalle (min) en vigueur à l'arrêt, 0 si inconnu
+])
+
+# Enregistrements par version de format : les fichiers plus anciens restent lisibles et sont
+# réécrits au format actuel à la compaction suivante (jamais mis à jour sur place)
+ENREGISTREMENTS = {1: np.dtype(ENREGISTREMENT.descr[:-1]), VERSION_FORMAT: ENREGISTREMENT}
+
+
+def _table(textes):
+    # Table de chaînes : nombre, décalages (octets) puis textes UTF-8 mis bout à bout
+    octets = [texte.encode() for texte in textes]
+    decalages = np.zeros(len(octets) + 1, dtype="<u4")
+    decalages[1:] = np.cumsum([len(o) for o in octets])
+    return decalages.tobytes() + b"".join(octets)
+
+
+def _lire_table(contenu, nombre, chemin):
+    # Retourne (textes, octets consommés)
+    decalages = np.frombuffer(contenu[:(nombre + 1) * 4], dtype="<u4").tolist()
+    if len(decalages) != nombre + 1:
+        raise ValueError(f"{chemin} : table de chaînes tronquée")
+    debut = (nombre + 1) * 4
+    blob = contenu[debut:debut + decalages[-1]]
+    if len(blob) != decalages[-1]:
+        raise ValueError(f"{chemin} : table de chaînes tronquée")
+    return [blob[decalages[k]:decalages[k + 1]].decode() for k in range(nombre)], debut + decalages[-1]
+
+
+def _enregistrements(moteur, versions, indices, numeros_groupes):
+    lignes = np.zeros(len(indices), dtype=ENREGISTREMENT)
+    lignes["nom"] = indices
+    lignes["groupe"] = [numeros_groupes.get(moteur.groupes[i], 0) for i in indices]
+    for colonne in COLONNES:
+        lignes[colonne] = getattr(moteur, colonne)[indices]
+    resumes = [moteur.resumes[i] for i in indices]
+    lignes["resume_debut"] = [math.nan if r is None else r["start"] for r in resumes]
+    lignes["resume_fin"] = [math.nan if r is None else r["end"] for r in resumes]
+    lignes["resume_duree"] = [math.nan if r is None else r["duration"] for r in resumes]
+    lignes["resume_intervalle"] = [0 if r is None else r.get("intervalle", 0) for r in resumes]
+    lignes["version"] = [versions.get(moteur.noms[i], 0) for i in indices]
+    return lignes
+
+
+def encoder(moteur, journal_seq=0, versions=None):
+    # Contenu complet du fichier (écrit ensuite de façon atomique par le journal)
+    n = len(moteur)
+    entete = np.zeros(1, dtype=ENTETE)
+    entete["magique"] = MAGIQUE
+    entete["version_format"] = VERSION_FORMAT
+    entete["nb"] = n
+    entete["journal_seq"] = journal_seq
+    groupes = moteur.liste_groupes()
+    numeros_groupes = {groupe: k + 1 for k, groupe in enumerate(groupes)}
+    enregistrements = _enregistrements(moteur, versions or {}, np.arange(n), numeros_groupes)
+    return (entete.tobytes() + enregistrements.tobytes() + _table(moteur.noms)
+            + np.array([len(groupes)], dtype="<u4").tobytes() + _table(groupes))
+
+
+def _ouvrir(chemin, mode="r"):
+    # En-tête et enregistrements projetés en mémoire ; ValueError si le fichier n'est pas un snapshot
+    entete = np.memmap(chemin, dtype=ENTETE, mode=mode, shape=(1,))
+    dtype = ENREGISTREMENTS.get(int(entete["version_format"][0]))
+    if entete["magique"][0] != MAGIQUE or dtype is None:
+        raise ValueError(f"{chemin} n'est pas un snapshot binaire (format {VERSION_FORMAT})")
+    if mode != "r" and dtype != ENREGISTREMENT:
+        raise ValueError(f"{chemin} : ancien format, réécriture complète nécessaire")
+    n = int(entete["nb"][0])
+    if os.path.getsize(chemin) < ENTETE.itemsize + n * dtype.itemsize + (n + 1) * 4:
+        raise ValueError(f"{chemin} est tronqué")
+    enregistrements = np.memmap(chemin, dtype=dtype, mode=mode, offset=ENTETE.itemsize, shape=(n,))
+    return entete, enregistrements
+
+
+def lire(chemin):
+    # Retourne (moteur, journal_seq, versions)
+    entete, enregistrements = _ouvrir(chemin)
+    n = len(enregistrements)
+    debut_noms = ENTETE.itemsize + n * enregistrements.dtype.itemsize
+    with open(chemin, "rb") as f:
+        f.seek(debut_noms)
+        contenu = f.read()
+    table_noms, fin = _lire_table(contenu, n, chemin)
+    table_groupes = [None]
+    if len(contenu) > fin:  # Les fichiers écrits avant l'ajout des groupes s'arrêtent aux noms
+        nb_groupes = int(np.frombuffer(contenu[fin:fin + 4], dtype="<u4")[0])
+        table_groupes += _lire_table(contenu[fin + 4:], nb_groupes, chemin)[0]
+    # Une seule copie des enregistrements hors de la projection (l'accès élément par élément
+    # à un memmap est lent) ; seules les colonnes creuses (résumés, versions) sont parcourues
+    lignes = np.array(enregistrements)
+    # Enregistrement abîmé ou réécrit à moitié : numéro hors des tables (non signés, jamais négatifs)
+    if n and (int(lignes["nom"].max()) >= len(table_noms) or int(lignes["groupe"].max()) >= len(table_groupes)):
+        raise ValueError(f"{chemin} : numéro de nom ou de groupe hors des tables")
+
+    moteur = MoteurConsoles()
+    moteur.noms = [table_noms[k] for k in lignes["nom"].tolist()]
+    moteur.index = {nom: i for i, nom in enumerate(moteur.noms)}
+    if len(moteur.index) != n:
+        raise ValueError(f"{chemin} : noms de consoles en double")
+    for colonne, (dtype, _) in COLONNES.items():
+        setattr(moteur, colonne, np.ascontiguousarray(lignes[colonne], dtype=dtype))
+    moteur.groupes = [table_groupes[k] for k in lignes["groupe"].tolist()]
+    moteur.resumes = [None] * n
+    for i in np.flatnonzero(~np.isnan(lignes["resume_debut"])).tolist():
+        moteur.resumes[i] = {
+            "start": float(lignes["resume_debut"][i]),
+            "end": float(lignes["resume_fin"][i]),
+            "duration": float(lignes["resume_duree"][i]),
+        }
+        if "resume_intervalle" in lignes.dtype.names and lignes["resume_intervalle"][i] > 0:
+            moteur.resumes[i]["intervalle"] = int(lignes["resume_intervalle"][i])
+    modifiees = np.flatnonzero(lignes["version"] > 0)
+    versions = dict(zip([moteur.noms[i] for i in modifiees.tolist()], lignes["version"][modifiees].tolist()))
+    return moteur, int(entete["journal_seq"][0]), versions
+
+
+def mettre_a_jour(chemin, moteur, indices, journal_seq, versions):
+    # Réécrit sur place les enregistrements `indices` puis l'en-tête ; les noms (même ordre) et
+    # la liste des groupes doivent être identiques à ceux du fichier. Retourne les octets réécrits.
+    entete, enregistrements = _ouvrir(chemin, mode="r+")
+    if len(enregistrements) != len(moteur):
+        raise ValueError(f"{chemin} : {len(enregistrements)} consoles au lieu de {len(moteur)}")
+    indices = np.asarray(indices, dtype=np.int64)
+    if len(indices):
+        numeros_groupes = {groupe: k + 1 for k, groupe in enumerate(moteur.liste_groupes())}
+        enregistrements[indices] = _enregistrements(moteur, versions, indices, numeros_groupes)
+        enregistrements.flush()  # Enregistrements durables avant l'en-tête
+    entete["journal_seq"] = journal_seq
+    entete.flush()
+    return len(indices) * ENREGISTREMENT.itemsize + ENTETE.itemsize
+
+
+# --- Migration JSON <-> binaire ---
+def importer_json(chemin_json, chemin_binaire):
+    from journal_etat import ecrire_atomique
+    with open(chemin_json) as f:
+        data = json.load(f)
+    moteur = MoteurConsoles.depuis_etat(data)
+    ecrire_atomique(chemin_binaire, encoder(moteur, int(data.get("journal_seq", 0)), data.get("versions", {})))
+    return len(moteur)
+
+
+def exporter_json(chemin_binaire, chemin_json):
+    from journal_etat import ecrire_atomique
+    moteur, journal_seq, versions = lire(chemin_binaire)
+    data = moteur.vers_etat()
+    data["journal_seq"] = journal_seq
+    data["versions"] = versions
+    ecrire_atomique(chemin_json, json.dumps(data, indent=4))
+    return len(moteur)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conversion entre console_data.json et le snapshot binaire")
+    parser.add_argument("sens", choices=["importer", "exporter"], help="importer : JSON -> binaire, exporter : binaire -> JSON")
+    parser.add_argument("json", help="Snapshot JSON (ex: console_data.json)")
+    parser.add_argument("binaire", help="Snapshot binaire (ex: console_data.bin)")
+    args = parser.parse_args()
+    if args.sens == "importer":
+        print(f"{importer_json(args.json, args.binaire)} console(s) importée(s) dans {args.binaire}")
+    else:
+        print(f"{exporter_json(args.binaire, args.json)} console(s) exportée(s) dans {args.json}")
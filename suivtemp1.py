@@ -1,437 +1,665 @@
-import streamlit as st # type: ignore
-import math
-import json
-import os
-from streamlit_autorefresh import st_autorefresh # type: ignore
-from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo  # ✅ Gère le fuseau horaire
-
-# ✅ Fonction pour toujours utiliser le bon fuseau horaire
-def now_local():
-    return datetime.now(ZoneInfo("Indian/Antananarivo"))
-
-# --- Fonctions de Sauvegarde/Chargement ---
-DATA_FILE = "console_data.json"
-
-def save_state():
-    # Crée un dictionnaire contenant l'état actuel à sauvegarder
-    data = {
-        "consoles": st.session_state.consoles,
-        # Convertit les objets datetime en chaînes ISO pour la sérialisation JSON
-        "start_times": {k: v.isoformat() if v else None for k, v in st.session_state.start_times.items()},
-        "paused_elapsed": st.session_state.paused_elapsed,
-        "is_paused": st.session_state.is_paused,
-        "intervals": st.session_state.intervals,
-        "interval_counts": st.session_state.interval_counts,
-        # Convertit les objets datetime en chaînes ISO
-        "session_initial_start": {k: v.isoformat() if v else None for k, v in st.session_state.session_initial_start.items()},
-        # Gère la sérialisation du résumé, y compris les datetimes
-        "last_stop_summary": {
-            k: {
-                "start": v["start"].isoformat(),
-                "end": v["end"].isoformat(),
-                "duration": v["duration"]
-            } if v and isinstance(v, dict) and "start" in v and "end" in v and "duration" in v else None
-            for k, v in st.session_state.last_stop_summary.items()
-        }
-    }
-    # Écrit les données dans le fichier JSON
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4) # Ajout de l'indentation pour la lisibilité
-
-def load_state():
-    # Vérifie si le fichier de données existe
-    if os.path.exists(DATA_FILE):
-        try:
-            # Ouvre et lit le fichier JSON
-            with open(DATA_FILE, "r") as f:
-                data = json.load(f)
-
-            # Charge les données dans st.session_state, avec des valeurs par défaut
-            st.session_state.consoles = data.get("consoles", {})
-            # Reconvertit les chaînes ISO en objets datetime
-            st.session_state.start_times = {
-                k: datetime.fromisoformat(v) if v else None for k, v in data.get("start_times", {}).items()
-            }
-            st.session_state.paused_elapsed = data.get("paused_elapsed", {})
-            st.session_state.is_paused = data.get("is_paused", {})
-            st.session_state.intervals = data.get("intervals", {})
-            st.session_state.interval_counts = data.get("interval_counts", {})
-            # Reconvertit les chaînes ISO en objets datetime
-            st.session_state.session_initial_start = {
-                k: datetime.fromisoformat(v) if v else None for k, v in data.get("session_initial_start", {}).items()
-            }
-            # Reconvertit les données du résumé, y compris les datetimes
-            st.session_state.last_stop_summary = {
-                k: {
-                    "start": datetime.fromisoformat(v["start"]),
-                    "end": datetime.fromisoformat(v["end"]),
-                    "duration": v["duration"]
-                } if v and isinstance(v, dict) and "start" in v and "end" in v and "duration" in v else None
-                for k, v in data.get("last_stop_summary", {}).items()
-            }
-
-            # S'assure que tous les états nécessaires existent pour chaque console chargée
-            # Cela évite les erreurs si de nouveaux états ont été ajoutés au code depuis la dernière sauvegarde
-            loaded_consoles = list(st.session_state.consoles.keys())
-            for console in loaded_consoles:
-                st.session_state.start_times.setdefault(console, None)
-                st.session_state.paused_elapsed.setdefault(console, 0.0)
-                st.session_state.is_paused.setdefault(console, False)
-                st.session_state.intervals.setdefault(console, 30) # Intervalle par défaut (ex: 30 min)
-                st.session_state.interval_counts.setdefault(console, 0)
-                st.session_state.session_initial_start.setdefault(console, None)
-                st.session_state.last_stop_summary.setdefault(console, None)
-
-        except (json.JSONDecodeError, TypeError, KeyError, ValueError) as e:
-             # Affiche une erreur si le chargement échoue (fichier corrompu, format invalide)
-             st.error(f"Erreur lors du chargement des données depuis {DATA_FILE}: {e}. Le fichier pourrait être corrompu ou d'un format ancien. Réinitialisation de l'état.")
-             # Réinitialise à un état vide en cas d'échec
-             initialize_empty_state()
-    else:
-        # Si le fichier n'existe pas, initialise simplement un état vide
-        initialize_empty_state()
-
-
-# --- Fonction d'Initialisation ---
-def initialize_empty_state():
-    # Définit toutes les clés nécessaires dans st.session_state avec des dictionnaires vides
-    st.session_state.consoles = {}
-    st.session_state.start_times = {}
-    st.session_state.paused_elapsed = {}
-    st.session_state.is_paused = {}
-    st.session_state.intervals = {}
-    st.session_state.interval_counts = {}
-    st.session_state.session_initial_start = {}
-    st.session_state.last_stop_summary = {}
-
-# --- Point d'Entrée Principal ---
-# Vérifie si l'état a déjà été initialisé dans cette session Streamlit
-if 'consoles' not in st.session_state:
-    # Si non initialisé, charge l'état depuis le fichier (ou initialise si le fichier n'existe pas / est corrompu)
-    load_state()
-
-# --- Configuration de la Page Streamlit et Auto-Refresh ---
-st.set_page_config(page_title="Suivi des consoles", layout="wide")
-st.title("🎮 Suivi du temps d'utilisation des consoles")
-# Rafraîchit automatiquement la page toutes les 15 secondes pour mettre à jour les timers
-st_autorefresh(interval=15000, limit=None, key="console_refresher")
-
-# --- Formulaire d'Ajout de Console ---
-with st.form("add_console", clear_on_submit=True): # clear_on_submit=True vide le champ après ajout
-    new_console = st.text_input("Nom de la nouvelle console")
-    submitted = st.form_submit_button("Ajouter Console")
-    if submitted and new_console.strip(): # Vérifie que le nom n'est pas vide
-        console_name = new_console.strip()
-        if console_name not in st.session_state.consoles:
-            # Initialise tous les états pour la nouvelle console
-            st.session_state.consoles[console_name] = 0 # Cumul initial à 0
-            st.session_state.start_times[console_name] = None
-            st.session_state.paused_elapsed[console_name] = 0.0
-            st.session_state.is_paused[console_name] = False
-            st.session_state.intervals[console_name] = 30 # Intervalle par défaut
-            st.session_state.interval_counts[console_name] = 0
-            st.session_state.session_initial_start[console_name] = None
-            st.session_state.last_stop_summary[console_name] = None
-            save_state() # Sauvegarde immédiatement après l'ajout
-            st.success(f"Console '{console_name}' ajoutée.")
-            st.rerun() # Rafraîchit pour afficher la nouvelle console
-        else:
-            st.warning(f"La console '{console_name}' existe déjà.")
-    elif submitted:
-        st.warning("Veuillez entrer un nom pour la console.")
-
-st.divider() # Ligne de séparation visuelle
-
-# --- Affichage des Consoles Existantes ---
-if not st.session_state.consoles:
-    st.info("Aucune console ajoutée pour le moment. Utilisez le formulaire ci-dessus pour en ajouter une.")
-else:
-    st.subheader("🕹️ Consoles en suivi")
-    # Crée une copie de la liste des clés pour éviter les problèmes lors de la suppression
-    active_consoles = list(st.session_state.consoles.keys())
-
-    for console in active_consoles:
-        # Vérifie si la console existe toujours (au cas où elle aurait été supprimée dans une itération précédente)
-        if console not in st.session_state.consoles:
-            continue
-
-        # Récupération sûre des états avec .get() pour éviter les KeyError si une clé manque accidentellement
-        total_minutes = st.session_state.consoles.get(console, 0)
-        start = st.session_state.start_times.get(console)
-        paused = st.session_state.paused_elapsed.get(console, 0.0)
-        is_paused = st.session_state.is_paused.get(console, False)
-        interval = st.session_state.intervals.get(console, 30)
-        interval_count_state = st.session_state.interval_counts.get(console, 0)
-        initial = st.session_state.session_initial_start.get(console)
-        summary = st.session_state.last_stop_summary.get(console)
-
-        # --- Affichage du Résumé de la Dernière Session (si disponible) ---
-        if summary:
-            # Utilise un expander pour ne pas prendre trop de place par défaut
-            with st.expander(f"📄 Résumé dernière session : {console}", expanded=False):
-                st.markdown(f"""
-                - **Début :** {summary['start'].strftime('%Y-%m-%d %H:%M:%S')}
-                - **Fin :** {summary['end'].strftime('%Y-%m-%d %H:%M:%S')}
-                - **Durée :** {summary['duration']:.1f} minutes
-                """)
-            # Le résumé reste affiché jusqu'à ce qu'une nouvelle session soit démarrée ou arrêtée
-
-        # --- Section Principale d'Affichage et Contrôles ---
-        col1, col2, col3, col4 = st.columns([3, 1.5, 1.5, 1]) # Ajustement des largeurs des colonnes
-
-        with col1: # Colonne Informations et Statut
-            st.markdown(f"### 🎮 {console}")
-            status = "⚪ Idle" # Statut par défaut
-            now = now_local()
-            running_minutes = 0.0 # Temps écoulé depuis le dernier 'start' ou 'resume'
-
-            if initial: # Si une session a une heure de début initiale enregistrée
-                if start and not is_paused: # Si le timer est actif
-                    running_minutes = (now - start).total_seconds() / 60
-                    status = f"🟢 En cours (démarrée à {initial.strftime('%H:%M:%S')})"
-                elif is_paused: # Si le timer est en pause
-                    # Pas de calcul de running_minutes si en pause
-                    status = f"⏸️ En pause (démarrée à {initial.strftime('%H:%M:%S')})"
-                # Si 'initial' existe mais 'start' est None et not is_paused -> vient d'être stoppé (état transitoire avant rerun)
-            # Si 'initial' est None, la console est inactive (Idle)
-
-            # Calcul du temps total de la session actuelle (temps pausé + temps en cours)
-            total_session_minutes = paused + running_minutes
-            # Calcul du temps global (cumul historique + session actuelle)
-            total_global_minutes = total_minutes + total_session_minutes
-
-            st.markdown(f"**Statut :** {status}")
-            # Affiche le temps de la session en cours
-            st.info(f"⏱️ Session actuelle : **{total_session_minutes:.1f} min**")
-            # Affiche le temps total cumulé
-            st.success(f"💡 Cumul total : **{total_global_minutes:.1f} min**")
-
-        with col2: # Colonne Intervalles
-            # Champ pour modifier la durée de l'intervalle
-            new_interval = st.number_input(
-                "Intervalle (min)",
-                min_value=1,
-                value=interval,
-                step=1,
-                key=f"interval_{console}",
-                help="Durée d'un intervalle en minutes."
-            )
-            # Si l'utilisateur change la valeur de l'intervalle
-            if new_interval != interval:
-                st.session_state.intervals[console] = new_interval
-                interval = new_interval # Met à jour la variable locale pour le calcul immédiat
-                save_state()
-                # Pas besoin de rerun ici, le calcul ci-dessous utilisera la nouvelle valeur
-
-            # Calcul du nombre d'intervalles complétés pendant la session actuelle
-            completed_intervals = math.floor(total_session_minutes / interval) if interval > 0 else 0
-
-            # Met à jour l'état du compteur d'intervalles si nécessaire (utile avec auto-refresh)
-            if completed_intervals != interval_count_state:
-                st.session_state.interval_counts[console] = completed_intervals
-                # Pas de save_state ici, sera sauvé par d'autres actions ou à la fin
-                # Pas de rerun ici pour éviter les boucles avec autorefresh
-
-            # Affiche le nombre d'intervalles complétés
-            st.metric("Intervalles complétés", st.session_state.interval_counts.get(console, 0))
-
-        with col3: # Colonne Boutons Start/Pause/Resume
-             # Affiche "Démarrer" seulement si la console est inactive (Idle)
-             if start is None and not is_paused:
-                 if st.button("▶️ Démarrer", key=f"start_{console}"):
-                     now_start = now_local()
-                     st.session_state.start_times[console] = now_start
-                     st.session_state.session_initial_start[console] = now_start # Heure de début de la session globale
-                     st.session_state.paused_elapsed[console] = 0.0 # Réinitialise le temps pausé
-                     st.session_state.is_paused[console] = False
-                     st.session_state.interval_counts[console] = 0 # Réinitialise les compteurs d'intervalles
-                     # Efface le résumé de la session précédente quand on démarre une nouvelle
-                     st.session_state.last_stop_summary[console] = None
-                     save_state()
-                     st.rerun() # Rafraîchit l'interface
-
-             # Affiche "Pause" seulement si le timer est en cours
-             elif start and not is_paused:
-                 if st.button("⏸️ Pause", key=f"pause_{console}"):
-                     now_pause = now_local()
-                     elapsed_since_last_start = (now_pause - start).total_seconds() / 60
-                     # Ajoute le temps écoulé depuis le dernier start/resume au temps pausé total
-                     st.session_state.paused_elapsed[console] += elapsed_since_last_start
-                     st.session_state.start_times[console] = None # Met start à None pour indiquer la pause
-                     st.session_state.is_paused[console] = True
-                     save_state()
-                     st.rerun()
-
-             # Affiche "Reprendre" seulement si le timer est en pause
-             elif is_paused:
-                 if st.button("▶️ Reprendre", key=f"resume_{console}"):
-                     st.session_state.start_times[console] = now_local() # Redémarre le chrono interne
-                     st.session_state.is_paused[console] = False
-                     save_state()
-                     st.rerun()
-
-        with col4: # Colonne Boutons Stop/Supprimer
-            # Affiche "Stop" si la session est en cours ou en pause
-            if start or is_paused:
-                if st.button("⏹️ Stop", key=f"stop_{console}", type="primary"):
-                    end_time = now_local()
-                    final_session_duration = paused # Commence avec le temps déjà accumulé pendant les pauses
-
-                    if start: # Si le chrono tournait au moment du stop, ajoute le dernier segment de temps actif
-                        final_session_duration += (end_time - start).total_seconds() / 60
-
-                    # Enregistre le résumé de la session qui vient de se terminer (utile pour l'affichage)
-                    initial_start_time = initial if initial else end_time
-                    st.session_state.last_stop_summary[console] = {
-                        "start": initial_start_time,
-                        "end": end_time,
-                        "duration": final_session_duration
-                    }
-
-                    # --- CHANGEMENT PRINCIPAL ICI ---
-                    # Au lieu d'ajouter au cumul, on remet le compteur de cumul à ZÉRO
-                    st.session_state.consoles[console] = 0
-                    # ---------------------------------
-
-                    # Réinitialise les états de suivi de la session pour cette console
-                    st.session_state.start_times[console] = None
-                    st.session_state.paused_elapsed[console] = 0.0
-                    st.session_state.is_paused[console] = False
-                    st.session_state.session_initial_start[console] = None
-                    st.session_state.interval_counts[console] = 0 # Remet aussi le compteur d'intervalles à zéro
-
-                    save_state() # Sauvegarde l'état réinitialisé (avec cumul à 0)
-                    st.rerun() # Rafraîchit l'interface
-
-            # Bouton pour supprimer la console (toujours visible pour une console existante)
-            # ... (le code pour le bouton Supprimer reste inchangé) ...
-            with st.expander("Supprimer"):
-                 st.warning(f"Attention, ceci supprimera la console '{console}' et son historique.")
-                 if st.button("❌ Confirmer la Suppression", key=f"delete_{console}"):
-                     # Supprime la console de tous les dictionnaires d'état
-                     for state_key in [
-                         "consoles", "start_times", "paused_elapsed", "is_paused",
-                         "intervals", "interval_counts", "session_initial_start", "last_stop_summary"
-                     ]:
-                         if console in st.session_state[state_key]:
-                             st.session_state[state_key].pop(console)
-                     save_state()
-                     st.success(f"Console '{console}' supprimée.")
-                     st.rerun() # Rafraîchit pour enlever la console de l'affichage
-
-          
-
-        # --- Section d'Ajustement Manuel ---
-        # Utilise un expander pour ne pas surcharger l'interface principale
-        with st.expander("🔧 Ajustement Manuel (si session démarrée avant l'app)"):
-            # Désactive les contrôles d'ajustement si une session est déjà active (en cours ou en pause)
-            # L'ajustement doit se faire quand la console est 'Idle' dans l'application
-            manual_disabled = start is not None or is_paused
-
-            # Divise en colonnes pour un meilleur alignement date/heure
-            col_date_manual, col_time_manual = st.columns(2)
-            with col_date_manual:
-                # Sélecteur pour la date de début réelle
-                manual_start_date = st.date_input(
-                    "Date de début réelle",
-                    value=now_local().date(), # Défaut à aujourd'hui
-                    key=f"manual_start_date_{console}",
-                    disabled=manual_disabled,
-                    help="Entrez la date à laquelle la session a *vraiment* commencé."
-                )
-            with col_time_manual:
-                # Sélecteur pour l'heure de début réelle
-                 manual_start_time = st.time_input(
-                     "Heure de début réelle",
-                     # Défaut à l'heure actuelle (arrondie à la minute) - l'utilisateur doit changer
-                     value=now_local().time().replace(second=0, microsecond=0),
-                     key=f"manual_start_time_{console}",
-                     disabled=manual_disabled,
-                     step=timedelta(minutes=1), # Permet d'ajuster par minute
-                     help="Entrez l'heure à laquelle la session a *vraiment* commencé."
-                 )
-
-            # Champ pour entrer le nombre d'intervalles déjà complétés
-            manual_intervals = st.number_input(
-                "Intervalles déjà complétés",
-                min_value=0,
-                step=1,
-                value=0, # Défaut à 0
-                key=f"manual_intervals_{console}",
-                disabled=manual_disabled,
-                help="Combien d'intervalles (selon la config actuelle) étaient terminés au moment où vous faites cet ajustement ?"
-            )
-
-            # Bouton pour appliquer l'ajustement manuel
-            if st.button("Appliquer l'ajustement", key=f"apply_manual_{console}", disabled=manual_disabled):
-                # Combine la date et l'heure sélectionnées en un objet datetime
-                try:
-                    if manual_start_date and manual_start_time:
-                        manual_start_dt = datetime.combine(manual_start_date, manual_start_time).replace(tzinfo=ZoneInfo("Indian/Antananarivo"))
-                    else:
-                         st.error("Date ou heure manuelle invalide.")
-                         manual_start_dt = None # Empêche la suite
-
-                    if manual_start_dt: # Si la combinaison a réussi
-                        now_apply = now_local()
-                        # Vérifie que l'heure de début est bien dans le passé
-                        if manual_start_dt >= now_apply:
-                            st.error("L'heure de début manuelle doit être dans le passé.")
-                        else:
-                            # Calcule le temps écoulé entre le début manuel et maintenant (en minutes)
-                            elapsed_manual_minutes = (now_apply - manual_start_dt).total_seconds() / 60
-
-                            # --- Mise à jour de l'état ---
-                            # Heure de début réelle de la session
-                            st.session_state.session_initial_start[console] = manual_start_dt
-                            # Heure à laquelle le *tracking de l'app* commence (maintenant)
-                            st.session_state.start_times[console] = now_apply
-                            # Pré-charge le temps déjà passé comme s'il avait été "pausé"
-                            st.session_state.paused_elapsed[console] = elapsed_manual_minutes
-                             # Applique le nombre d'intervalles manuels
-                            st.session_state.interval_counts[console] = manual_intervals
-                            # S'assure que l'état est actif (pas en pause)
-                            st.session_state.is_paused[console] = False
-
-                            # Efface le résumé précédent, car on commence une nouvelle session (ajustée)
-                            st.session_state.last_stop_summary[console] = None
-
-                            save_state() # Sauvegarde le nouvel état ajusté
-                            st.success(f"Ajustement appliqué pour {console}. Session démarrée à {manual_start_dt.strftime('%Y-%m-%d %H:%M:%S')}, temps actuel {elapsed_manual_minutes:.1f} min, {manual_intervals} intervalles.")
-                            st.rerun() # Rafraîchit l'interface pour refléter l'ajustement
-
-                except Exception as e:
-                    st.error(f"Erreur lors de l'application de l'ajustement : {e}")
-
-        st.divider() # Séparateur visuel entre chaque console
-
-# --- Actions Globales dans la Sidebar ---
-st.sidebar.header("⚠️ Actions Globales")
-
-# Bouton pour forcer la sauvegarde manuelle de l'état actuel
-if st.sidebar.button("💾 Forcer Sauvegarde"):
-     try:
-         save_state()
-         st.sidebar.success("État actuel sauvegardé avec succès.")
-     except Exception as e:
-         st.sidebar.error(f"Erreur lors de la sauvegarde manuelle: {e}")
-
-# Bouton pour réinitialiser toutes les données (avec confirmation)
-st.sidebar.markdown("---") # Séparateur dans la sidebar
-if st.sidebar.button("🔄 Réinitialiser TOUTES les consoles"):
-    # Utilise un expander dans la sidebar pour la confirmation
-    with st.sidebar.expander("Confirmation de Réinitialisation", expanded=True):
-        st.warning("Ceci effacera TOUTES les données sauvegardées (consoles, temps, etc.). Êtes-vous absolument sûr ?")
-        # Bouton de confirmation finale
-        if st.button("OUI, TOUT RÉINITIALISER DÉFINITIVEMENT", key="confirm_reset_all"):
-            initialize_empty_state() # Réinitialise st.session_state
-            # Supprime le fichier de sauvegarde s'il existe
-            if os.path.exists(DATA_FILE):
-                try:
-                    os.remove(DATA_FILE)
-                    st.success("Fichier de données supprimé.")
-                except OSError as e:
-                    st.error(f"Impossible de supprimer le fichier de données ({DATA_FILE}): {e}")
-            st.success("Toutes les données ont été réinitialisées.")
-            st.rerun() # Rafraîchit l'application pour montrer l'état vide
+import streamlit as st # type: ignore
+import io
+import math
+import os
+import numpy as np
+import pandas as pd
+from streamlit_autorefresh import st_autorefresh # type: ignore
+from datetime import datetime, timedelta
+from moteur_timer import FUSEAU, EN_COURS, EN_PAUSE, IDLE, INTERVALLE_DEFAUT, vers_epoch
+from horloge import format_heure, format_horodatage, maintenant, maintenant_local
+from journal_etat import SEUIL_COMPACTION, ErreurChargement
+from etat_partage import ConflitVersion, MagasinEtat
+from historique import DB_FILE, HistoriqueSessions, jour_local
+from planificateur import PlanificateurIntervalles
+from rapports import calculer_rapport, exporter_excel
+from tarifs import TARIFS_FILE, GrilleTarifaire, facturer_historique
+from instrumentation import FICHIER_METRIQUES, INSTRUMENTS
+
+# ✅ Fonction pour toujours utiliser le bon fuseau horaire
+# L'heure vient de l'horloge monotone ancrée (horloge.py) : un changement de l'heure du système
+# ne fausse pas les sessions en cours
+def now_local():
+    return maintenant_local()
+
+# --- Fonctions de Sauvegarde/Chargement ---
+# SUIVTEMP_SNAPSHOT=binaire : snapshot binaire projeté en mémoire (console_data.bin), repris
+# automatiquement depuis console_data.json au premier lancement
+DATA_FILE = "console_data.bin" if os.environ.get("SUIVTEMP_SNAPSHOT") == "binaire" else "console_data.json"
+# "journal" : chaque action est ajoutée au journal, snapshot compacté périodiquement
+# "json" : réécriture complète de DATA_FILE à chaque action (ancien comportement)
+MODE_PERSISTANCE = os.environ.get("SUIVTEMP_PERSISTANCE", "journal")
+# Les actions sont écrites par un thread en arrière-plan, regroupées par fenêtre (en secondes) :
+# aucun clic n'attend le disque. 0 = écriture (et fsync) immédiate à chaque action.
+FENETRE_ECRITURE = float(os.environ.get("SUIVTEMP_FENETRE_ECRITURE", "0.5"))
+
+@st.cache_resource
+def obtenir_historique():
+    # Base SQLite des sessions passées ; SUIVTEMP_SEGMENTS=1 garde aussi chaque segment pause/reprise
+    return HistoriqueSessions(DB_FILE, segments=os.environ.get("SUIVTEMP_SEGMENTS") == "1")
+
+@st.cache_resource
+def obtenir_magasin():
+    # Un seul magasin par processus, partagé par toutes les sessions Streamlit
+    # En mode "json", chaque transaction est immédiatement compactée dans DATA_FILE
+    seuil = 1 if MODE_PERSISTANCE == "json" else SEUIL_COMPACTION
+    magasin = MagasinEtat(DATA_FILE, seuil_compaction=seuil, fenetre_ecriture=FENETRE_ECRITURE)
+    # Chaque Stop (et pause, en option) est archivé dans l'historique
+    magasin.abonner(obtenir_historique().ecouter)
+    return magasin
+
+@st.cache_resource
+def obtenir_grille():
+    # Grille tarifaire (SUIVTEMP_TARIFS, tarifs.json par défaut) ; relancer l'app après modification
+    return GrilleTarifaire.charger(TARIFS_FILE)
+
+@st.cache_resource
+def obtenir_planificateur():
+    # Déclenche chaque fin d'intervalle à l'instant exact, même sans personne devant l'écran
+    # SUIVTEMP_WEBHOOK : URL locale prévenue par un POST JSON (caisse, buzzer...)
+    magasin = obtenir_magasin()
+    planificateur = PlanificateurIntervalles(magasin, webhook=os.environ.get("SUIVTEMP_WEBHOOK"))
+    magasin.abonner(planificateur.ecouter)
+    return planificateur
+
+def save_state():
+    # Compacte l'état partagé dans DATA_FILE (snapshot atomique, journal vidé),
+    # y compris les actions encore en attente d'écriture
+    obtenir_magasin().compacter()
+
+def agir(op, console=None, **params):
+    # Applique une transition à l'état partagé puis la persiste.
+    # La version de la console affichée au rendu précédent sert de garde (compare-and-swap) :
+    # si un autre poste l'a modifiée entre-temps, l'action est annulée et signalée (retourne False).
+    evt = {"op": op, "console": console, "t": maintenant(), **params}
+    # Un ajout ne porte pas de garde : la console n'était pas affichée (ou a été supprimée depuis)
+    attendues = None
+    if op != "ajouter" and console is not None and f"version_vue_{console}" in st.session_state:
+        attendues = {console: st.session_state[f"version_vue_{console}"]}
+    try:
+        obtenir_magasin().appliquer([evt], attendues)
+    except ConflitVersion as e:
+        st.session_state.conflit = f"{e} Action annulée, l'affichage a été mis à jour."
+        return False
+    if op == "supprimer":
+        st.session_state.pop(f"version_vue_{console}", None)
+    return True
+
+def load_state():
+    # Retourne la vue partagée de l'état et les versions de ses consoles, après avoir rattrapé
+    # les écritures des autres processus
+    try:
+        magasin = obtenir_magasin()
+    except ErreurChargement as e:
+        # Le snapshot illisible a été mis de côté : on repart d'un état vide
+        st.error(f"Erreur lors du chargement des données : {e}. Réinitialisation de l'état.")
+        magasin = obtenir_magasin()
+    return magasin.vue()
+
+# --- Affichage Live ---
+# "fragment" : seuls les compteurs de chaque console sont ré-exécutés (st.fragment), le reste de la
+#              page (formulaires, boutons, ajustements, sidebar) n'est reconstruit que sur une action
+# "autorefresh" : toute la page est ré-exécutée toutes les 15 secondes (ancien comportement)
+MODE_LIVE = os.environ.get("SUIVTEMP_LIVE", "fragment" if hasattr(st, "fragment") else "autorefresh")
+RAFRAICHISSEMENT_LIVE = float(os.environ.get("SUIVTEMP_RAFRAICHISSEMENT", "5")) # En secondes
+
+def fragment_periodique(periode):
+    # Transforme la fonction en fragment rafraîchi toutes les `periode` secondes (mode "fragment" uniquement)
+    def decorer(fonction):
+        if MODE_LIVE == "fragment":
+            return st.fragment(run_every=periode)(fonction)
+        return fonction
+    return decorer
+
+fragment_live = fragment_periodique(RAFRAICHISSEMENT_LIVE)
+
+# --- Point d'Entrée Principal ---
+# Chaque exécution lit la vue en mémoire partagée (aucune relecture du fichier JSON)
+debut_execution = INSTRUMENTS.debut() # Mesures actives avec SUIVTEMP_INSTRUMENTATION=1
+with INSTRUMENTS.phase("chargement"):
+    moteur, versions_rendues = load_state()
+    obtenir_planificateur()
+
+def relancer():
+    # st.rerun() interrompt le script avant sa dernière ligne : le temps de l'exécution est compté
+    # avant la relance (ce sont justement les exécutions qui modifient l'état). Les phases ouvertes
+    # avec INSTRUMENTS.phase() se ferment d'elles-mêmes.
+    INSTRUMENTS.fin("execution", debut_execution)
+    st.rerun()
+
+# --- Configuration de la Page Streamlit et Auto-Refresh ---
+st.set_page_config(page_title="Suivi des consoles", layout="wide")
+st.title("🎮 Suivi du temps d'utilisation des consoles")
+if MODE_LIVE == "autorefresh":
+    # Rafraîchit automatiquement la page toutes les 15 secondes pour mettre à jour les timers
+    st_autorefresh(interval=15000, limit=None, key="console_refresher")
+
+def afficher_notifications():
+    # Toast pour chaque intervalle complété (et chaque action abandonnée) depuis le dernier passage
+    # de cette session.
+    # Pas de fragment dédié : appelé à chaque exécution de la page et par les ticks live déjà
+    # existants (compteurs, tableau), sans ré-exécution supplémentaire par session.
+    if "derniere_notification" not in st.session_state:
+        # Nouvelle session : on ne rejoue pas les notifications passées
+        st.session_state.derniere_notification = obtenir_planificateur().numero
+    for notification in obtenir_planificateur().depuis(st.session_state.derniere_notification):
+        st.toast(
+            f"{notification['console']} : intervalle n°{notification['intervalles']} terminé "
+            f"({notification['intervalle_min']} min)", icon="🔔"
+        )
+        st.session_state.derniere_notification = notification["numero"]
+    # Actions différées abandonnées à l'écriture : un autre poste a modifié la console avant
+    if "dernier_abandon" not in st.session_state:
+        st.session_state.dernier_abandon = obtenir_magasin().numero_abandon
+    for abandon in obtenir_magasin().abandons_depuis(st.session_state.dernier_abandon):
+        st.toast(
+            f"Action '{abandon['op']}' sur '{abandon['console']}' annulée : "
+            "la console a été modifiée depuis un autre poste.", icon="⚠️"
+        )
+        st.session_state.dernier_abandon = abandon["numero"]
+
+@fragment_live
+@INSTRUMENTS.chronometrer("compteurs")
+def afficher_compteurs(console, version_rendue):
+    # Statut, temps de session, cumul et intervalles d'une console.
+    # En mode "fragment", seul ce bloc est ré-exécuté à chaque tick ; le calcul groupé est
+    # partagé par toutes les consoles (et toutes les sessions) pour un même tick.
+    afficher_notifications()
+    moteur_live, versions_live, calcul = obtenir_magasin().calculer(maintenant())
+    if moteur_live.index.get(console) is None or versions_live.get(console, 0) != version_rendue:
+        # La console a changé depuis un autre poste : les boutons affichés ne sont plus valides
+        st.rerun()
+    i = moteur_live.index[console]
+    # Lecture directe des colonnes : aucun datetime créé à chaque tick
+    initial = moteur_live.debut_initial[i]
+    statut = moteur_live.statut[i]
+    status = "⚪ Idle" # Statut par défaut
+
+    if not np.isnan(initial): # Si une session a une heure de début initiale enregistrée
+        if statut == EN_COURS: # Si le timer est actif
+            status = f"🟢 En cours (démarrée à {format_heure(initial)})"
+        elif statut == EN_PAUSE: # Si le timer est en pause
+            status = f"⏸️ En pause (démarrée à {format_heure(initial)})"
+    # Si 'initial' est NaN, la console est inactive (Idle)
+
+    st.markdown(f"**Statut :** {status}")
+    # Affiche le temps de la session en cours (temps pausé + temps en cours)
+    st.info(f"⏱️ Session actuelle : **{calcul.session[i]:.1f} min**")
+    # Affiche le temps total cumulé (cumul historique + session actuelle)
+    st.success(f"💡 Cumul total : **{calcul.total[i]:.1f} min**")
+    # Affiche le nombre d'intervalles complétés (mis à jour par le calcul groupé)
+    st.metric("Intervalles complétés", int(calcul.intervalles[i]))
+    # Montant dû, tarifé une fois par tick pour toutes les consoles
+    grille = obtenir_grille()
+    st.markdown(f"💰 Montant : **{grille.formater(grille.montants_live(moteur_live, calcul)[i])}**")
+
+afficher_notifications()
+
+# --- Formulaire d'Ajout de Console ---
+with INSTRUMENTS.phase("formulaire"), st.form("add_console", clear_on_submit=True): # clear_on_submit=True vide le champ après ajout
+    new_console = st.text_input("Nom de la nouvelle console")
+    new_group = st.text_input("Groupe (optionnel)", help="Salle, type de console... pour les actions groupées.")
+    submitted = st.form_submit_button("Ajouter Console")
+    if submitted and new_console.strip(): # Vérifie que le nom n'est pas vide
+        console_name = new_console.strip()
+        if console_name not in moteur:
+            # Ajoute une ligne au moteur (cumul à 0, intervalle par défaut, Idle)
+            agir("ajouter", console_name, groupe=new_group.strip() or None) # Sauvegarde immédiatement après l'ajout
+            st.success(f"Console '{console_name}' ajoutée.")
+            relancer() # Rafraîchit pour afficher la nouvelle console
+        else:
+            st.warning(f"La console '{console_name}' existe déjà.")
+    elif submitted:
+        st.warning("Veuillez entrer un nom pour la console.")
+
+st.divider() # Ligne de séparation visuelle
+
+# --- Panneau de Contrôle d'une Console ---
+def changer_intervalle(console):
+    # Callback du champ intervalle : les compteurs du rendu qui suit utilisent déjà la nouvelle valeur
+    agir("intervalle", console, intervalle=int(st.session_state[f"interval_{console}"]))
+
+def afficher_panneau(console):
+    # Vérifie si la console existe toujours (au cas où elle aurait été supprimée entre-temps)
+    if console not in moteur:
+        return
+
+    # Lecture de la ligne de la console dans le moteur
+    etat = moteur.etat_console(console)
+    start = etat["start"]
+    is_paused = etat["is_paused"]
+    interval = etat["interval"]
+    initial = etat["initial"]
+    summary = etat["summary"]
+
+    # --- Affichage du Résumé de la Dernière Session (si disponible) ---
+    if summary:
+        # Utilise un expander pour ne pas prendre trop de place par défaut
+        with st.expander(f"📄 Résumé dernière session : {console}", expanded=False):
+            st.markdown(f"""
+            - **Début :** {summary['start'].strftime('%Y-%m-%d %H:%M:%S')}
+            - **Fin :** {summary['end'].strftime('%Y-%m-%d %H:%M:%S')}
+            - **Durée :** {summary['duration']:.1f} minutes
+            - **Montant :** {obtenir_grille().formater(obtenir_grille().montant_resume(moteur, console))}
+            """)
+        # Le résumé reste affiché jusqu'à ce qu'une nouvelle session soit démarrée ou arrêtée
+
+    # --- Section Principale d'Affichage et Contrôles ---
+    col1, col2, col3, col4 = st.columns([3, 1.5, 1.5, 1]) # Ajustement des largeurs des colonnes
+
+    with col1: # Colonne Informations et Statut
+        st.markdown(f"### 🎮 {console}")
+        if etat["group"]:
+            st.caption(f"🏷️ {etat['group']}")
+        # Compteurs live (fragment) : seule partie rafraîchie périodiquement
+        afficher_compteurs(console, versions_rendues.get(console, 0))
+
+    with col2: # Colonne Intervalles
+        # Le champ suit l'intervalle partagé : changé depuis un autre poste, par une action groupée
+        # ou refusé après un conflit, il est recréé avec la valeur actuelle (avant sa création uniquement)
+        if st.session_state.get(f"interval_{console}", interval) != interval:
+            st.session_state.pop(f"interval_{console}")
+        # Champ pour modifier la durée de l'intervalle : seule une saisie de l'opérateur
+        # déclenche l'action (callback, exécuté avant le rendu suivant)
+        st.number_input(
+            "Intervalle (min)",
+            min_value=1,
+            value=interval,
+            step=1,
+            key=f"interval_{console}",
+            on_change=changer_intervalle,
+            args=(console,),
+            help="Durée d'un intervalle en minutes."
+        )
+
+    with col3: # Colonne Boutons Start/Pause/Resume
+         # Affiche "Démarrer" seulement si la console est inactive (Idle)
+         if start is None and not is_paused:
+             if st.button("▶️ Démarrer", key=f"start_{console}"):
+                 # Réinitialise temps pausé, compteurs et résumé précédent
+                 agir("demarrer", console)
+                 relancer() # Rafraîchit l'interface
+
+         # Affiche "Pause" seulement si le timer est en cours
+         elif start and not is_paused:
+             if st.button("⏸️ Pause", key=f"pause_{console}"):
+                 # Ajoute le temps écoulé depuis le dernier start/resume au temps pausé total
+                 agir("pause", console)
+                 relancer()
+
+         # Affiche "Reprendre" seulement si le timer est en pause
+         elif is_paused:
+             if st.button("▶️ Reprendre", key=f"resume_{console}"):
+                 agir("reprendre", console) # Redémarre le chrono interne
+                 relancer()
+
+    with col4: # Colonne Boutons Stop/Supprimer
+        # Affiche "Stop" si la session est en cours ou en pause
+        if start or is_paused:
+            if st.button("⏹️ Stop", key=f"stop_{console}", type="primary"):
+                # Enregistre le résumé de la session, remet le cumul à ZÉRO
+                # et réinitialise les états de suivi de la session pour cette console
+                agir("arreter", console) # Sauvegarde l'état réinitialisé (avec cumul à 0)
+                relancer() # Rafraîchit l'interface
+
+        # Bouton pour supprimer la console (toujours visible pour une console existante)
+        # ... (le code pour le bouton Supprimer reste inchangé) ...
+        with st.expander("Supprimer"):
+             st.warning(f"Attention, ceci supprimera la console '{console}' et son historique.")
+             if st.button("❌ Confirmer la Suppression", key=f"delete_{console}"):
+                 # Supprime la ligne de la console dans toutes les colonnes du moteur
+                 agir("supprimer", console)
+                 st.success(f"Console '{console}' supprimée.")
+                 relancer() # Rafraîchit pour enlever la console de l'affichage
+
+
+
+    # --- Section d'Ajustement Manuel ---
+    # Utilise un expander pour ne pas surcharger l'interface principale
+    with INSTRUMENTS.phase("ajustement"), st.expander("🔧 Ajustement Manuel (si session démarrée avant l'app)"):
+        # Désactive les contrôles d'ajustement si une session est déjà active (en cours ou en pause)
+        # L'ajustement doit se faire quand la console est 'Idle' dans l'application
+        manual_disabled = start is not None or is_paused
+
+        # Divise en colonnes pour un meilleur alignement date/heure
+        col_date_manual, col_time_manual = st.columns(2)
+        with col_date_manual:
+            # Sélecteur pour la date de début réelle
+            manual_start_date = st.date_input(
+                "Date de début réelle",
+                value=now_local().date(), # Défaut à aujourd'hui
+                key=f"manual_start_date_{console}",
+                disabled=manual_disabled,
+                help="Entrez la date à laquelle la session a *vraiment* commencé."
+            )
+        with col_time_manual:
+            # Sélecteur pour l'heure de début réelle
+             manual_start_time = st.time_input(
+                 "Heure de début réelle",
+                 # Défaut à l'heure actuelle (arrondie à la minute) - l'utilisateur doit changer
+                 value=now_local().time().replace(second=0, microsecond=0),
+                 key=f"manual_start_time_{console}",
+                 disabled=manual_disabled,
+                 step=timedelta(minutes=1), # Permet d'ajuster par minute
+                 help="Entrez l'heure à laquelle la session a *vraiment* commencé."
+             )
+
+        # Champ pour entrer le nombre d'intervalles déjà complétés
+        manual_intervals = st.number_input(
+            "Intervalles déjà complétés",
+            min_value=0,
+            step=1,
+            value=0, # Défaut à 0
+            key=f"manual_intervals_{console}",
+            disabled=manual_disabled,
+            help="Combien d'intervalles (selon la config actuelle) étaient terminés au moment où vous faites cet ajustement ?"
+        )
+
+        # Bouton pour appliquer l'ajustement manuel
+        if st.button("Appliquer l'ajustement", key=f"apply_manual_{console}", disabled=manual_disabled):
+            # Combine la date et l'heure sélectionnées en un objet datetime
+            try:
+                if manual_start_date and manual_start_time:
+                    manual_start_dt = datetime.combine(manual_start_date, manual_start_time).replace(tzinfo=FUSEAU)
+                else:
+                     st.error("Date ou heure manuelle invalide.")
+                     manual_start_dt = None # Empêche la suite
+
+                if manual_start_dt: # Si la combinaison a réussi
+                    now_apply = now_local()
+                    # Vérifie que l'heure de début est bien dans le passé
+                    if manual_start_dt >= now_apply:
+                        st.error("L'heure de début manuelle doit être dans le passé.")
+                    else:
+                        # Calcule le temps écoulé entre le début manuel et maintenant (en minutes)
+                        elapsed_manual_minutes = (now_apply - manual_start_dt).total_seconds() / 60
+
+                        # --- Mise à jour de l'état ---
+                        # Début réel de la session, tracking de l'app à partir de maintenant,
+                        # temps déjà passé pré-chargé comme s'il avait été "pausé"
+                        agir(
+                            "ajuster", console, t=vers_epoch(now_apply),
+                            debut_reel=vers_epoch(manual_start_dt), intervalles=manual_intervals
+                        ) # Sauvegarde le nouvel état ajusté
+                        st.success(f"Ajustement appliqué pour {console}. Session démarrée à {manual_start_dt.strftime('%Y-%m-%d %H:%M:%S')}, temps actuel {elapsed_manual_minutes:.1f} min, {manual_intervals} intervalles.")
+                        relancer() # Rafraîchit l'interface pour refléter l'ajustement
+
+            except Exception as e:
+                st.error(f"Erreur lors de l'application de l'ajustement : {e}")
+
+    st.divider() # Séparateur visuel entre chaque console
+
+    # Mémorise la version affichée (après les boutons) : au prochain clic sur un bouton
+    # de cette console, elle sert de garde contre les modifications faites depuis un autre poste
+    # (celle de la vue chargée au début du rendu, pas de la vue partagée la plus récente)
+    st.session_state[f"version_vue_{console}"] = versions_rendues.get(console, 0)
+
+# --- Vue Tableau Compacte ---
+# Une seule grille pour toutes les consoles : filtres, tri et pagination sont vectorisés sur les
+# colonnes du moteur, seules les lignes de la page courante sont converties en DataFrame.
+SEUIL_MODE_COMPACT = 20 # Au-delà, le tableau compact est le mode d'affichage par défaut
+LIBELLES_TABLEAU = {EN_COURS: "🟢 En cours", EN_PAUSE: "⏸️ En pause", IDLE: "⚪ Idle"}
+TRIS_TABLEAU = ["Nom", "Groupe", "Statut", "Session (min)", "Cumul (min)", "Intervalles", "Montant"]
+
+@fragment_live
+@INSTRUMENTS.chronometrer("tableau")
+def afficher_tableau():
+    afficher_notifications()
+    moteur_live, _, calcul = obtenir_magasin().calculer(maintenant())
+    montants = obtenir_grille().montants_live(moteur_live, calcul)
+    comptes = np.bincount(moteur_live.statut, minlength=3)
+    st.caption(f"🟢 {comptes[EN_COURS]} en cours · ⏸️ {comptes[EN_PAUSE]} en pause · ⚪ {comptes[IDLE]} inactives"
+               f" · 💰 {obtenir_grille().formater(montants.sum())} en jeu")
+
+    # --- Filtres et tri ---
+    f1, f2, f3, f4 = st.columns([2, 2, 1.5, 1])
+    with f1:
+        statuts = st.multiselect(
+            "Statut", options=list(LIBELLES_TABLEAU), default=list(LIBELLES_TABLEAU),
+            format_func=LIBELLES_TABLEAU.get, key="filtre_statut"
+        )
+    with f2:
+        recherche = st.text_input("Rechercher une console", key="filtre_nom")
+    with f3:
+        tri = st.selectbox("Trier par", TRIS_TABLEAU, key="tri_tableau")
+    with f4:
+        decroissant = st.toggle("Décroissant", key="tri_decroissant")
+
+    noms = np.array(moteur_live.noms, dtype=str)
+    masque = np.isin(moteur_live.statut, statuts)
+    if recherche.strip():
+        masque &= np.char.find(np.char.lower(noms), recherche.strip().lower()) >= 0
+    lignes = np.flatnonzero(masque)
+    cles_tri = {
+        "Nom": noms,
+        "Groupe": np.array([g or "" for g in moteur_live.groupes], dtype=str),
+        "Statut": moteur_live.statut,
+        "Session (min)": calcul.session,
+        "Cumul (min)": calcul.total,
+        "Intervalles": calcul.intervalles,
+        "Montant": montants,
+    }
+    lignes = lignes[np.argsort(cles_tri[tri][lignes], kind="stable")]
+    if decroissant:
+        lignes = lignes[::-1]
+
+    # --- Pagination ---
+    p1, p2 = st.columns([1, 4])
+    with p1:
+        taille_page = st.selectbox("Lignes par page", [25, 50, 100, 200], key="taille_page")
+    nb_pages = max(1, math.ceil(len(lignes) / taille_page))
+    if st.session_state.get("page_tableau", 1) > nb_pages:
+        st.session_state.page_tableau = nb_pages # La liste filtrée a rétréci
+    with p2:
+        page = st.number_input(f"Page (sur {nb_pages})", min_value=1, max_value=nb_pages, step=1, key="page_tableau")
+    page_lignes = lignes[(page - 1) * taille_page: page * taille_page]
+
+    debuts = moteur_live.debut_initial[page_lignes]
+    tableau = pd.DataFrame({
+        "Console": noms[page_lignes],
+        "Groupe": [moteur_live.groupes[k] or "" for k in page_lignes],
+        "Statut": [LIBELLES_TABLEAU[s] for s in moteur_live.statut[page_lignes]],
+        "Démarrée à": ["" if np.isnan(t) else format_heure(t) for t in debuts],
+        "Session (min)": calcul.session[page_lignes].round(1),
+        "Cumul (min)": calcul.total[page_lignes].round(1),
+        "Intervalles": calcul.intervalles[page_lignes],
+        "Intervalle (min)": moteur_live.intervalle[page_lignes],
+        f"Montant ({obtenir_grille().devise})": montants[page_lignes],
+    })
+    st.dataframe(tableau, hide_index=True)
+    st.caption(f"{len(lignes)} console(s) sur {len(noms)} correspondent aux filtres.")
+
+# --- Actions Groupées ---
+# Une action sur une sélection, un groupe ou toutes les consoles : une seule transaction
+# (une ligne de journal, un seul fsync), puis un seul rerun. Fermer une salle de 200 postes = 1 écriture.
+ACTIONS_GROUPEES = {
+    "▶️ Démarrer": "demarrer",
+    "⏸️ Pause": "pause",
+    "▶️ Reprendre": "reprendre",
+    "⏹️ Stop (avec résumé)": "arreter",
+    "⏱️ Changer l'intervalle": "intervalle",
+    "🏷️ Affecter au groupe": "groupe",
+    "🔄 Remettre à zéro (sans archiver)": "remettre_a_zero",
+}
+
+def afficher_actions_groupees():
+    with st.expander("🧰 Actions groupées"):
+        g1, g2 = st.columns(2)
+        with g1:
+            portee = st.radio("Appliquer à", ["Sélection", "Groupe", "Toutes les consoles"], horizontal=True, key="portee_lot")
+            if portee == "Sélection":
+                if "selection_lot" in st.session_state:
+                    st.session_state.selection_lot = [c for c in st.session_state.selection_lot if c in moteur]
+                cibles = st.multiselect("Consoles", options=moteur.noms, key="selection_lot")
+            elif portee == "Groupe":
+                groupe = st.selectbox("Groupe", moteur.liste_groupes(), key="groupe_lot")
+                cibles = moteur.consoles_du_groupe(groupe) if groupe else []
+            else:
+                cibles = list(moteur.noms)
+        with g2:
+            libelle = st.selectbox("Action", list(ACTIONS_GROUPEES), key="action_lot")
+            op = ACTIONS_GROUPEES[libelle]
+            params = {}
+            if op == "intervalle":
+                params["intervalle"] = int(st.number_input(
+                    "Nouvel intervalle (min)", min_value=1, value=INTERVALLE_DEFAUT, step=1, key="intervalle_lot"
+                ))
+            elif op == "groupe":
+                params["groupe"] = st.text_input("Nom du groupe (vide = retirer du groupe)", key="nom_groupe_lot").strip() or None
+            confirme = True
+            if op == "remettre_a_zero":
+                confirme = st.checkbox("Je confirme : les sessions en cours sont effacées sans être archivées", key="confirmer_lot")
+
+        concernees = moteur.eligibles(op, cibles)
+        st.caption(f"{len(concernees)} console(s) concernée(s) sur {len(cibles)} ciblée(s).")
+        if st.button(f"Appliquer : {libelle}", key="appliquer_lot", disabled=not concernees or not confirme, type="primary"):
+            # L'éligibilité est revérifiée sur l'état à jour au moment d'appliquer
+            modifiees = obtenir_magasin().appliquer_lot(op, cibles, maintenant(), **params)
+            st.session_state.resultat_lot = f"{libelle} : {len(modifiees)} console(s) modifiée(s) en une seule écriture."
+            relancer()
+
+# --- Affichage des Consoles Existantes ---
+with INSTRUMENTS.phase("consoles"):
+    # Signale une action refusée parce qu'un autre poste a modifié la console entre-temps
+    if "conflit" in st.session_state:
+        st.warning(st.session_state.pop("conflit"))
+    if "resultat_lot" in st.session_state:
+        st.success(st.session_state.pop("resultat_lot"))
+
+    if not len(moteur):
+        st.info("Aucune console ajoutée pour le moment. Utilisez le formulaire ci-dessus pour en ajouter une.")
+    else:
+        st.subheader("🕹️ Consoles en suivi")
+        afficher_actions_groupees()
+        mode_affichage = st.sidebar.radio(
+            "🖥️ Mode d'affichage",
+            ["Panneaux détaillés", "Tableau compact"],
+            index=1 if len(moteur) > SEUIL_MODE_COMPACT else 0,
+            key="mode_affichage",
+        )
+        if mode_affichage == "Tableau compact":
+            afficher_tableau()
+            # Le panneau de contrôle complet n'est construit que pour les consoles sélectionnées
+            if "consoles_pilotees" in st.session_state:
+                st.session_state.consoles_pilotees = [c for c in st.session_state.consoles_pilotees if c in moteur]
+            active_consoles = st.multiselect("🎛️ Consoles à piloter", options=moteur.noms, key="consoles_pilotees")
+            st.divider()
+        else:
+            # Crée une copie de la liste des clés pour éviter les problèmes lors de la suppression
+            active_consoles = list(moteur.noms)
+
+        for console in active_consoles:
+            with INSTRUMENTS.console(console): # Temps de rendu de chaque panneau
+                afficher_panneau(console)
+
+# --- Historique d'Utilisation ---
+# Lu dans les cumuls journaliers pré-calculés (table cumul_jour), jamais dans les lignes brutes
+with INSTRUMENTS.phase("historique"), st.expander("📊 Historique d'utilisation"):
+    periode = st.selectbox("Période", ["Aujourd'hui", "7 derniers jours", "30 derniers jours", "Tout"], key="periode_historique")
+    jours = {"Aujourd'hui": 0, "7 derniers jours": 6, "30 derniers jours": 29}.get(periode)
+    depuis_jour = None if jours is None else jour_local(maintenant() - jours * 86400)
+    historique = obtenir_historique()
+    par_console = historique.usage_par_console(depuis_jour)
+    if not par_console:
+        st.info("Aucune session terminée sur cette période.")
+    else:
+        h1, h2 = st.columns(2)
+        with h1:
+            st.markdown("**Par console**")
+            st.dataframe(pd.DataFrame(par_console).round({"minutes": 1}), hide_index=True)
+        with h2:
+            st.markdown("**Par jour**")
+            st.dataframe(pd.DataFrame(historique.usage_par_jour(depuis_jour)).round({"minutes": 1}), hide_index=True)
+        console_detail = st.selectbox("Dernières sessions de", [ligne["console"] for ligne in par_console], key="console_historique")
+        dernieres = historique.sessions(console_detail, limite=20)
+        st.dataframe(pd.DataFrame({
+            "Début": [format_horodatage(l["debut"]) for l in dernieres],
+            "Fin": [format_horodatage(l["fin"]) for l in dernieres],
+            "Durée (min)": [round(l["duree"], 1) for l in dernieres],
+            "Intervalles": [l["intervalles"] for l in dernieres],
+        }), hide_index=True)
+
+        # Chiffre d'affaires : les sessions de la période sont retarifées avec la grille actuelle
+        if st.button("💰 Calculer le chiffre d'affaires", key="calculer_ca"):
+            grille = obtenir_grille()
+            facturees = facturer_historique(
+                grille, DB_FILE, depuis_jour,
+                intervalles=dict(zip(moteur.noms, moteur.intervalle.tolist())),
+                groupes=dict(zip(moteur.noms, moteur.groupes)),
+            )
+            par_console_ca = facturees.groupby("console", as_index=False).agg(
+                sessions=("montant", "size"), montant=("montant", "sum")
+            ).sort_values("montant", ascending=False)
+            st.session_state.chiffre_affaires = (periode, grille.formater(facturees["montant"].sum()), par_console_ca)
+        if st.session_state.get("chiffre_affaires", (None,))[0] == periode:
+            _, total_ca, par_console_ca = st.session_state.chiffre_affaires
+            st.metric(f"Chiffre d'affaires ({periode.lower()})", total_ca)
+            st.dataframe(par_console_ca, hide_index=True)
+
+        # Rapport complet de la période (occupation par jour et par heure, pics, sessions) en Excel
+        aujourd_hui = jour_local(maintenant())
+        if st.button("📥 Préparer le rapport Excel", key="preparer_rapport"):
+            sortie = io.BytesIO()
+            rapport = calculer_rapport(DB_FILE, depuis_jour, aujourd_hui, nb_consoles=len(moteur) or None)
+            exporter_excel(sortie, rapport, DB_FILE)
+            st.session_state.rapport_excel = (f"rapport_{depuis_jour or 'debut'}_{aujourd_hui}.xlsx", sortie.getvalue())
+        if "rapport_excel" in st.session_state:
+            nom_fichier, contenu = st.session_state.rapport_excel
+            st.download_button(
+                f"💾 Télécharger {nom_fichier}", contenu, file_name=nom_fichier,
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
+
+# --- Actions Globales dans la Sidebar ---
+with INSTRUMENTS.phase("sidebar"):
+    st.sidebar.header("⚠️ Actions Globales")
+
+    # Bouton pour forcer la sauvegarde manuelle de l'état actuel
+    if st.sidebar.button("💾 Forcer Sauvegarde"):
+         try:
+             save_state()
+             st.sidebar.success("État actuel sauvegardé avec succès.")
+         except Exception as e:
+             st.sidebar.error(f"Erreur lors de la sauvegarde manuelle: {e}")
+
+    # Bouton pour réinitialiser toutes les données (avec confirmation)
+    st.sidebar.markdown("---") # Séparateur dans la sidebar
+    if st.sidebar.button("🔄 Réinitialiser TOUTES les consoles"):
+        # Utilise un expander dans la sidebar pour la confirmation
+        with st.sidebar.expander("Confirmation de Réinitialisation", expanded=True):
+            st.warning("Ceci effacera TOUTES les données sauvegardées (consoles, temps, etc.). Êtes-vous absolument sûr ?")
+            # Bouton de confirmation finale
+            if st.button("OUI, TOUT RÉINITIALISER DÉFINITIVEMENT", key="confirm_reset_all"):
+                # Vide l'état partagé (toutes les sessions) et réécrit un snapshot vide
+                try:
+                    obtenir_magasin().reinitialiser(maintenant())
+                    st.success("Fichier de données réinitialisé.")
+                except OSError as e:
+                    st.error(f"Impossible de réinitialiser le fichier de données ({DATA_FILE}): {e}")
+                st.success("Toutes les données ont été réinitialisées.")
+                relancer() # Rafraîchit l'application pour montrer l'état vide
+
+# --- Panneau de Diagnostic (SUIVTEMP_INSTRUMENTATION=1) ---
+# Temps par phase cumulés sur toutes les sessions du processus, consoles les plus lentes à
+# afficher et volume écrit sur disque. SUIVTEMP_METRIQUES_FICHIER : export texte Prometheus.
+if INSTRUMENTS.actif:
+    with st.sidebar.expander("🩺 Diagnostic"):
+        phases = INSTRUMENTS.resume_phases()
+        if phases:
+            st.dataframe(pd.DataFrame([
+                {"Phase": nom, "Exécutions": n, "Moyenne (ms)": round(total / n * 1000, 1),
+                 "Max (ms)": round(maximum * 1000, 1), "Dernière (ms)": round(dernier * 1000, 1)}
+                for nom, (n, total, maximum, dernier) in phases.items()
+            ]), hide_index=True)
+        lentes = INSTRUMENTS.consoles_lentes(10)
+        if lentes:
+            st.markdown("**Panneaux les plus lents**")
+            st.dataframe(pd.DataFrame([
+                {"Console": nom, "Dernier rendu (ms)": round(stats[3] * 1000, 1)} for nom, stats in lentes
+            ]), hide_index=True)
+        for type_ecriture, (nombre, octets) in INSTRUMENTS.volumes().items():
+            st.caption(f"Écritures {type_ecriture} : {nombre} ({octets / 1024:.1f} Kio)")
+        st.caption(f"Écritures disque sur la dernière minute : {INSTRUMENTS.ecritures_par_minute()}")
+
+INSTRUMENTS.fin("execution", debut_execution)
+INSTRUMENTS.ecrire_fichier(FICHIER_METRIQUES)
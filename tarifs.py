@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from historique import DB_FILE
+from moteur_timer import EN_COURS, EN_PAUSE, FUSEAU
+
+# --- Grille Tarifaire ---
+# Transforme les intervalles facturables en montants, pour toutes les consoles d'un coup.
+# Configuration (tarifs.json, ou le chemin de SUIVTEMP_TARIFS) :
+# {
+#     "devise": "Ar",
+#     "defaut": "standard",                      # Type des consoles non listées (1er type sinon)
+#     "types": {                                 # Une grille par type de console
+#         "standard": {"prix": 1000, "prix_pointe": 1500, "minimum": 500, "arrondi": 100, "unites": "superieur"},
+#         "PS5": {"prix": 2000, "prix_pointe": 3000, "minimum": 1000, "arrondi": 100}
+#     },
+#     "consoles": {"Salon VIP": "PS5"},          # Type par console (sinon son groupe s'il porte le nom d'un type)
+#     "pointe": [{"jours": [4, 5, 6], "debut": "17:00", "fin": "22:00"}]  # 0 = lundi, heure de Madagascar
+# }
+# "unites" : "inferieur" (intervalles complétés, comme le compteur), "superieur" (tout intervalle
+# entamé est dû) ou "proche". Chaque intervalle est facturé au tarif en vigueur à son début,
+# estimé à début de session + k × intervalle (les pauses ne décalent pas l'estimation).
+# Le montant est ensuite porté au minimum de la grille puis arrondi au multiple de "arrondi".
+
+TARIFS_FILE = os.environ.get("SUIVTEMP_TARIFS", "tarifs.json")
+
+GRILLE_DEFAUT = {
+    "devise": "Ar",
+    "types": {"standard": {"prix": 0}},
+    "consoles": {},
+    "pointe": [],
+}
+
+MODES_UNITES = {"inferieur": np.floor, "superieur": np.ceil, "proche": np.round}
+
+# Le fuseau de Madagascar n'a pas d'heure d'été : un décalage fixe suffit pour les calculs vectorisés
+DECALAGE = FUSEAU.utcoffset(datetime(2000, 1, 1)).total_seconds()
+
+
+def _minutes_du_jour(texte):
+    heures, minutes = texte.split(":")
+    return int(heures) * 60 + int(minutes)
+
+
+class GrilleTarifaire:
+    def __init__(self, config=None):
+        config = {**GRILLE_DEFAUT, **(config or {})}
+        self.devise = config["devise"]
+        self.noms_types = list(config["types"])
+        if not self.noms_types:
+            raise ValueError("La grille tarifaire doit définir au moins un type de console.")
+        self.types_consoles = dict(config.get("consoles", {}))
+        for nom_type in [config.get("defaut", self.noms_types[0]), *self.types_consoles.values()]:
+            if nom_type not in config["types"]:
+                raise ValueError(f"Type de console inconnu dans la grille : {nom_type}")
+        self.type_defaut = self.noms_types.index(config.get("defaut", self.noms_types[0]))
+        # Une colonne par paramètre, indexée par numéro de type
+        grilles = [config["types"][nom] for nom in self.noms_types]
+        self.prix = np.array([float(g["prix"]) for g in grilles])
+        self.prix_pointe = np.array([float(g.get("prix_pointe", g["prix"])) for g in grilles])
+        self.minimum = np.array([float(g.get("minimum", 0)) for g in grilles])
+        self.arrondi = np.array([float(g.get("arrondi", 1)) or 1.0 for g in grilles])
+        self.unites = [g.get("unites", "inferieur") for g in grilles]
+        for mode in self.unites:
+            if mode not in MODES_UNITES:
+                raise ValueError(f"Mode d'unités inconnu : {mode} (attendu : {', '.join(MODES_UNITES)})")
+        self.pointe = [
+            (set(p.get("jours", range(7))), _minutes_du_jour(p["debut"]), _minutes_du_jour(p["fin"]))
+            for p in config.get("pointe", [])
+        ]
+        # Sans heures de pointe (ou à prix égal), inutile de dater chaque intervalle
+        self.tarif_unique = not self.pointe or bool(np.all(self.prix == self.prix_pointe))
+        # Caches remplacés d'un bloc (tuple) : les sessions Streamlit les lisent depuis plusieurs threads
+        self._cache_types = (None, None)
+        self._cache_live = (None, None)
+
+    @classmethod
+    def charger(cls, chemin=TARIFS_FILE):
+        if not os.path.exists(chemin):
+            return cls()
+        with open(chemin) as f:
+            return cls(json.load(f))
+
+    # --- Types de console ---
+    def type_console(self, nom, groupe=None):
+        nom_type = self.types_consoles.get(nom)
+        if nom_type is None and groupe in self.noms_types:
+            nom_type = groupe
+        return self.type_defaut if nom_type is None else self.noms_types.index(nom_type)
+
+    def types(self, moteur):
+        # Numéro de type de chaque console, recalculé seulement quand la vue partagée change
+        vue, types = self._cache_types
+        if vue is not moteur:
+            types = np.array([self.type_console(n, g) for n, g in zip(moteur.noms, moteur.groupes)], dtype=np.int64)
+            self._cache_types = (moteur, types)
+        return types
+
+    # --- Calcul vectorisé ---
+    def _en_pointe(self, instants):
+        locales = instants + DECALAGE
+        jours = ((locales // 86400).astype(np.int64) + 3) % 7  # Le 01/01/1970 était un jeudi
+        minutes = (locales % 86400) / 60
+        pointe = np.zeros(instants.shape, dtype=bool)
+        for jours_pointe, debut, fin in self.pointe:
+            du_jour = np.isin(jours, list(jours_pointe))
+            if debut <= fin:
+                pointe |= du_jour & (minutes >= debut) & (minutes < fin)
+            else:  # Fenêtre qui passe minuit (ex: 22:00 -> 02:00)
+                pointe |= du_jour & ((minutes >= debut) | (minutes < fin))
+        return pointe
+
+    def facturer(self, types, debuts, minutes, intervalles):
+        # Montant de chaque session : types (numéros), debuts (epoch), minutes de jeu et
+        # intervalle (min) sont des tableaux alignés. Une session sans minute ne coûte rien.
+        types = np.asarray(types, dtype=np.int64)
+        minutes = np.asarray(minutes, dtype=np.float64)
+        intervalles = np.maximum(np.asarray(intervalles, dtype=np.float64), 1)
+        unites = np.zeros(len(types))
+        for numero, mode in enumerate(self.unites):
+            du_type = types == numero
+            unites[du_type] = MODES_UNITES[mode](minutes[du_type] / intervalles[du_type])
+        if self.tarif_unique:
+            brut = unites * self.prix[types]
+        else:
+            # Une colonne par rang d'intervalle, remplie pour les sessions qui l'ont atteint
+            brut = np.zeros(len(types))
+            debuts = np.asarray(debuts, dtype=np.float64)
+            for k in range(int(unites.max()) if len(unites) else 0):
+                atteint = unites > k
+                pointe = self._en_pointe(debuts[atteint] + k * intervalles[atteint] * 60)
+                brut[atteint] += np.where(pointe, self.prix_pointe[types[atteint]], self.prix[types[atteint]])
+        montants = np.where(minutes > 0, np.maximum(brut, self.minimum[types]), 0.0)
+        arrondi = self.arrondi[types]
+        return np.floor(montants / arrondi + 0.5) * arrondi
+
+    def montants_live(self, moteur, calcul):
+        # Montant dû pour la session en cours de chaque console (0 si inactive). Le calcul groupé
+        # étant partagé par tous les fragments d'un même tick, les montants le sont aussi.
+        source, montants = self._cache_live
+        if source is not calcul:
+            actives = (moteur.statut == EN_COURS) | (moteur.statut == EN_PAUSE)
+            montants = np.zeros(len(moteur))
+            if actives.any():
+                montants[actives] = self.facturer(
+                    self.types(moteur)[actives], moteur.debut_initial[actives],
+                    calcul.session[actives], moteur.intervalle[actives],
+                )
+            self._cache_live = (calcul, montants)
+        return montants
+
+    def montant_resume(self, moteur, nom):
+        # Montant de la dernière session arrêtée (résumé conservé par le moteur), ou None
+        i = moteur.index[nom]
+        resume = moteur.resumes[i]
+        if resume is None:
+            return None
+        # Intervalle conservé à l'arrêt (l'intervalle actuel pour les résumés plus anciens)
+        intervalle = resume.get("intervalle", moteur.intervalle[i])
+        return float(self.facturer([self.types(moteur)[i]], [resume["start"]], [resume["duration"]], [intervalle])[0])
+
+    def formater(self, montant):
+        return f"{montant:,.0f} {self.devise}".replace(",", " ")
+
+
+# --- Refacturation de l'historique ---
+def facturer_historique(grille, chemin_db=DB_FILE, depuis_jour=None, jusqu_au_jour=None,
+                        intervalles=None, groupes=None, taille_bloc=None):
+    # Recalcule le montant de chaque session archivée avec la grille actuelle, bloc par bloc.
+    # Chaque session est tarifée avec l'intervalle et le groupe enregistrés à son arrêt ;
+    # `intervalles` / `groupes` ({console: valeur}) ne servent qu'aux lignes plus anciennes.
+    from moteur_timer import INTERVALLE_DEFAUT
+    from rapports import TAILLE_BLOC, _heure_locale, lire_sessions
+
+    intervalles = intervalles or {}
+    groupes = groupes or {}
+    blocs = []
+    for bloc in lire_sessions(chemin_db, depuis_jour, jusqu_au_jour, taille_bloc or TAILLE_BLOC):
+        consoles = bloc["console"].to_numpy()
+        anciennes = bloc["duree_intervalle"].isna().to_numpy()
+        pas = bloc["duree_intervalle"].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+        pas[anciennes] = [intervalles.get(c, INTERVALLE_DEFAUT) for c in consoles[anciennes]]
+        groupes_bloc = bloc["groupe"].to_numpy(dtype=object, copy=True)
+        groupes_bloc[anciennes] = [groupes.get(c) for c in consoles[anciennes]]
+        # Un type par couple (console, groupe) distinct du bloc
+        codes, couples = pd.MultiIndex.from_arrays([consoles, pd.Series(groupes_bloc).fillna("")]).factorize()
+        types = np.array([grille.type_console(c, g or None) for c, g in couples], dtype=np.int64)[codes]
+        blocs.append(pd.DataFrame({
+            "console": consoles,
+            "jour": _heure_locale(bloc["debut"]).strftime("%Y-%m-%d"),
+            "type": np.array(grille.noms_types, dtype=object)[types],
+            "duree_min": bloc["duree"].to_numpy(),
+            "montant": grille.facturer(types, bloc["debut"].to_numpy(), bloc["duree"].to_numpy(), pas),
+        }))
+    if not blocs:
+        return pd.DataFrame(columns=["console", "jour", "type", "duree_min", "montant"])
+    return pd.concat(blocs, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chiffre d'affaires des sessions archivées avec la grille actuelle")
+    parser.add_argument("--tarifs", default=TARIFS_FILE)
+    parser.add_argument("--historique", default=DB_FILE)
+    parser.add_argument("--depuis", help="Premier jour inclus (AAAA-MM-JJ)")
+    parser.add_argument("--jusqu-au", dest="jusqu_au", help="Dernier jour inclus (AAAA-MM-JJ)")
+    args = parser.parse_args()
+    grille = GrilleTarifaire.charger(args.tarifs)
+    sessions = facturer_historique(grille, args.historique, args.depuis, args.jusqu_au)
+    if sessions.empty:
+        print("Aucune session sur cette période.")
+    else:
+        print(sessions.groupby("console")["montant"].agg(["count", "sum"]).sort_values("sum", ascending=False).to_string())
+        print(f"Total : {grille.formater(sessions['montant'].sum())}")
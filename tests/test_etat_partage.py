@@ -0,0 +1,59 @@
+import json
+import sqlite3
+
+from etat_partage import MagasinEtat
+from historique import HistoriqueSessions
+
+
+# --- Écriture différée et rejeu (deux processus sur les mêmes fichiers) ---
+def ouvrir(tmp_path, fenetre_ecriture=0.0):
+    # Un magasin et son historique, comme l'interface (fenêtre > 0) ou l'API (écriture immédiate)
+    magasin = MagasinEtat(str(tmp_path / "etat.json"), fenetre_ecriture=fenetre_ecriture)
+    historique = HistoriqueSessions(str(tmp_path / "historique.db"))
+    magasin.abonner(historique.ecouter)
+    return magasin, historique
+
+
+def lire_journal(tmp_path):
+    with open(tmp_path / "etat.journal") as f:
+        return [json.loads(ligne) for ligne in f]
+
+
+def test_arret_abandonne_au_rejeu_non_archive(tmp_path):
+    # Fenêtre longue : seul l'appel explicite à vider() écrit les transactions de l'interface
+    interface, historique_interface = ouvrir(tmp_path, fenetre_ecriture=3600)
+    api, historique_api = ouvrir(tmp_path)
+    api.appliquer([{"op": "ajouter", "console": "c1", "t": 1000.0, "intervalle": 30}])
+    api.appliquer([{"op": "demarrer", "console": "c1", "t": 1000.0}])
+    interface.vue()
+
+    # Les deux postes arrêtent c1 : l'interface met son arrêt en attente, l'API écrit le sien avant
+    interface.appliquer([{"op": "arreter", "console": "c1", "t": 1600.0}])
+    api.appliquer([{"op": "arreter", "console": "c1", "t": 1600.0}])
+    interface.vider()
+
+    arrets = [evt for ligne in lire_journal(tmp_path) for evt in ligne["evts"] if evt["op"] == "arreter"]
+    assert len(arrets) == 1
+    with sqlite3.connect(tmp_path / "historique.db") as connexion:
+        sessions = connexion.execute("SELECT duree FROM sessions WHERE console = 'c1' AND type = 'session'").fetchall()
+    assert sessions == [(10.0,)]
+    assert [(a["op"], a["console"]) for a in interface.abandons_depuis(0)] == [("arreter", "c1")]
+    historique_interface.fermer()
+    historique_api.fermer()
+
+
+def test_transactions_differees_renumerotees_apres_un_autre_processus(tmp_path):
+    interface, historique_interface = ouvrir(tmp_path, fenetre_ecriture=3600)
+    api, historique_api = ouvrir(tmp_path)
+    interface.appliquer([{"op": "ajouter", "console": "a1", "t": 1000.0, "intervalle": 30}])
+    api.appliquer([{"op": "ajouter", "console": "b1", "t": 1001.0, "intervalle": 30}])
+    interface.appliquer([{"op": "demarrer", "console": "a1", "t": 1002.0}])
+    interface.vider()
+
+    assert [ligne["seq"] for ligne in lire_journal(tmp_path)] == [1, 2, 3]
+    relu = MagasinEtat(str(tmp_path / "etat.json"))
+    assert relu.moteur.vers_etat() == interface.moteur.vers_etat()
+    assert relu.journal.versions == interface.journal.versions == {"b1": 1, "a1": 3}
+    assert interface.abandons_depuis(0) == []
+    historique_interface.fermer()
+    historique_api.fermer()
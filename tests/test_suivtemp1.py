@@ -0,0 +1,64 @@
+import os
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "suivtemp1.py")
+
+
+# --- Sessions Streamlit simulées (AppTest) sur un état partagé neuf ---
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    # Fichiers de données dans un dossier temporaire ; magasin, historique et planificateur recréés
+    monkeypatch.chdir(tmp_path)
+    st.cache_resource.clear()
+
+    def ouvrir():
+        return AppTest.from_file(SCRIPT, default_timeout=30).run()
+    yield ouvrir
+    st.cache_resource.clear()
+
+
+def ajouter(at, *consoles):
+    for console in consoles:
+        at.text_input[0].input(console)
+        at.button[0].click()
+        at.run()
+
+
+def conflits(at):
+    return [w.value for w in at.warning if "modifiée entre-temps" in w.value]
+
+
+def test_intervalle_change_depuis_un_autre_poste(session):
+    a = session()
+    ajouter(a, "sda")
+    b = session()
+    assert b.number_input(key="interval_sda").value == 30
+
+    a.number_input(key="interval_sda").set_value(7).run()
+    assert a.number_input(key="interval_sda").value == 7
+    assert conflits(a) == []
+
+    # B n'a rien saisi : son champ suit l'intervalle partagé, sans action ni conflit
+    b.run()
+    assert b.number_input(key="interval_sda").value == 7
+    b.run()
+    assert b.number_input(key="interval_sda").value == 7
+    assert conflits(b) == []
+
+
+def test_intervalle_change_par_action_groupee(session):
+    at = session()
+    ajouter(at, "p1", "p2")
+    at.selectbox(key="action_lot").set_value("⏱️ Changer l'intervalle").run()
+    at.radio(key="portee_lot").set_value("Toutes les consoles").run()
+    at.number_input(key="intervalle_lot").set_value(12).run()
+    at.button(key="appliquer_lot").click().run()
+
+    assert any("Changer l'intervalle : 2 console(s)" in s.value for s in at.success)
+    assert [at.number_input(key=f"interval_{c}").value for c in ("p1", "p2")] == [12, 12]
+    at.run()
+    assert [at.number_input(key=f"interval_{c}").value for c in ("p1", "p2")] == [12, 12]
+    assert conflits(at) == []